@@ -0,0 +1,203 @@
+"""
+Chunked, parallel Pearson correlation and correlation-based pruning.
+
+Instead of df.corr() on the whole frame, each chunk contributes
+sufficient statistics, accumulated in float64:
+- pairwise row counts
+- sums and sums of squares
+- cross-products
+
+Missing values are handled pairwise, as df.corr() does. Values are
+shifted by a per-column reference taken from the first chunk, which
+keeps the sums well conditioned for large-magnitude columns such as
+byte counts. Chunks are reduced on a thread pool (the matrix products
+release the GIL) with a bounded number in flight. Memory is therefore
+a few chunks plus four p x p matrices, whatever the number of rows.
+
+The drop rule is the one withoutComments.py used: in column order, a
+column is dropped if its absolute correlation with any earlier column
+exceeds the threshold. The drop list is written to JSON for the
+training script and serving code to read.
+
+    python correlation.py [--csv cleaned.csv] [--threshold 0.9] [--out correlated_features.json]
+"""
+from typing import Iterable, List, Optional, Sequence, Union
+from concurrent.futures import ThreadPoolExecutor
+import argparse, json, os, sys, time
+import numpy as np
+import pandas as pd
+
+DEFAULT_THRESHOLD = 0.9
+DROP_LIST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "correlated_features.json")
+
+
+def numeric_frame(frame: pd.DataFrame, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """The numeric and bool columns of `frame`, or exactly `columns` if given."""
+    if columns is None:
+        return frame.select_dtypes(include=[np.number, "bool"])
+    return frame[list(columns)]
+
+
+def _chunk_stats(X: np.ndarray, shift: np.ndarray):
+    """(pair counts, pairwise sums, pairwise sums of squares, cross-products) for one block."""
+    X = X - shift
+    present = ~np.isnan(X)
+    if present.all():
+        n = np.full((X.shape[1], X.shape[1]), float(X.shape[0]))
+        sums = np.broadcast_to(X.sum(axis=0)[:, None], n.shape).copy()
+        squares = np.broadcast_to((X * X).sum(axis=0)[:, None], n.shape).copy()
+        return n, sums, squares, X.T @ X
+    M = present.astype(np.float64)
+    Z = np.where(present, X, 0.0)
+    # Entry [i, j] only counts rows where both column i and column j are present
+    return M.T @ M, Z.T @ M, (Z * Z).T @ M, Z.T @ Z
+
+
+class CorrelationAccumulator:
+    def __init__(self, columns: Sequence[str], shift: np.ndarray):
+        p = len(columns)
+        self.columns = list(columns)
+        self.shift = np.asarray(shift, dtype=np.float64)
+        self.n = np.zeros((p, p))
+        self.sums = np.zeros((p, p))
+        self.squares = np.zeros((p, p))
+        self.cross = np.zeros((p, p))
+        self.rows = 0
+
+    @classmethod
+    def for_block(cls, columns: Sequence[str], X: np.ndarray) -> "CorrelationAccumulator":
+        """Empty accumulator whose shift is taken from the first block's column means."""
+        with np.errstate(invalid="ignore"):
+            shift = np.nan_to_num(np.nanmean(X, axis=0)) if len(X) else np.zeros(X.shape[1])
+        return cls(columns, shift)
+
+    def update(self, X: np.ndarray):
+        """Accumulate one (rows, columns) float64 block in this thread."""
+        self.add(_chunk_stats(X, self.shift), len(X))
+
+    def add(self, stats, rows: int):
+        n, sums, squares, cross = stats
+        self.n += n
+        self.sums += sums
+        self.squares += squares
+        self.cross += cross
+        self.rows += rows
+
+    def merge(self, other: "CorrelationAccumulator") -> "CorrelationAccumulator":
+        if other.columns != self.columns or not np.array_equal(other.shift, self.shift, equal_nan=True):
+            raise ValueError("can only merge accumulators with the same columns and shift")
+        self.add((other.n, other.sums, other.squares, other.cross), other.rows)
+        return self
+
+    def matrix(self) -> pd.DataFrame:
+        n, s, ss, c = self.n, self.sums, self.squares, self.cross
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = n * c - s * s.T
+            var_i = n * ss - s * s
+            var = var_i * var_i.T
+            corr = cov / np.sqrt(var)
+        corr[(n < 2) | ~(var > 0)] = np.nan
+        corr = np.clip(corr, -1.0, 1.0)
+        diag = np.diag(var_i) > 0
+        corr[np.diag_indices_from(corr)] = np.where(diag, 1.0, np.nan)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+
+def iter_blocks(source: Union[pd.DataFrame, Iterable[pd.DataFrame]], chunksize: int):
+    """Row blocks of a frame, or the chunks of an iterable as they come."""
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunksize):
+            yield source.iloc[start:start + chunksize]
+    else:
+        yield from source
+
+
+def correlation_matrix(source: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+                       columns: Optional[Sequence[str]] = None, chunksize: int = 100_000,
+                       workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Pearson correlation of the numeric (and bool) columns of a frame or a
+    stream of chunks, matching df.corr() up to float rounding.
+    """
+    workers = max(1, workers or min(8, os.cpu_count() or 1))
+    acc: Optional[CorrelationAccumulator] = None
+    pending: List = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="corr") as pool:
+        for chunk in iter_blocks(source, chunksize):
+            numeric = numeric_frame(chunk, columns if columns is not None else (acc.columns if acc else None))
+            X = numeric.to_numpy(dtype=np.float64)
+            if acc is None:
+                acc = CorrelationAccumulator.for_block(numeric.columns.tolist(), X)
+            pending.append((pool.submit(_chunk_stats, X, acc.shift), len(X)))
+            # Bound memory: at most two chunks per worker in flight
+            while len(pending) >= 2 * workers:
+                fut, rows = pending.pop(0)
+                acc.add(fut.result(), rows)
+        for fut, rows in pending:
+            acc.add(fut.result(), rows)
+    if acc is None:
+        return pd.DataFrame(dtype=np.float64)
+    corr = acc.matrix()
+    corr.attrs["rows"] = acc.rows
+    return corr
+
+
+def correlated_features(corr: pd.DataFrame, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Columns whose |corr| with any earlier column is above `threshold`, in column order."""
+    upper = np.triu(np.abs(corr.to_numpy()), k=1)
+    # NaN (constant columns) never exceeds the threshold
+    flagged = (np.nan_to_num(upper, nan=0.0) > threshold).any(axis=0)
+    return [col for col, drop in zip(corr.columns, flagged) if drop]
+
+
+def save_drop_list(corr: pd.DataFrame, drop: List[str], threshold: float,
+                   path: str = DROP_LIST_FILE):
+    absolute = np.abs(np.triu(corr.to_numpy(), k=1))
+    i, j = np.nonzero(np.nan_to_num(absolute) > threshold)
+    pairs = sorted(((corr.columns[a], corr.columns[b], float(corr.iat[a, b])) for a, b in zip(i, j)),
+                   key=lambda p: -abs(p[2]))
+    payload = {
+        "threshold": threshold,
+        "rows": corr.attrs.get("rows"),
+        "columns": corr.columns.tolist(),
+        "drop": drop,
+        "pairs": [{"kept": a, "dropped": b, "corr": r} for a, b, r in pairs],
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(payload, f, indent=1)
+    os.replace(tmp, path)
+
+
+def load_drop_list(path: str = DROP_LIST_FILE) -> List[str]:
+    with open(path) as f:
+        return json.load(f)["drop"]
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Correlation-based feature pruning in bounded memory")
+    parser.add_argument("--csv", help="numeric CSV to stream (default: the deduplicated raw dataset)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default=DROP_LIST_FILE)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.csv:
+        chunks = pd.read_csv(args.csv, chunksize=args.chunksize)
+    else:
+        from ingest import CACHE_DIR, DATA_DIR
+        from dedup import StreamingDeduper
+        from preprocess import prepared_chunks
+        chunks = prepared_chunks(DATA_DIR, CACHE_DIR, args.chunksize, StreamingDeduper())
+    corr = correlation_matrix(chunks, chunksize=args.chunksize, workers=args.workers)
+    drop = correlated_features(corr, args.threshold)
+    save_drop_list(corr, drop, args.threshold, args.out)
+    print(f"✔ {len(corr.columns)} columns in {time.perf_counter() - started:.2f}s; "
+          f"dropping {len(drop)} above |r| > {args.threshold}: {drop} -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
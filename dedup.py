@@ -0,0 +1,176 @@
+"""
+Hash-based streaming deduplication.
+
+Each row is fingerprinted with a 64-bit hash of its normalized values:
+- numbers as float64, with -0.0 folded into 0.0 and a single NaN
+- categoricals and strings by value
+
+So the same row hashes the same whether it came from a CSV chunk (float
+columns, object strings) or from the column cache (int64, categorical
+codes). Seen fingerprints are kept in one sorted uint64 array (8 bytes
+per unique row) instead of comparing full rows. Chunks are deduplicated
+against everything before them as they stream in, keeping the first
+occurrence, as drop_duplicates() does.
+
+With verify=True the deduper also remembers which earlier row each
+dropped row matched. verify() then re-streams the data and compares
+those pairs value by value, so hash collisions are detected rather than
+assumed away. Memory for this is proportional to the number of
+duplicates.
+
+    python dedup.py [--verify]
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import argparse, sys, time
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+
+def _normalized(frame: pd.DataFrame) -> pd.DataFrame:
+    cols = {}
+    for col in frame.columns:
+        s = frame[col]
+        if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+            values = s.to_numpy(dtype=np.float64) + 0.0
+            cols[col] = np.where(np.isnan(values), np.nan, values)
+        else:
+            cols[col] = s.to_numpy(dtype=object)
+    return pd.DataFrame(cols)
+
+
+def row_hashes(frame: pd.DataFrame) -> np.ndarray:
+    """64-bit fingerprint of every row's normalized values."""
+    if not len(frame):
+        return np.empty(0, dtype=np.uint64)
+    return hash_pandas_object(_normalized(frame), index=False).to_numpy()
+
+
+class StreamingDeduper:
+    def __init__(self, verify: bool = False):
+        self.verify_enabled = verify
+        self._seen = np.empty(0, dtype=np.uint64)
+        # Global row id of the kept row for each seen hash (verify mode)
+        self._seen_ids = np.empty(0, dtype=np.int64)
+        self._pairs: List[np.ndarray] = []
+        self.rows = 0
+        self.shards: Dict[str, Dict[str, int]] = {}
+
+    def filter(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Rows of `chunk` not seen before (in this chunk or any earlier one)."""
+        base = self.rows
+        self.rows += len(chunk)
+        shard = self.shards.setdefault(str(chunk.attrs.get("source")), {"rows": 0, "duplicates": 0})
+        shard["rows"] += len(chunk)
+        if not len(chunk):
+            return chunk
+
+        hashes = row_hashes(chunk)
+        uniq, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        pos = np.searchsorted(self._seen, uniq)
+        in_seen = np.zeros(len(uniq), dtype=bool)
+        valid = pos < len(self._seen)
+        in_seen[valid] = self._seen[pos[valid]] == uniq[valid]
+
+        keep = np.zeros(len(chunk), dtype=bool)
+        keep[first[~in_seen]] = True
+        shard["duplicates"] += int(len(chunk) - keep.sum())
+
+        if self.verify_enabled and not keep.all():
+            # Row id each dropped row is assumed equal to
+            kept_ids = base + first
+            kept_ids[in_seen] = self._seen_ids[pos[in_seen]]
+            dropped = np.flatnonzero(~keep)
+            self._pairs.append(np.column_stack((base + dropped, kept_ids[inverse[dropped]])))
+
+        new = uniq[~in_seen]
+        if len(new):
+            merged = np.concatenate((self._seen, new))
+            order = np.argsort(merged, kind="stable")
+            self._seen = merged[order]
+            if self.verify_enabled:
+                self._seen_ids = np.concatenate((self._seen_ids, base + first[~in_seen]))[order]
+        return chunk[keep]
+
+    @property
+    def duplicates(self) -> int:
+        return sum(s["duplicates"] for s in self.shards.values())
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "unique": int(len(self._seen)),
+            "duplicates": self.duplicates,
+            "hash_set_bytes": int(self._seen.nbytes + self._seen_ids.nbytes),
+            "shards": self.shards,
+        }
+
+    def verify(self, chunks: Iterable[pd.DataFrame]) -> Dict[str, Any]:
+        """
+        Re-stream the same data and compare every dropped row with the row
+        it was matched to. Returns the number of pairs checked and the
+        hash collisions (pairs that are not actually equal).
+        """
+        if not self.verify_enabled:
+            raise RuntimeError("StreamingDeduper was created without verify=True")
+        pairs = np.concatenate(self._pairs) if self._pairs else np.empty((0, 2), dtype=np.int64)
+        needed = np.unique(pairs.ravel())
+        rows: Dict[int, tuple] = {}
+        base = 0
+        for chunk in chunks:
+            lo, hi = np.searchsorted(needed, [base, base + len(chunk)])
+            if hi > lo:
+                local = needed[lo:hi] - base
+                part = _normalized(chunk.iloc[local])
+                for rid, values in zip(needed[lo:hi].tolist(), part.itertuples(index=False, name=None)):
+                    rows[rid] = values
+            base += len(chunk)
+
+        def same(a: tuple, b: tuple) -> bool:
+            return all(x == y or (x != x and y != y) for x, y in zip(a, b))
+
+        collisions = [(int(d), int(k)) for d, k in pairs.tolist() if not same(rows[d], rows[k])]
+        return {"checked": int(len(pairs)), "collisions": len(collisions), "collision_rows": collisions[:20]}
+
+
+def dedup_chunks(chunks: Iterable[pd.DataFrame], deduper: StreamingDeduper) -> Iterator[pd.DataFrame]:
+    for chunk in chunks:
+        yield deduper.filter(chunk)
+
+
+def duplicate_mask(df: pd.DataFrame) -> pd.Series:
+    """In-memory equivalent of df.duplicated() using row fingerprints."""
+    return pd.Series(row_hashes(df), index=df.index).duplicated()
+
+
+def drop_duplicate_rows(df: pd.DataFrame) -> pd.DataFrame:
+    return df[~duplicate_mask(df)]
+
+
+def main(argv: Optional[list] = None) -> int:
+    from ingest import CACHE_DIR, DATA_DIR, iter_chunks
+    parser = argparse.ArgumentParser(description="Count duplicate rows across the dataset shards")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--verify", action="store_true", help="check every match for hash collisions")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    deduper = StreamingDeduper(verify=args.verify)
+    for _ in dedup_chunks(iter_chunks(args.data_dir, args.cache_dir, args.chunksize), deduper):
+        pass
+    report = deduper.report()
+    print(f"✔ {report['duplicates']} duplicates in {report['rows']} rows "
+          f"({time.perf_counter() - started:.2f}s, hash set {report['hash_set_bytes'] / 1e6:.1f} MB)")
+    for name, shard in report["shards"].items():
+        print(f"  {name}: {shard['duplicates']} of {shard['rows']}")
+    if args.verify:
+        result = deduper.verify(iter_chunks(args.data_dir, args.cache_dir, args.chunksize))
+        print(f"✔ Verified {result['checked']} matches, {result['collisions']} hash collisions")
+        return 1 if result["collisions"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
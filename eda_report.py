@@ -0,0 +1,273 @@
+"""
+Summary-based EDA report.
+
+summarize() streams a frame, or an iterable of chunks, once. For every
+numeric/bool column it collects:
+- count, missing, mean, std, min, max
+- a QuantileSketch (preprocess.py): quantiles, and the histogram derived
+  from the sketch's weighted items
+- the pairwise correlation sufficient statistics (correlation.py)
+
+The result is a small JSON summary, tens of KB for ~40 columns. The
+histogram therefore comes from the sketch, not a second pass. Each bin
+edge is off by at most the sketch's rank error, about
+log2(n / k) / k of the rows.
+
+render() draws the report from the summary alone, using the Agg backend
+so it works headless:
+- correlation.png: correlation heatmap
+- histograms.png: per-column histograms
+- density.png: histograms smoothed with a small Gaussian kernel, in
+  place of KDE plots of a 5000-row sample
+- classes.png: class distribution, when the summary has it
+- report.html: all of the above plus a statistics table
+
+Re-rendering takes seconds whatever the dataset size.
+
+    python eda_report.py --csv UNSW_NB15_Cleaned.csv [--out-dir eda_report]
+    python eda_report.py --render-only [--out-dir eda_report]
+"""
+from typing import Any, Dict, Iterable, List, Optional, Union
+import argparse, base64, html, json, os, sys, time
+import numpy as np
+import pandas as pd
+
+from correlation import CorrelationAccumulator, iter_blocks, numeric_frame
+from preprocess import QuantileSketch
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+REPORT_DIR = os.environ.get("UNSW_EDA_DIR", os.path.join(ROOT, "eda_report"))
+SUMMARY_FILE = "summary.json"
+SUMMARY_FORMAT = 1
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+def _weighted_items(sketch: QuantileSketch):
+    values = [lvl for lvl in sketch.levels if len(lvl)]
+    weights = [np.full(len(lvl), 2.0 ** h) for h, lvl in enumerate(sketch.levels) if len(lvl)]
+    if not values:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(values), np.concatenate(weights)
+
+
+def summarize(source: Union[pd.DataFrame, Iterable[pd.DataFrame]], bins: int = 50,
+              chunksize: int = 200_000, sketch_k: int = 4096,
+              classes: Optional[Dict[str, Dict[str, int]]] = None) -> Dict[str, Any]:
+    """One pass over `source`; returns the JSON-serializable summary."""
+    columns: Optional[List[str]] = None
+    sketches: Dict[str, QuantileSketch] = {}
+    stats: Dict[str, Dict[str, float]] = {}
+    acc: Optional[CorrelationAccumulator] = None
+    rows = 0
+    for chunk in iter_blocks(source, chunksize):
+        numeric = numeric_frame(chunk, columns)
+        X = numeric.to_numpy(dtype=np.float64)
+        if columns is None:
+            columns = numeric.columns.tolist()
+            acc = CorrelationAccumulator.for_block(columns, X)
+            for i, col in enumerate(columns):
+                sketches[col] = QuantileSketch(sketch_k, seed=i)
+                stats[col] = {"count": 0, "missing": 0, "sum": 0.0, "sumsq": 0.0,
+                              "min": np.inf, "max": -np.inf}
+        rows += len(X)
+        acc.update(X)
+        present = ~np.isnan(X)
+        for i, col in enumerate(columns):
+            values = X[present[:, i], i]
+            s = stats[col]
+            s["count"] += len(values)
+            s["missing"] += len(X) - len(values)
+            if len(values):
+                centered = values - acc.shift[i]
+                s["sum"] += float(centered.sum())
+                s["sumsq"] += float((centered * centered).sum())
+                s["min"] = min(s["min"], float(values.min()))
+                s["max"] = max(s["max"], float(values.max()))
+            sketches[col].update(values)
+
+    out: Dict[str, Any] = {"format": SUMMARY_FORMAT, "rows": rows, "bins": bins, "columns": {}}
+    for i, col in enumerate(columns or []):
+        s = stats[col]
+        n = s["count"]
+        entry: Dict[str, Any] = {"count": n, "missing": s["missing"]}
+        if n:
+            mean = s["sum"] / n
+            var = max(s["sumsq"] / n - mean * mean, 0.0) * n / max(n - 1, 1)
+            entry.update(mean=mean + float(acc.shift[i]), std=float(np.sqrt(var)), min=s["min"], max=s["max"])
+            entry["quantiles"] = dict(zip((str(q) for q in QUANTILES), sketches[col].quantiles(QUANTILES)))
+            values, weights = _weighted_items(sketches[col])
+            lo, hi = s["min"], s["max"]
+            if hi == lo:
+                lo, hi = lo - 0.5, hi + 0.5
+            counts, edges = np.histogram(values, bins=bins, range=(lo, hi), weights=weights)
+            entry["hist"] = {"edges": edges.tolist(), "counts": counts.tolist()}
+        out["columns"][col] = entry
+    if acc is not None:
+        corr = acc.matrix()
+        out["corr"] = {"columns": corr.columns.tolist(),
+                       "matrix": np.round(corr.to_numpy(), 6).tolist()}
+    if classes:
+        out["classes"] = classes
+    return out
+
+
+def _jsonable(value):
+    # NaN (e.g. correlations of constant columns) is written as null
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def save_summary(summary: Dict[str, Any], out_dir: str = REPORT_DIR) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, SUMMARY_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(_jsonable(summary), f, allow_nan=False)
+    os.replace(tmp, path)
+    return path
+
+
+def load_summary(out_dir: str = REPORT_DIR) -> Dict[str, Any]:
+    with open(os.path.join(out_dir, SUMMARY_FILE)) as f:
+        summary = json.load(f)
+    if summary.get("format") != SUMMARY_FORMAT:
+        raise ValueError(f"summary format {summary.get('format')} != {SUMMARY_FORMAT}; re-run summarize")
+    return summary
+
+
+# ---- rendering ----
+
+def _smooth(counts: np.ndarray, width: float = 1.5) -> np.ndarray:
+    radius = int(np.ceil(3 * width))
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / width) ** 2)
+    kernel /= kernel.sum()
+    return np.convolve(np.pad(counts, radius, mode="edge"), kernel, mode="valid")
+
+
+def _grid(n: int):
+    cols = min(5, max(1, n))
+    return int(np.ceil(n / cols)), cols
+
+
+def render(summary: Dict[str, Any], out_dir: str = REPORT_DIR) -> Dict[str, str]:
+    """Write the PNGs and report.html from `summary`; returns {name: path}."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths: Dict[str, str] = {}
+    columns = {c: e for c, e in summary["columns"].items() if "hist" in e}
+
+    def save(fig, name: str):
+        path = os.path.join(out_dir, name + ".png")
+        fig.savefig(path, dpi=100, bbox_inches="tight")
+        plt.close(fig)
+        paths[name] = path
+
+    if "corr" in summary:
+        names = summary["corr"]["columns"]
+        matrix = np.array(summary["corr"]["matrix"], dtype=float)
+        fig, ax = plt.subplots(figsize=(max(6, 0.3 * len(names)), max(5, 0.25 * len(names))))
+        image = ax.imshow(matrix, cmap="coolwarm", vmin=-1, vmax=1)
+        ax.set_xticks(range(len(names)), names, rotation=90, fontsize=7)
+        ax.set_yticks(range(len(names)), names, fontsize=7)
+        fig.colorbar(image, ax=ax)
+        ax.set_title("Feature Correlation Heatmap")
+        save(fig, "correlation")
+
+    if columns:
+        nrows, ncols = _grid(len(columns))
+        for name, title, smooth in (("histograms", "Feature Distributions", False),
+                                    ("density", "Feature Density Plots", True)):
+            fig, axes = plt.subplots(nrows, ncols, figsize=(3 * ncols, 2.2 * nrows), squeeze=False)
+            for ax, (col, entry) in zip(axes.flat, columns.items()):
+                edges = np.asarray(entry["hist"]["edges"])
+                counts = np.asarray(entry["hist"]["counts"], dtype=float)
+                if smooth:
+                    density = _smooth(counts) / max(counts.sum() * np.diff(edges).mean(), 1e-12)
+                    ax.plot((edges[:-1] + edges[1:]) / 2, density)
+                else:
+                    ax.stairs(counts, edges, fill=True)
+                ax.set_title(col, fontsize=8)
+                ax.tick_params(labelsize=6)
+            for ax in list(axes.flat)[len(columns):]:
+                ax.axis("off")
+            fig.suptitle(title, fontsize=14)
+            fig.tight_layout(rect=(0, 0, 1, 0.97))
+            save(fig, name)
+
+    classes = summary.get("classes") or {}
+    if classes:
+        fig, axes = plt.subplots(1, len(classes), figsize=(6 * len(classes), 6), squeeze=False)
+        for ax, (title, counts) in zip(axes.flat, classes.items()):
+            ax.pie(list(counts.values()), labels=list(counts.keys()), autopct='%1.1f%%')
+            ax.set_title(title)
+        save(fig, "classes")
+
+    paths["html"] = _write_html(summary, paths, out_dir)
+    return paths
+
+
+def _write_html(summary: Dict[str, Any], images: Dict[str, str], out_dir: str) -> str:
+    head = ["column", "count", "missing", "mean", "std", "min"] + [f"q{q}" for q in QUANTILES] + ["max"]
+    rows = []
+    for col, e in summary["columns"].items():
+        q = e.get("quantiles", {})
+        cells = [col, e["count"], e["missing"], e.get("mean"), e.get("std"), e.get("min")]
+        cells += [q.get(str(x)) for x in QUANTILES] + [e.get("max")]
+        rows.append("<tr>" + "".join(
+            f"<td>{html.escape(str(c)) if isinstance(c, str) or c is None else f'{c:.6g}'}</td>" for c in cells
+        ) + "</tr>")
+    figures = []
+    for name, path in images.items():
+        with open(path, "rb") as f:
+            data = base64.b64encode(f.read()).decode()
+        figures.append(f'<h2>{html.escape(name)}</h2><img src="data:image/png;base64,{data}">')
+    page = (
+        "<!doctype html><meta charset='utf-8'><title>UNSW-NB15 EDA</title>"
+        "<style>body{font-family:sans-serif}table{border-collapse:collapse;font-size:12px}"
+        "td,th{border:1px solid #ccc;padding:2px 6px;text-align:right}img{max-width:100%}</style>"
+        f"<h1>UNSW-NB15 EDA</h1><p>{summary['rows']} rows, {len(summary['columns'])} numeric columns</p>"
+        "<table><tr>" + "".join(f"<th>{h}</th>" for h in head) + "</tr>" + "".join(rows) + "</table>"
+        + "".join(figures)
+    )
+    path = os.path.join(out_dir, "report.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(page)
+    return path
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Summary-based, headless EDA report")
+    parser.add_argument("--csv", help="dataset to summarize (streamed in chunks)")
+    parser.add_argument("--out-dir", default=REPORT_DIR)
+    parser.add_argument("--bins", type=int, default=50)
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--render-only", action="store_true", help="re-render from the saved summary")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.render_only:
+        summary = load_summary(args.out_dir)
+    else:
+        if not args.csv:
+            parser.error("--csv is required unless --render-only")
+        summary = summarize(pd.read_csv(args.csv, chunksize=args.chunksize), bins=args.bins)
+        path = save_summary(summary, args.out_dir)
+        print(f"✔ Summarized {summary['rows']} rows in {time.perf_counter() - started:.2f}s -> {path}")
+        started = time.perf_counter()
+    paths = render(summary, args.out_dir)
+    print(f"✔ Rendered report in {time.perf_counter() - started:.2f}s -> {paths['html']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
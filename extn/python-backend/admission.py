@@ -0,0 +1,195 @@
+"""
+Admission control and load shedding for the scoring routes.
+
+Without a limit, every request in a spike is accepted. They all queue on
+the event loop, the micro-batcher and the inference workers, and p99
+grows until clients (dashboard, extension) time out and retry. That
+adds still more load.
+
+`AdmissionController` bounds the requests being handled at once
+(`max_concurrency`). Later arrivals wait in a FIFO queue. On arrival a
+request's queue wait is estimated as:
+- the expected service time of everything queued ahead of it
+- plus half of the expected service time of what is in flight
+- divided by the number of slots
+
+Expected service times are EWMAs of each route's measured handling
+time. A request is rejected immediately, with 503 and Retry-After, if:
+- the queue already holds `max_queue` requests, or
+- the estimated wait exceeds `slo_ms`
+Requests that are accepted therefore see a bounded wait, and rejected
+clients learn within microseconds, not after a timeout.
+
+`AdmissionMiddleware` (pure ASGI) gates only POSTs to `routes`. Health,
+metrics and admin routes bypass it, and so are answered even while the
+scoring routes are saturated. A queued request's body is not read until
+it is admitted.
+"""
+from typing import Any, Dict, Iterable, Optional, Tuple
+from collections import deque
+import asyncio, json, math, time
+import numpy as np
+
+
+class Shed(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int = 64, max_queue: int = 512, slo_ms: float = 250.0,
+                 default_service_ms: float = 5.0, alpha: float = 0.1, history: int = 4096):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.slo = slo_ms / 1000.0
+        self.default_service = default_service_ms / 1000.0
+        self.alpha = alpha
+        # route -> EWMA of seconds from admission to response sent
+        self.service: Dict[str, float] = {}
+        self.inflight = 0
+        self._inflight_cost = 0.0
+        # (future, route, expected cost); a granted future owns a slot
+        self._waiters: deque = deque()
+        self._queued_cost = 0.0
+        # Counters
+        self.accepted: Dict[str, int] = {}
+        self.shed: Dict[Tuple[str, str], int] = {}
+        self.queued = 0
+        self.queue_seconds_total = 0.0
+        self._waits = deque(maxlen=history)
+
+    def expected(self, route: str) -> float:
+        return self.service.get(route, self.default_service)
+
+    def estimate_wait(self) -> float:
+        """Seconds a request arriving now would wait for a slot."""
+        if self.inflight < self.max_concurrency and not self._waiters:
+            return 0.0
+        return (self._queued_cost + 0.5 * self._inflight_cost) / self.max_concurrency
+
+    async def acquire(self, route: str) -> float:
+        """
+        Take a slot, queueing if needed. Returns the expected cost charged
+        for it, which must be passed back to release(). Raises Shed.
+        """
+        cost = self.expected(route)
+        if self.inflight < self.max_concurrency and not self._waiters:
+            self._grant(route, cost)
+            return cost
+        wait = self.estimate_wait()
+        if len(self._waiters) >= self.max_queue:
+            self._shed(route, "queue_full")
+            raise Shed("queue_full", max(wait, self.slo))
+        if wait > self.slo:
+            self._shed(route, "slo")
+            raise Shed("slo", wait)
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (fut, route, cost)
+        self._waiters.append(entry)
+        self._queued_cost += cost
+        started = time.perf_counter()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # Client went away: give back the slot if it was already handed
+            # over. Whoever dequeues an entry owns its queued cost, and
+            # release() may already have popped (and skipped) this one.
+            if fut.done() and not fut.cancelled():
+                self.release(route, cost, None)
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                self._queued_cost -= cost
+            raise
+        waited = time.perf_counter() - started
+        self.queued += 1
+        self.queue_seconds_total += waited
+        self._waits.append(waited)
+        return cost
+
+    def _grant(self, route: str, cost: float):
+        self.inflight += 1
+        self._inflight_cost += cost
+        self.accepted[route] = self.accepted.get(route, 0) + 1
+
+    def _shed(self, route: str, reason: str):
+        self.shed[(route, reason)] = self.shed.get((route, reason), 0) + 1
+
+    def release(self, route: str, cost: float, service_seconds: Optional[float]):
+        self.inflight -= 1
+        self._inflight_cost -= cost
+        if service_seconds is not None:
+            prev = self.service.get(route)
+            self.service[route] = service_seconds if prev is None else \
+                prev + self.alpha * (service_seconds - prev)
+        # Hand the slot straight to the oldest waiter, FIFO
+        while self._waiters and self.inflight < self.max_concurrency:
+            fut, w_route, w_cost = self._waiters.popleft()
+            self._queued_cost -= w_cost
+            if fut.done():
+                continue
+            self._grant(w_route, w_cost)
+            fut.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        waits_ms = np.array(self._waits) * 1000.0
+        resp: Dict[str, Any] = {
+            "enabled": True,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "slo_ms": self.slo * 1000.0,
+            "inflight": self.inflight,
+            "queued_now": len(self._waiters),
+            "estimated_wait_ms": self.estimate_wait() * 1000.0,
+            "service_ms": {r: s * 1000.0 for r, s in self.service.items()},
+            "accepted": dict(self.accepted),
+            "shed": {f"{route} {reason}": n for (route, reason), n in sorted(self.shed.items())},
+            "queued": self.queued,
+            "queue_seconds_total": self.queue_seconds_total,
+        }
+        if len(waits_ms):
+            p50, p95, p99 = np.percentile(waits_ms, [50, 95, 99])
+            resp["queue_wait_ms"] = {"mean": float(waits_ms.mean()), "p50": float(p50),
+                                     "p95": float(p95), "p99": float(p99), "max": float(waits_ms.max())}
+        return resp
+
+
+class AdmissionMiddleware:
+    """Pure ASGI gate in front of the scoring routes; everything else passes straight through."""
+
+    def __init__(self, app, controller: AdmissionController, routes: Iterable[str] = ()):
+        self.app = app
+        self.controller = controller
+        self.routes = set(routes)
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path")
+        if scope["type"] != "http" or scope["method"] != "POST" or path not in self.routes:
+            await self.app(scope, receive, send)
+            return
+        controller = self.controller
+        try:
+            cost = await controller.acquire(path)
+        except Shed as e:
+            await self._reject(send, e)
+            return
+        started = time.perf_counter()
+        finished = None
+        try:
+            await self.app(scope, receive, send)
+            finished = time.perf_counter() - started
+        finally:
+            controller.release(path, cost, finished)
+
+    @staticmethod
+    async def _reject(send, shed: Shed):
+        body = json.dumps({"status": "error", "message": "Server overloaded, retry later",
+                           "reason": shed.reason}).encode()
+        await send({"type": "http.response.start", "status": 503, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(shed.retry_after))).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
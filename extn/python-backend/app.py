@@ -1,15 +1,107 @@
-from typing import List, Dict, Any
-from fastapi import FastAPI, HTTPException, Request
+import time
+# Cold-start timing starts before the heavy imports
+_import_started = time.perf_counter()
+
+from typing import List, Dict, Any, Optional
+from collections import deque
+from fastapi import FastAPI, HTTPException, Request, Header
 from pydantic import BaseModel, Field, validator
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.exceptions import RequestValidationError
-import joblib, json, os
-import pandas as pd
+import asyncio, os
+import numpy as np
 import random
+from inference import TOP_FEATS, InferenceExecutor, request_row
+from prediction_cache import PredictionCache
+from sample_store import SampleStore
+from model_registry import ModelRegistry, ModelVersion
+from admission import AdmissionController, AdmissionMiddleware
+from prediction_store import PredictionStore
+from wire_format import decode_rows, encode_results, is_binary, reply_binary, CONTENT_TYPE as RECORDS_TYPE
+from metrics import (DebugLog, MetricsMiddleware, MetricsRegistry, SIZE_BUCKETS,
+                     stage_timer)
+
+# Seconds spent in each cold-start stage, reported by the health check
+STARTUP_TIMINGS: Dict[str, float] = {"imports": time.perf_counter() - _import_started}
 
 # 1️⃣ Define the API contract
 
+# Upper bound on rows accepted by /predict-batch in one call
+MAX_BATCH_ROWS = int(os.environ.get("IDS_MAX_BATCH_ROWS", "10000"))
+
+# Server-side micro-batching of concurrent /predict calls
+MICROBATCH_ENABLED   = os.environ.get("IDS_MICROBATCH", "1") == "1"
+MICROBATCH_MAX_SIZE  = int(os.environ.get("IDS_MICROBATCH_MAX_SIZE", "64"))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("IDS_MICROBATCH_MAX_WAIT_MS", "2"))
+
+# Where predict_proba runs: inline | thread | process
+INFERENCE_MODE    = os.environ.get("IDS_INFERENCE_MODE", "thread")
+INFERENCE_WORKERS = int(os.environ.get("IDS_INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Pandas-free scoring; only used if it matches predict_proba within the tolerance
+FASTPATH_ENABLED   = os.environ.get("IDS_FASTPATH", "1") == "1"
+FASTPATH_TOLERANCE = float(os.environ.get("IDS_FASTPATH_TOLERANCE", "0"))
+
+# Forest engine behind the fast path: sklearn | compiled (float64 | float32 | quantized)
+ENGINE           = os.environ.get("IDS_ENGINE", "sklearn")
+ENGINE_PRECISION = os.environ.get("IDS_ENGINE_PRECISION", "float64")
+# Batches larger than this go to sklearn even with the compiled engine (0 = never)
+ENGINE_MAX_ROWS  = int(os.environ.get("IDS_ENGINE_MAX_ROWS", "512"))
+# Serve the forest from memory-mapped node tables shared by all worker
+# processes (shared_model.py); implies the compiled engine for every batch size
+SHARED_MODEL     = os.environ.get("IDS_SHARED_MODEL", "0") == "1"
+# Linear pre-filter in front of the forest, calibrated offline (cascade.py)
+CASCADE          = os.environ.get("IDS_CASCADE", "0") == "1"
+
+MODEL_OPTIONS = {
+    "fast_path": FASTPATH_ENABLED,
+    "tolerance": FASTPATH_TOLERANCE,
+    "engine": ENGINE,
+    "precision": ENGINE_PRECISION,
+    "engine_max_rows": ENGINE_MAX_ROWS,
+    "shared": SHARED_MODEL,
+    "cascade": CASCADE,
+}
+
+# Cache of probabilities for repeated flow signatures
+CACHE_ENABLED     = os.environ.get("IDS_CACHE", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.environ.get("IDS_CACHE_MAX_ENTRIES", "100000"))
+CACHE_TTL_SECONDS = float(os.environ.get("IDS_CACHE_TTL_SECONDS", "300"))
+# Round features to this many decimals before keying (unset = exact match)
+CACHE_QUANTIZE    = os.environ.get("IDS_CACHE_QUANTIZE_DECIMALS")
+# How often model / threshold files are checked for changes
+ARTIFACT_CHECK_SECONDS = float(os.environ.get("IDS_ARTIFACT_CHECK_SECONDS", "5"))
+# Load and swap in changed model / threshold files automatically
+AUTO_RELOAD = os.environ.get("IDS_AUTO_RELOAD", "1") == "1"
+
+# Fraction of live traffic also scored by a shadow (candidate) model
+SHADOW_FRACTION    = float(os.environ.get("IDS_SHADOW_FRACTION", "0.05"))
+SHADOW_MAX_PENDING = int(os.environ.get("IDS_SHADOW_MAX_PENDING", "32"))
+
+# If set, /models admin routes require a matching X-Admin-Token header
+ADMIN_TOKEN = os.environ.get("IDS_ADMIN_TOKEN")
+
+# Admission control for the scoring routes: requests handled at once, queue
+# length, and the estimated queue wait above which requests get 503 + Retry-After
+ADMISSION_ENABLED     = os.environ.get("IDS_ADMISSION", "1") == "1"
+ADMISSION_CONCURRENCY = int(os.environ.get("IDS_ADMISSION_CONCURRENCY", "64"))
+ADMISSION_MAX_QUEUE   = int(os.environ.get("IDS_ADMISSION_MAX_QUEUE", "512"))
+ADMISSION_SLO_MS      = float(os.environ.get("IDS_ADMISSION_SLO_MS", "250"))
+
+# Write-behind store of scored predictions for the dashboard (prediction_store.py);
+# IDS_STORE_PATH defaults to predictions.db in the model directory
+STORE_ENABLED        = os.environ.get("IDS_STORE", "1") == "1"
+STORE_PATH           = os.environ.get("IDS_STORE_PATH")
+STORE_FLUSH_ROWS     = int(os.environ.get("IDS_STORE_FLUSH_ROWS", "2048"))
+STORE_FLUSH_MS       = float(os.environ.get("IDS_STORE_FLUSH_MS", "1000"))
+STORE_MAX_PENDING    = int(os.environ.get("IDS_STORE_MAX_PENDING", "100000"))
+STORE_RETENTION_DAYS = float(os.environ.get("IDS_STORE_RETENTION_DAYS", "7"))
+
+# Per-request debug output (request bodies, inputs); off by default, rate-limited when on
+DEBUG_LOG_ENABLED    = os.environ.get("IDS_DEBUG_LOG", "0") == "1"
+DEBUG_LOG_PER_SECOND = float(os.environ.get("IDS_DEBUG_LOG_PER_SECOND", "5"))
+
 class PredictRequest(BaseModel):
     # Update feature names to match PCA-selected features
     proto: float
@@ -65,10 +157,62 @@ class PredictResponse(BaseModel):
     message: str = ""
 
 
+class PredictBatchRequest(BaseModel):
+    # Either full objects, or raw 10-element arrays in TOP_FEATS order (or both)
+    rows: List[PredictRequest] = []
+    features: List[List[float]] = []
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "features": [
+                    [6, 0.0, 3, 0, 64, 1, 0, 0, 0, 0],
+                    [17, 0.000011, 2, 248, 254, 0, 0, 0, 0, 0]
+                ]
+            }
+        }
+
+    def to_matrix(self) -> np.ndarray:
+        """Stack rows then features into one (N, 10) float matrix."""
+        for i, vec in enumerate(self.features):
+            if len(vec) != len(TOP_FEATS):
+                raise ValueError(f"features[{i}]: expected {len(TOP_FEATS)} features, got {len(vec)}")
+        matrix = np.empty((len(self.rows) + len(self.features), len(TOP_FEATS)), dtype=np.float64)
+        for i, r in enumerate(self.rows):
+            matrix[i] = [getattr(r, f) for f in TOP_FEATS]
+        if self.features:
+            matrix[len(self.rows):] = self.features
+        return matrix
+
+
+class ReloadRequest(BaseModel):
+    # Paths are relative to the model directory; default to the served files
+    pipeline_file: Optional[str] = None
+    threshold_file: Optional[str] = None
+    # "live" swaps it in once warm; "shadow" scores a sample of traffic alongside
+    target: str = "live"
+
+
+class PredictBatchResponse(BaseModel):
+    predictions: List[int]
+    probabilities: List[float]
+    count: int
+    status: str = "success"
+    message: str = ""
+
+
 # 2️⃣ FastAPI setup
 
 app = FastAPI(title="IDS PCA-Selected RF API")
 
+# Added first, so it sits inside CORS (503s keep their CORS headers) and
+# metrics (shed requests are counted); health/metrics routes bypass it
+admission: Optional[AdmissionController] = None
+if ADMISSION_ENABLED:
+    admission = AdmissionController(ADMISSION_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_SLO_MS)
+    app.add_middleware(AdmissionMiddleware, controller=admission,
+                       routes=("/predict", "/predict-legacy", "/predict-batch"))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],    # adjust in production
@@ -77,6 +221,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counters and per-stage latency histograms, served at /metrics
+metrics = MetricsRegistry()
+REQUESTS_TOTAL = metrics.counter(
+    "ids_requests_total", "HTTP requests by route and status code", ("route", "status"))
+REQUEST_SECONDS = metrics.histogram(
+    "ids_request_duration_seconds", "End-to-end request latency", ("route",))
+STAGE_SECONDS = metrics.histogram(
+    "ids_stage_seconds",
+    "Prediction latency by stage: parse, features, predict, threshold, serialize",
+    ("route", "stage"))
+MODEL_CALL_SECONDS = metrics.histogram(
+    "ids_model_call_seconds", "Latency of one model scoring call (may cover a micro-batch)")
+MODEL_CALL_ROWS = metrics.histogram(
+    "ids_model_call_rows", "Rows scored per model call", buckets=SIZE_BUCKETS)
+
+app.add_middleware(
+    MetricsMiddleware,
+    requests=REQUESTS_TOTAL,
+    duration=REQUEST_SECONDS,
+    stages=STAGE_SECONDS,
+    timed_routes=("/predict", "/predict-legacy", "/predict-batch"),
+)
+
+debug_log = DebugLog(DEBUG_LOG_ENABLED, DEBUG_LOG_PER_SECOND)
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     return JSONResponse(
@@ -91,86 +260,594 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 # 3️⃣ Load pipeline + threshold
 
 # Use absolute paths to find the model files in the root directory
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# (IDS_MODEL_DIR points elsewhere, e.g. the benchmark's stand-in model)
+BASE_DIR = os.environ.get("IDS_MODEL_DIR") or \
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 PIPELINE_FILE = os.path.join(BASE_DIR, "ids_pipeline.pkl")
 THRESH_FILE = os.path.join(BASE_DIR, "threshold.json")
-pipeline        = None
-threshold       = 0.5
-model_loaded    = False
 model_load_error = None
 
+registry = ModelRegistry(MODEL_OPTIONS, SHADOW_FRACTION, SHADOW_MAX_PENDING,
+                         warmup_rows=MICROBATCH_MAX_SIZE)
 
-
+_load_started = time.perf_counter()
 try:
     if os.path.exists(PIPELINE_FILE):
-        pipeline = joblib.load(PIPELINE_FILE)
-        model_loaded = True
+        # Falls back to the default threshold if threshold.json is missing
+        registry.set_live(registry.load(PIPELINE_FILE, THRESH_FILE))
     else:
         model_load_error = f"Pipeline file not found: {PIPELINE_FILE}"
-    # Load threshold
-    if os.path.exists(THRESH_FILE):
-        threshold = json.load(open(THRESH_FILE))["threshold"]
-    else:
+    if not os.path.exists(THRESH_FILE):
         model_load_error = (model_load_error or "") + f"; Missing threshold file: {THRESH_FILE}"
 except Exception as e:
     model_load_error = str(e)
+STARTUP_TIMINGS["model_load"] = time.perf_counter() - _load_started
+
+if registry.live is not None and not registry.live.model.fast_status["enabled"]:
+    print("⚠️ Fast path disabled:", registry.live.model.fast_status.get("reason"))
+
+executor = InferenceExecutor(INFERENCE_MODE, INFERENCE_WORKERS, MODEL_OPTIONS)
+
+
+cache: Optional[PredictionCache] = None
+if CACHE_ENABLED:
+    cache = PredictionCache(
+        CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS,
+        int(CACHE_QUANTIZE) if CACHE_QUANTIZE else None,
+        version=registry.live.version if registry.live else None,
+    )
+
+
+store: Optional[PredictionStore] = None
+if STORE_ENABLED:
+    store = PredictionStore(STORE_PATH or os.path.join(BASE_DIR, "predictions.db"),
+                            STORE_FLUSH_ROWS, STORE_FLUSH_MS / 1000.0,
+                            STORE_MAX_PENDING, STORE_RETENTION_DAYS)
+
+
+def model_unavailable() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"status": "error", "message": "Model not loaded"}
+    )
+
+
+async def score_matrix_async(matrix: np.ndarray, live: ModelVersion) -> np.ndarray:
+    """Scoring on the configured execution backend, off the event loop."""
+    started = time.perf_counter()
+    probs = await executor.run(live, matrix)
+    elapsed = time.perf_counter() - started
+    registry.record_live(elapsed, len(matrix))
+    MODEL_CALL_SECONDS.observe(elapsed)
+    MODEL_CALL_ROWS.observe(len(matrix))
+    return probs
+
+
+async def score_matrix_cached(matrix: np.ndarray, live: ModelVersion) -> np.ndarray:
+    """Like score_matrix_async, but only rows missing from the cache are scored."""
+    if cache is None:
+        probs = await score_matrix_async(matrix, live)
+        registry.maybe_shadow(matrix, probs, live)
+        return probs
+    keys = [cache.key(row) for row in matrix]
+    probs = np.empty(len(keys), dtype=np.float64)
+    missing = []
+    for i, k in enumerate(keys):
+        prob = cache.get(k, live.version)
+        if prob is None:
+            missing.append(i)
+        else:
+            probs[i] = prob
+    if missing:
+        scored = await score_matrix_async(matrix[missing], live)
+        probs[missing] = scored
+        for i, prob in zip(missing, scored.tolist()):
+            cache.put(keys[i], prob, live.version)
+    registry.maybe_shadow(matrix, probs, live)
+    return probs
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-row requests and scores them together.
+
+    A batch is flushed as soon as it holds `max_batch_size` rows or the
+    oldest queued row has waited `max_wait_ms`, whichever comes first.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float, max_inflight: int = 1,
+                 history: int = 4096):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        # Batches scored concurrently (one per inference worker)
+        self.max_inflight = max(1, max_inflight)
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Counters for tuning latency vs throughput
+        self.batches = 0
+        self.rows = 0
+        self.size_hist: Dict[int, int] = {}
+        self._waits = deque(maxlen=history)
+        self.max_wait_seen = 0.0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, row: np.ndarray, live: ModelVersion) -> float:
+        """Queue one (1, 10) TOP_FEATS row and wait for its attack probability."""
+        fut = asyncio.get_event_loop().create_future()
+        await self.queue.put((row, fut, time.perf_counter(), live))
+        return await fut
+
+    async def _collect(self) -> list:
+        batch = [await self.queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without yielding
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Wait for a free worker before collecting, so rows keep
+            # accumulating into the next batch while all workers are busy
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            self._record(batch, time.perf_counter())
+            asyncio.ensure_future(self._flush(batch))
+
+    async def _flush(self, batch: list):
+        try:
+            # Rows queued across a model swap are scored by the version they captured
+            groups: Dict[int, list] = {}
+            for item in batch:
+                groups.setdefault(id(item[3]), []).append(item)
+            for items in groups.values():
+                try:
+                    probs = await score_matrix_async(np.concatenate([item[0] for item in items]), items[0][3])
+                except Exception as e:
+                    for item in items:
+                        if not item[1].done():
+                            item[1].set_exception(e)
+                    continue
+                for item, prob in zip(items, probs):
+                    # Caller may have gone away (client disconnect)
+                    if not item[1].done():
+                        item[1].set_result(float(prob))
+        finally:
+            self._slots.release()
+
+    def _record(self, batch: list, flushed_at: float):
+        size = len(batch)
+        self.batches += 1
+        self.rows += size
+        self.size_hist[size] = self.size_hist.get(size, 0) + 1
+        for _, _, queued_at, _ in batch:
+            wait = flushed_at - queued_at
+            self._waits.append(wait)
+            if wait > self.max_wait_seen:
+                self.max_wait_seen = wait
+
+    def stats(self) -> Dict[str, Any]:
+        waits_ms = np.array(self._waits) * 1000.0
+        resp = {
+            "enabled": True,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_inflight": self.max_inflight,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.size_hist.items())},
+            "queue_wait_ms": {
+                "max": self.max_wait_seen * 1000.0,
+            },
+        }
+        if len(waits_ms):
+            p50, p95, p99 = np.percentile(waits_ms, [50, 95, 99])
+            resp["queue_wait_ms"].update({
+                "mean": float(waits_ms.mean()),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "window": len(waits_ms),
+            })
+        return resp
+
+
+batcher: Optional[MicroBatcher] = None
+
+
+async def score_row(row: np.ndarray, live: ModelVersion) -> float:
+    """Score one (1, 10) row: cache first, then the micro-batcher or executor."""
+    key = cache.key(row[0]) if cache is not None else None
+    prob = cache.get(key, live.version) if key is not None else None
+    if prob is None:
+        if batcher is not None:
+            # Coalesced with other concurrent single-row calls
+            prob = await batcher.submit(row, live)
+        else:
+            prob = float((await score_matrix_async(row, live))[0])
+        if key is not None:
+            cache.put(key, prob, live.version)
+    registry.maybe_shadow(row, np.array([prob]), live)
+    return prob
+
+
+def persist(matrix: np.ndarray, probs: np.ndarray, preds: np.ndarray, route: str, live: ModelVersion):
+    """Hand results to the write-behind store; only buffers, never writes."""
+    if store is not None:
+        store.record(matrix, probs, preds, route, live.version)
+
+
+_reload_lock: Optional[asyncio.Lock] = None
+
+
+async def activate(version: ModelVersion):
+    """Make a loaded version live. Everything after the awaits is one atomic step."""
+    loop = asyncio.get_running_loop()
+    # Process mode: bring up and warm this version's workers first
+    await loop.run_in_executor(None, executor.attach, version)
+    previous = registry.set_live(version)
+    if cache is not None:
+        cache.set_version(version.version)
+    if previous is not None and previous is not version:
+        executor.release(previous)
+    print(f"✔ Model {version.version} is live")
+
+
+async def reload_model(pipeline_file: str, threshold_file: str, target: str = "live") -> ModelVersion:
+    """Load and warm a new version in the background, then swap it in or shadow it."""
+    global model_load_error
+    async with _reload_lock:
+        loop = asyncio.get_running_loop()
+        try:
+            version = await loop.run_in_executor(None, registry.load, pipeline_file, threshold_file)
+        except Exception as e:
+            registry.last_error = f"{type(e).__name__}: {e}"
+            raise
+        registry.last_error = None
+        if target == "shadow":
+            registry.set_shadow(version)
+            print(f"ℹ️ Model {version.version} is shadowing {registry.live.version if registry.live else None}")
+        else:
+            await activate(version)
+            model_load_error = None
+        return version
+
+
+def artifacts_changed() -> bool:
+    live = registry.live
+    current = registry.fingerprint(PIPELINE_FILE, THRESH_FILE)
+    if live is None:
+        return current[0]["size"] is not None
+    return live.pipeline_file == PIPELINE_FILE and live.threshold_file == THRESH_FILE \
+        and current != live.fingerprint
+
+
+async def watch_artifacts():
+    """Reload the served model (and so drop cached probabilities) when its files change."""
+    while True:
+        await asyncio.sleep(ARTIFACT_CHECK_SECONDS)
+        if not artifacts_changed():
+            continue
+        try:
+            await reload_model(PIPELINE_FILE, THRESH_FILE)
+        except Exception as e:
+            print(f"❌ Reload of changed model files failed, keeping current model: {e}")
+
+
+_watcher: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def start_inference():
+    global batcher, _watcher, _reload_lock
+    started = time.perf_counter()
+    STARTUP_TIMINGS["module"] = started - _import_started
+    _reload_lock = asyncio.Lock()
+    executor.start()
+    if registry.live is not None:
+        # Process-pool workers load the model here, before traffic arrives
+        await asyncio.get_running_loop().run_in_executor(None, executor.attach, registry.live)
+    STARTUP_TIMINGS["executor_start"] = time.perf_counter() - started
+    if store is not None:
+        store.start()
+    if MICROBATCH_ENABLED:
+        batcher = MicroBatcher(MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS,
+                               max_inflight=max(1, executor.workers))
+        batcher.start()
+    if AUTO_RELOAD and ARTIFACT_CHECK_SECONDS > 0:
+        _watcher = asyncio.get_running_loop().create_task(watch_artifacts())
+    STARTUP_TIMINGS["total"] = time.perf_counter() - _import_started
+    print(f"✔ Ready in {STARTUP_TIMINGS['total']:.3f}s", {k: round(v, 3) for k, v in STARTUP_TIMINGS.items()})
+
+
+@app.on_event("shutdown")
+async def stop_inference():
+    if _watcher is not None:
+        _watcher.cancel()
+    if batcher is not None:
+        await batcher.stop()
+    executor.shutdown()
+    executor.release(registry.live)
+    registry.shutdown()
+    if store is not None:
+        # Writes out whatever is still buffered
+        await asyncio.get_running_loop().run_in_executor(None, store.close)
 
 # 4️⃣ Health check
 
 @app.get("/", tags=["Health"])
 def health_check() -> Dict[str, Any]:
+    live = registry.live
+    model_loaded = live is not None
     status = "ok" if model_loaded else "error"
-    resp = {"status": status, "model_loaded": model_loaded}
+    resp = {"status": status, "model_loaded": model_loaded, "inference": executor.describe(),
+            "startup_seconds": STARTUP_TIMINGS, "samples": samples.describe()}
     if not model_loaded:
         resp["error"] = model_load_error
     else:
-        resp["threshold"] = threshold
+        resp["model_version"] = live.version
+        resp["threshold"] = live.threshold
+        resp["fast_path"] = live.model.fast_status
         # Get feature names used by the pipeline
-        resp["features"] = ['proto','dur','state','smean','sttl',
-                           'dpkts','ackdat','synack','response_body_len','djit']
+        resp["features"] = TOP_FEATS
     return resp
 
+
+@app.get("/batcher-stats", tags=["Health"])
+def batcher_stats() -> Dict[str, Any]:
+    if batcher is None:
+        return {"enabled": False}
+    return batcher.stats()
+
+
+@app.get("/admission-stats", tags=["Health"])
+def admission_stats() -> Dict[str, Any]:
+    if admission is None:
+        return {"enabled": False}
+    return admission.stats()
+
+
+@app.get("/store-stats", tags=["Health"])
+def store_stats() -> Dict[str, Any]:
+    if store is None:
+        return {"enabled": False}
+    return store.stats()
+
+
+@app.get("/models", tags=["Health"])
+def models() -> Dict[str, Any]:
+    """Live and shadow versions, with their latency and disagreement stats."""
+    return registry.stats()
+
+
+def check_admin(token: Optional[str]):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def model_path(name: Optional[str], default: str) -> str:
+    """Resolve an artifact path, refusing anything outside the model directory."""
+    if not name:
+        return default
+    path = os.path.realpath(os.path.join(BASE_DIR, name))
+    if os.path.commonpath([path, os.path.realpath(BASE_DIR)]) != os.path.realpath(BASE_DIR):
+        raise HTTPException(status_code=400, detail=f"{name} is outside the model directory")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"{name} not found")
+    return path
+
+
+@app.post("/models/reload", tags=["Admin"])
+async def models_reload(req: ReloadRequest, x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    if req.target not in ("live", "shadow"):
+        raise HTTPException(status_code=422, detail="target must be 'live' or 'shadow'")
+    pipeline_file = model_path(req.pipeline_file, PIPELINE_FILE)
+    threshold_file = model_path(req.threshold_file, THRESH_FILE)
+    try:
+        version = await reload_model(pipeline_file, threshold_file, req.target)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model load failed: {str(e)}")
+    return {"status": "success", "target": req.target, "model": version.describe()}
+
+
+@app.post("/models/promote", tags=["Admin"])
+async def models_promote(x_admin_token: Optional[str] = Header(None)):
+    """Make the current shadow version live."""
+    check_admin(x_admin_token)
+    shadow = registry.shadow
+    if shadow is None:
+        raise HTTPException(status_code=409, detail="No shadow model to promote")
+    async with _reload_lock:
+        await activate(shadow)
+    return {"status": "success", "model": shadow.describe()}
+
+
+@app.delete("/models/shadow", tags=["Admin"])
+def models_drop_shadow(x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    registry.set_shadow(None)
+    return {"status": "success"}
+
+
+@app.get("/cache-stats", tags=["Health"])
+def cache_stats() -> Dict[str, Any]:
+    if cache is None:
+        return {"enabled": False}
+    return cache.stats()
+
+
+# Values owned by the cache / batcher / registry, read when /metrics is scraped
+metrics.callback("ids_model_loaded", "1 if a model version is live", "gauge",
+                 lambda: {(registry.live.version,): 1} if registry.live else {("",): 0},
+                 ("version",))
+metrics.callback("ids_model_swaps_total", "Live model swaps since start", "counter",
+                 lambda: registry.swaps)
+metrics.callback("ids_shadow_rows_total", "Rows scored by the shadow model", "counter",
+                 lambda: registry.shadow_rows if registry.shadow else None)
+metrics.callback("ids_shadow_disagreements_total", "Shadow predictions that differ from live",
+                 "counter", lambda: registry.shadow_disagreements if registry.shadow else None)
+metrics.callback("ids_cache_lookups_total", "Prediction cache lookups by result", "counter",
+                 lambda: {("hit",): cache.hits, ("miss",): cache.misses} if cache else None,
+                 ("result",))
+metrics.callback("ids_cache_entries", "Entries in the prediction cache", "gauge",
+                 lambda: len(cache._entries) if cache else None)
+metrics.callback("ids_cache_evictions_total", "Prediction cache LRU evictions", "counter",
+                 lambda: cache.evictions if cache else None)
+metrics.callback("ids_batcher_queue_depth", "Rows waiting in the micro-batcher", "gauge",
+                 lambda: batcher.queue.qsize() if batcher and batcher.queue else None)
+metrics.callback("ids_batcher_batches_total", "Micro-batches flushed", "counter",
+                 lambda: batcher.batches if batcher else None)
+metrics.callback("ids_admission_accepted_total", "Scoring requests admitted", "counter",
+                 lambda: {(r,): n for r, n in admission.accepted.items()} if admission else None,
+                 ("route",))
+metrics.callback("ids_admission_shed_total", "Scoring requests rejected with 503", "counter",
+                 lambda: dict(admission.shed) if admission else None, ("route", "reason"))
+metrics.callback("ids_admission_queued_total", "Admitted requests that waited for a slot", "counter",
+                 lambda: admission.queued if admission else None)
+metrics.callback("ids_admission_queue_seconds_total", "Seconds admitted requests spent queued",
+                 "counter", lambda: admission.queue_seconds_total if admission else None)
+metrics.callback("ids_admission_inflight", "Scoring requests being handled", "gauge",
+                 lambda: admission.inflight if admission else None)
+metrics.callback("ids_admission_queue_depth", "Scoring requests waiting for a slot", "gauge",
+                 lambda: len(admission._waiters) if admission else None)
+metrics.callback("ids_store_rows_total", "Prediction rows by store outcome", "counter",
+                 lambda: {("written",): store.rows_written, ("dropped",): store.rows_dropped}
+                 if store else None, ("result",))
+metrics.callback("ids_store_pending_rows", "Prediction rows buffered, not yet written", "gauge",
+                 lambda: store.pending if store else None)
+metrics.callback("ids_store_flushes_total", "Batches written to the prediction store", "counter",
+                 lambda: store.flushes if store else None)
+metrics.callback("ids_store_flush_seconds_total", "Seconds spent writing prediction batches", "counter",
+                 lambda: store.flush_seconds_total if store else None)
+metrics.callback("ids_debug_log_suppressed_total", "Debug lines dropped by the rate limit",
+                 "counter", lambda: debug_log.suppressed)
+
+
+@app.get("/metrics", tags=["Health"])
+def metrics_endpoint():
+    """Prometheus text exposition of request, stage and model metrics."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # 5️⃣ Test endpoint
 
 @app.get("/test-prediction", response_model=PredictResponse, tags=["Testing"])
 def test_prediction():
-    if not model_loaded:
+    live = registry.live
+    if live is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
 
-    # Create test data with the expected features
-    test_data = pd.DataFrame({
-        'proto': [0.0],
-        'dur': [0.0],
-        'state': [0.0],
-        'smean': [0.0],
-        'sttl': [0.0],
-        'dpkts': [0.0],
-        'ackdat': [0.0],
-        'synack': [0.0],
-        'response_body_len': [0.0],
-        'djit': [0.0]
-    })
+    # All-zero row with the expected features
+    test_data = np.zeros((1, len(TOP_FEATS)), dtype=np.float64)
     
     try:
-        prob = float(pipeline.predict_proba(test_data)[0][1])
-        pred = int(prob >= threshold)
+        prob = float(live.model.score(test_data)[0])
+        pred = int(prob >= live.threshold)
         return PredictResponse(prediction=pred, probability=prob, message="Test OK")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Test inference error: {str(e)}")
 
-# Alternative endpoint for list-based features (for backward compatibility)
-@app.post("/predict-legacy", response_model=PredictResponse, tags=["Prediction"]) 
-async def predict_legacy(request: Request):
-    if not model_loaded:
+async def predict_records(request: Request, live: ModelVersion, timer):
+    """Packed float32 rows in, scored as one batch (see wire_format.py)."""
+    body = await request.body()
+    timer.mark("parse")
+    try:
+        matrix = decode_rows(body)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=422,
+            content={"status": "error", "message": str(e)}
+        )
+    if len(matrix) > MAX_BATCH_ROWS:
+        return JSONResponse(
+            status_code=413,
+            content={"status": "error", "message": f"Batch of {len(matrix)} rows exceeds limit of {MAX_BATCH_ROWS}"}
+        )
+    # Packed floats carry NaN/inf straight through, and the engines disagree on them
+    finite = np.isfinite(matrix).all(axis=1)
+    if not finite.all():
         return JSONResponse(
-            status_code=503,
-            content={"status": "error", "message": "Model not loaded"}
+            status_code=422,
+            content={"status": "error",
+                     "message": f"Non-finite feature values in row(s) {np.flatnonzero(~finite)[:10].tolist()}"}
         )
+    timer.mark("features")
+
+    try:
+        if len(matrix) == 1:
+            # A lone row may still be coalesced with concurrent single-row calls
+            probs = np.array([await score_row(matrix, live)])
+        else:
+            probs = await score_matrix_cached(matrix, live)
+        timer.mark("predict")
+        preds = probs >= live.threshold
+        timer.mark("threshold")
+        persist(matrix, probs, preds, "/predict-legacy", live)
+    except Exception as e:
+        print(f"Model prediction error: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"Model prediction error: {str(e)}"}
+        )
+
+    if reply_binary(request.headers.get("content-type"), request.headers.get("accept")):
+        return Response(encode_results(probs, preds), media_type=RECORDS_TYPE)
+    # Same shape as /predict-batch; bypasses the route's single-row response_model
+    return JSONResponse(content={
+        "predictions": preds.astype(int).tolist(),
+        "probabilities": probs.tolist(),
+        "count": len(matrix),
+        "status": "success",
+        "message": "Prediction successful",
+    })
+
+
+# Alternative endpoint for list-based features (for backward compatibility).
+# Also takes packed float32 rows (Content-Type: application/x-ids-records)
+@app.post("/predict-legacy", response_model=PredictResponse, tags=["Prediction"]) 
+async def predict_legacy(request: Request):
+    live = registry.live
+    if live is None:
+        return model_unavailable()
         
+    timer = stage_timer(request)
+    if is_binary(request.headers.get("content-type")):
+        return await predict_records(request, live, timer)
     try:
         # Parse the request body manually
         body = await request.json()
-        print("Request body:", body)  # Debugging line
+        debug_log("Request body:", body)
         
         # Handle both "features" array or direct object format
         if "features" in body:
@@ -204,34 +881,29 @@ async def predict_legacy(request: Request):
                     status_code=422,
                     content={"status": "error", "message": f"Invalid request format: {str(e)}"}
                 )
-                
-        # Create DataFrame from the request
-        input_data = pd.DataFrame({
-            'proto': [req.proto],
-            'dur': [req.dur],
-            'state': [req.state],
-            'smean': [req.smean],
-            'sttl': [req.sttl],
-            'dpkts': [req.dpkts],
-            'ackdat': [req.ackdat],
-            'synack': [req.synack],
-            'response_body_len': [req.response_body_len],
-            'djit': [req.djit]
-        })
+        timer.mark("parse")
+
+        input_data = request_row(req)
+        timer.mark("features")
         
         # Add additional error handling for model prediction
         try:
-            # Make prediction using the pipeline
-            prob = float(pipeline.predict_proba(input_data)[0][1])
-            pred = int(prob >= threshold)
+            # Make prediction using the pipeline, off the event loop
+            prob = await score_row(input_data, live)
+            timer.mark("predict")
+            pred = int(prob >= live.threshold)
+            timer.mark("threshold")
+            persist(input_data, np.array([prob]), np.array([pred]), "/predict-legacy", live)
         except Exception as model_error:
             print(f"Model prediction error: {str(model_error)}")
-            print(f"Input data: {input_data}")
+            debug_log(f"Input data: {input_data}")
             return JSONResponse(
                 status_code=500,
                 content={"status": "error", "message": f"Model prediction error: {str(model_error)}"}
             )
-            
+
+        if reply_binary(request.headers.get("content-type"), request.headers.get("accept")):
+            return Response(encode_results(np.array([prob]), np.array([pred])), media_type=RECORDS_TYPE)
         return PredictResponse(
             prediction=pred,
             probability=prob,
@@ -250,32 +922,22 @@ async def predict_legacy(request: Request):
 # 6️⃣ Main prediction
 
 @app.post("/predict", response_model=PredictResponse, tags=["Prediction"])
-async def predict(req: PredictRequest):
-    if not model_loaded:
-        return JSONResponse(
-            status_code=503,
-            content={"status": "error", "message": "Model not loaded"}
-        )
+async def predict(req: PredictRequest, request: Request):
+    live = registry.live
+    if live is None:
+        return model_unavailable()
 
+    # Body was parsed and validated before the handler was called
+    timer = stage_timer(request)
+    timer.mark("parse")
     try:
-        # Convert request to DataFrame with expected column names 
-        # (needed for the pipeline's ColumnTransformer)
-        input_data = pd.DataFrame({
-            'proto': [req.proto],
-            'dur': [req.dur],
-            'state': [req.state],
-            'smean': [req.smean],
-            'sttl': [req.sttl],
-            'dpkts': [req.dpkts],
-            'ackdat': [req.ackdat],
-            'synack': [req.synack],
-            'response_body_len': [req.response_body_len],
-            'djit': [req.djit]
-        })
-        
-        # Use the pipeline for prediction
-        prob = float(pipeline.predict_proba(input_data)[0][1])
-        pred = int(prob >= threshold)
+        row = request_row(req)
+        timer.mark("features")
+        prob = await score_row(row, live)
+        timer.mark("predict")
+        pred = int(prob >= live.threshold)
+        timer.mark("threshold")
+        persist(row, np.array([prob]), np.array([pred]), "/predict", live)
         
         return PredictResponse(
             prediction=pred,
@@ -285,23 +947,58 @@ async def predict(req: PredictRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Inference error: {str(e)}")
 
+# 7️⃣ Batch prediction
 
-TEST_CSV  = os.path.join(BASE_DIR, "UNSW_NB15_testing_cleaned.csv")
+@app.post("/predict-batch", response_model=PredictBatchResponse, tags=["Prediction"])
+async def predict_batch(req: PredictBatchRequest, request: Request):
+    live = registry.live
+    if live is None:
+        return model_unavailable()
 
-if not os.path.exists(TEST_CSV):
-    raise RuntimeError(f"Test CSV not found at {TEST_CSV}")
+    timer = stage_timer(request)
+    timer.mark("parse")
+
+    n_rows = len(req.rows) + len(req.features)
+    if n_rows == 0:
+        return JSONResponse(
+            status_code=422,
+            content={"status": "error", "message": "Expected at least one row or feature vector"}
+        )
+    if n_rows > MAX_BATCH_ROWS:
+        return JSONResponse(
+            status_code=413,
+            content={"status": "error", "message": f"Batch of {n_rows} rows exceeds limit of {MAX_BATCH_ROWS}"}
+        )
+
+    try:
+        matrix = req.to_matrix()
+    except ValueError as e:
+        return JSONResponse(
+            status_code=422,
+            content={"status": "error", "message": str(e)}
+        )
+    timer.mark("features")
 
-_df_test = pd.read_csv(TEST_CSV)
-_attack_rows = _df_test[_df_test['label']==1]
+    try:
+        probs = await score_matrix_cached(matrix, live)
+        timer.mark("predict")
+        preds = (probs >= live.threshold).astype(int)
+        timer.mark("threshold")
+        persist(matrix, probs, preds, "/predict-batch", live)
+        return PredictBatchResponse(
+            predictions=preds.tolist(),
+            probabilities=probs.tolist(),
+            count=n_rows,
+            message="Prediction successful"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Inference error: {str(e)}")
 
-if _attack_rows.empty:
-    raise RuntimeError("No attack rows found in test CSV")
 
+TEST_CSV  = os.path.join(BASE_DIR, "UNSW_NB15_testing_cleaned.csv")
 
-TOP_FEATS = [
-    'proto','dur','state','smean','sttl',
-    'dpkts','ackdat','synack','response_body_len','djit'
-]
+# Opened (and the sidecar built, if missing or stale) on first use only
+samples = SampleStore(TEST_CSV)
 
 
 @app.get("/sample-attack", tags=["Testing"])
@@ -310,13 +1007,53 @@ def sample_attack():
     Returns a single random attack sample's feature vector.
     """
     try:
-        # Pick one row from the pre-filtered attacks
-        row = _attack_rows.sample(n=1).iloc[0]
-        # Extract only the PCA-selected features in the exact same order
-        feats = [float(row[f]) for f in TOP_FEATS]
-        return {"features": feats}
+        # Random index into the memory-mapped attack rows, in TOP_FEATS order
+        return {"features": samples.sample_attack()}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         # Log to console so you can see the real error
         print("❌ /sample-attack error:", e)
         # Return a 500 with the error message
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# 8️⃣ Dashboard queries (pre-aggregated rollups from the prediction store)
+
+def store_unavailable() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"status": "error", "message": "Prediction store disabled"}
+    )
+
+
+@app.get("/predictions/rollup", tags=["Dashboard"])
+def predictions_rollup(start: Optional[float] = None, end: Optional[float] = None, step: int = 3600,
+                       by: Optional[str] = None, route: Optional[str] = None):
+    """
+    Normal/attack counts per time bucket (default: hourly over the last
+    24 hours), optionally broken down by route, proto or state.
+    Times are Unix seconds.
+    """
+    if store is None:
+        return store_unavailable()
+    end = time.time() if end is None else end
+    start = end - 86400 if start is None else start
+    try:
+        return store.rollup(start, end, step, by, route)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=422,
+            content={"status": "error", "message": str(e)}
+        )
+
+
+@app.get("/predictions/recent", tags=["Dashboard"])
+def predictions_recent(limit: int = 100, attacks_only: bool = False, since: Optional[float] = None):
+    """
+    Newest scored rows first, with their features, for the traffic log.
+    """
+    if store is None:
+        return store_unavailable()
+    rows = store.recent(min(limit, 1000), attacks_only, since)
+    return {"count": len(rows), "rows": rows}
@@ -0,0 +1,338 @@
+"""
+Load test and latency benchmark for the IDS API.
+
+Drives /predict, /predict-legacy and /sample-attack with a configurable
+request mix and concurrency, then writes req/s, p50/p95/p99 latency and
+peak RSS to a JSON report that can be diffed between commits.
+
+Targets:
+- default:   the app in this process, over an in-memory ASGI transport
+             (no sockets; client and server share one event loop)
+- --spawn:   `uvicorn app:app` started locally on a free port
+- --url URL: an already running server
+
+Payload rows come from UNSW_NB15_testing_cleaned.csv when it exists,
+otherwise from synthetic rows. If ids_pipeline.pkl is missing (or with
+--stand-in) a small random forest with the same pipeline shape is fitted
+into a temporary model directory, so the benchmark runs on a fresh
+checkout without network access.
+
+    python bench.py --requests 5000 --concurrency 32 --out bench.json
+    python bench.py --mix predict=1 --env IDS_ENGINE=compiled --compare bench.json
+"""
+from typing import Any, Dict, List, Optional
+import argparse, asyncio, json, os, platform, random, resource, shutil
+import socket, subprocess, sys, tempfile, time
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(os.path.dirname(HERE))
+DEFAULT_CSV = os.path.join(BASE_DIR, "UNSW_NB15_testing_cleaned.csv")
+DEFAULT_PIPELINE = os.path.join(BASE_DIR, "ids_pipeline.pkl")
+
+ENDPOINTS = ("predict", "predict-legacy", "sample-attack")
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}, expected one of {ENDPOINTS}")
+        mix[name] = float(weight or 1)
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("mix weights must sum to more than 0")
+    return mix
+
+
+def load_rows(csv_path: str, limit: int, seed: int) -> np.ndarray:
+    """Feature rows to send, in TOP_FEATS order."""
+    from inference import TOP_FEATS, probe_matrix
+    if csv_path and os.path.exists(csv_path):
+        import pandas as pd
+        frame = pd.read_csv(csv_path, usecols=TOP_FEATS, nrows=limit or None)
+        return frame[TOP_FEATS].to_numpy(dtype=np.float64)
+    return probe_matrix(limit or 2048, seed)
+
+
+def build_stand_in(model_dir: str, csv_path: str, seed: int, rows: int = 5000,
+                   n_estimators: int = 20, max_depth: Optional[int] = 8):
+    """
+    Fit a small forest with the production pipeline's shape (column
+    selection -> RandomForest) and write it plus a threshold and a sample
+    CSV into `model_dir`.
+    """
+    import joblib, pandas as pd
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.pipeline import Pipeline
+    from inference import TOP_FEATS
+
+    rows = load_rows(csv_path, rows, seed)
+    if csv_path and os.path.exists(csv_path):
+        labels = pd.read_csv(csv_path, usecols=["label"], nrows=len(rows))["label"].to_numpy()
+    else:
+        # Synthetic rule: long-lived, high-TTL flows are "attacks"
+        rng = np.random.default_rng(seed)
+        score = (rows[:, TOP_FEATS.index("sttl")] > 100) ^ (rng.random(len(rows)) < 0.1)
+        labels = score.astype(int)
+    frame = pd.DataFrame(rows, columns=TOP_FEATS)
+    pipeline = Pipeline([
+        ("select", ColumnTransformer([("select", "passthrough", TOP_FEATS)], remainder="drop")),
+        ("rf", RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth,
+                                      n_jobs=1, random_state=seed)),
+    ])
+    pipeline.fit(frame, labels)
+    joblib.dump(pipeline, os.path.join(model_dir, "ids_pipeline.pkl"))
+    with open(os.path.join(model_dir, "threshold.json"), "w") as f:
+        json.dump({"threshold": 0.5}, f)
+    frame.assign(label=labels).to_csv(os.path.join(model_dir, "UNSW_NB15_testing_cleaned.csv"), index=False)
+
+
+def build_plan(rows: np.ndarray, mix: Dict[str, float], n: int, seed: int) -> List[tuple]:
+    """Pre-encoded (endpoint, method, path, body) requests, so timing excludes payload building."""
+    from inference import TOP_FEATS
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[k] for k in names]
+    plan = []
+    for _ in range(n):
+        name = rng.choices(names, weights)[0]
+        row = rows[rng.randrange(len(rows))].tolist()
+        if name == "predict":
+            body = json.dumps(dict(zip(TOP_FEATS, row))).encode()
+            plan.append((name, "POST", "/predict", body))
+        elif name == "predict-legacy":
+            plan.append((name, "POST", "/predict-legacy", json.dumps({"features": row}).encode()))
+        else:
+            plan.append((name, "GET", "/sample-attack", None))
+    return plan
+
+
+def summarize(latencies: List[float], errors: int, seconds: float) -> Dict[str, Any]:
+    resp: Dict[str, Any] = {"requests": len(latencies) + errors, "errors": errors,
+                            "rps": (len(latencies) + errors) / seconds if seconds > 0 else 0.0}
+    if latencies:
+        ms = np.array(latencies) * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        resp["latency_ms"] = {"p50": float(p50), "p95": float(p95), "p99": float(p99),
+                              "mean": float(ms.mean()), "max": float(ms.max())}
+    return resp
+
+
+async def drive(client, plan: List[tuple], concurrency: int) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {name: [] for name, *_ in plan}
+    errors: Dict[str, int] = {name: 0 for name in latencies}
+    first_error: Dict[str, str] = {}
+    it = iter(plan)
+    headers = {"content-type": "application/json"}
+
+    async def worker():
+        for name, method, path, body in it:
+            started = time.perf_counter()
+            try:
+                r = await client.request(method, path, content=body, headers=headers)
+                ok = r.status_code == 200
+                detail = f"HTTP {r.status_code}: {r.text[:200]}"
+            except Exception as e:
+                ok, detail = False, f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - started
+            if ok:
+                latencies[name].append(elapsed)
+            else:
+                errors[name] += 1
+                first_error.setdefault(name, detail)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    seconds = time.perf_counter() - started
+
+    report = summarize([x for v in latencies.values() for x in v], sum(errors.values()), seconds)
+    report["seconds"] = seconds
+    report["endpoints"] = {name: summarize(latencies[name], errors[name], seconds) for name in latencies}
+    if first_error:
+        report["first_error"] = first_error
+    return report
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def peak_rss_kb(pid: int) -> Optional[int]:
+    """Peak resident set (VmHWM) of a live process, Linux only."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+async def run_in_process(plan, warmup, concurrency) -> Dict[str, Any]:
+    import httpx
+    import app as api
+    # ASGITransport does not run lifespan events
+    await api.start_inference()
+    try:
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await drive(client, warmup, concurrency)
+            report = await drive(client, plan, concurrency)
+            report["server_health"] = (await client.get("/")).json()
+    finally:
+        await api.stop_inference()
+    return report
+
+
+async def run_http(url: str, plan, warmup, concurrency) -> Dict[str, Any]:
+    import httpx
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        await drive(client, warmup, concurrency)
+        report = await drive(client, plan, concurrency)
+        report["server_health"] = (await client.get("/")).json()
+    return report
+
+
+def spawn_server(env: Dict[str, str], timeout: float = 120.0):
+    import httpx
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env={**os.environ, **env},
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            httpx.get(url + "/", timeout=1.0)
+            return proc, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"server did not answer on {url} within {timeout:.0f}s")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(report: Dict[str, Any], baseline_path: str):
+    with open(baseline_path) as f:
+        base = json.load(f)
+    print(f"vs {baseline_path} ({base['meta'].get('commit')}):")
+    rows = [("rps", report["rps"], base["rps"])]
+    for q in ("p50", "p95", "p99"):
+        if "latency_ms" in report and "latency_ms" in base:
+            rows.append((f"{q}_ms", report["latency_ms"][q], base["latency_ms"][q]))
+    for name, new, old in rows:
+        change = (new - old) / old * 100.0 if old else 0.0
+        print(f"  {name:8s} {old:10.3f} -> {new:10.3f} ({change:+.1f}%)")
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the IDS API")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--spawn", action="store_true", help="start uvicorn locally and benchmark over HTTP")
+    target.add_argument("--url", help="benchmark an already running server")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("predict=0.8,predict-legacy=0.15,sample-attack=0.05"),
+                        help="endpoint weights, e.g. predict=0.8,predict-legacy=0.2")
+    parser.add_argument("--csv", default=DEFAULT_CSV, help="payload rows (synthetic if missing)")
+    parser.add_argument("--rows", type=int, default=20000, help="payload rows read from the CSV (0 = all)")
+    parser.add_argument("--stand-in", action="store_true", help="use a small fitted stand-in model")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="app setting for this run (e.g. IDS_ENGINE=compiled)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--compare", help="earlier report to print deltas against")
+    args = parser.parse_args(argv)
+    sys.path.insert(0, HERE)
+
+    env = dict(kv.split("=", 1) for kv in args.env)
+    # Benchmarks should not pick up a model file changing underneath them
+    env.setdefault("IDS_AUTO_RELOAD", "0")
+    stand_in_dir = None
+    if not args.url and (args.stand_in or not os.path.exists(DEFAULT_PIPELINE)):
+        stand_in_dir = tempfile.mkdtemp(prefix="ids-bench-")
+        build_stand_in(stand_in_dir, args.csv, args.seed)
+        env["IDS_MODEL_DIR"] = stand_in_dir
+        print(f"ℹ️ Using stand-in model in {stand_in_dir}")
+
+    rows = load_rows(args.csv, args.rows, args.seed)
+    plan = build_plan(rows, args.mix, args.requests, args.seed)
+    warmup = build_plan(rows, args.mix, args.warmup, args.seed + 1)
+
+    server_rss = None
+    try:
+        if args.url:
+            report = asyncio.run(run_http(args.url, plan, warmup, args.concurrency))
+        elif args.spawn:
+            proc, url = spawn_server(env)
+            try:
+                report = asyncio.run(run_http(url, plan, warmup, args.concurrency))
+                server_rss = peak_rss_kb(proc.pid)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+        else:
+            os.environ.update(env)
+            report = asyncio.run(run_in_process(plan, warmup, args.concurrency))
+    finally:
+        if stand_in_dir:
+            shutil.rmtree(stand_in_dir, ignore_errors=True)
+
+    # ru_maxrss is KiB on Linux; children covers process-mode workers after shutdown
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    report["peak_rss_mb"] = {
+        "bench_process": self_rss / 1024.0,
+        "largest_child": child_rss / 1024.0,
+        "server": server_rss / 1024.0 if server_rss else None,
+    }
+    report["meta"] = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "target": args.url or ("spawn" if args.spawn else "in-process"),
+        "stand_in_model": stand_in_dir is not None,
+        "payload_source": args.csv if os.path.exists(args.csv) else "synthetic",
+        "payload_rows": int(len(rows)),
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "env": env,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    lat = report.get("latency_ms", {})
+    print(f"✔ {report['requests']} requests ({report['errors']} errors) at {report['rps']:.0f} req/s, "
+          f"p50 {lat.get('p50', 0):.2f} ms, p95 {lat.get('p95', 0):.2f} ms, p99 {lat.get('p99', 0):.2f} ms "
+          f"-> {args.out}")
+    if args.compare:
+        compare(report, args.compare)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+Two-stage cascade: a linear pre-filter in front of the forest.
+
+Stage one is a logistic model over the 10 TOP_FEATS:
+- numeric features go through sign(x) * log1p(|x|), because the byte,
+  size and timing features are heavy-tailed, and are then standardized
+- the category codes proto, state and sttl get one weight per value
+Scoring a batch costs one matrix-vector product plus three table
+lookups. Rows whose stage-one probability is at or below `low`, or at or
+above `high`, are answered with that probability. Only the uncertain
+band in between goes to the forest.
+
+The cut-offs satisfy low < threshold <= high, so an answered row's
+probability is always on the same side of the decision threshold as
+its stage-one verdict.
+
+The model and cut-offs are fitted offline, with no sklearn at serving
+time, and written to cascade.json next to the pipeline:
+- the linear model is fitted on part of the labelled CSV to reproduce
+  the forest's decisions (distillation), not the labels
+- the cut-offs are chosen on the held-out rest as the widest band edges
+  whose added misses stay within a budget:
+    - low: forest-flagged rows answered "benign", at most
+      --max-recall-loss of all forest-flagged rows
+    - high: forest-cleared rows answered "attack", at most
+      --max-fp-increase of all forest-cleared rows
+- the report, measured on the held-out rows, covers the fraction that
+  reaches stage two, recall/precision against the labels for the
+  forest alone and for the cascade, and throughput on all rows and on
+  normal traffic (label 0) only, per batch size (--batch: 64, the API's
+  micro-batch, and 1024, a /predict-batch call)
+
+A batch with any uncertain row still pays the forest's fixed per-call
+cost. The cascade therefore gains the most on large batches, and with
+a per-row-expensive forest or the compiled engine.
+
+logreg_small.joblib (and model_logreg.js) take the 42-column feature
+set, which the API does not receive, so stage one is fitted here on
+TOP_FEATS instead.
+
+Serve with IDS_CASCADE=1. It is only used while threshold.json still
+holds the threshold the cut-offs were calibrated for.
+
+    python cascade.py --pipeline ../../ids_pipeline.pkl --csv ../../UNSW_NB15_testing_cleaned.csv
+"""
+from typing import Any, Dict, Optional
+import argparse, json, os, sys, threading, time
+import numpy as np
+from inference import TOP_FEATS
+
+CASCADE_FORMAT = 1
+
+
+def cascade_path(pipeline_file: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(pipeline_file)), "cascade.json")
+
+
+# Category codes get one weight per value rather than a slope. sttl is a
+# small set of initial-TTL / hop-count values, not a magnitude
+CATEGORICAL = ("proto", "state", "sttl")
+
+
+def _signed_log1p(matrix: np.ndarray) -> np.ndarray:
+    return np.sign(matrix) * np.log1p(np.abs(matrix))
+
+
+class LinearStage:
+    """
+    Logistic model: standardized signed-log1p numeric features plus a
+    per-value weight for each categorical feature (unseen values weigh 0).
+    """
+
+    def __init__(self, numeric: Dict[str, Any], categorical: Dict[str, Dict[str, list]], intercept: float):
+        self.numeric_idx = np.array([TOP_FEATS.index(f) for f in numeric["features"]], dtype=np.intp)
+        mean, scale = np.asarray(numeric["mean"]), np.asarray(numeric["scale"])
+        # Fold the standardization into the weights: one product per batch
+        self.weights = np.asarray(numeric["coef"], dtype=np.float64) / scale
+        self.bias = float(intercept) - float(np.dot(self.weights, mean))
+        self.tables = [(TOP_FEATS.index(f), np.asarray(t["values"], dtype=np.float64),
+                        np.asarray(t["weights"], dtype=np.float64)) for f, t in categorical.items()]
+        self.numeric, self.categorical, self.intercept = numeric, categorical, float(intercept)
+
+    @classmethod
+    def fit(cls, matrix: np.ndarray, target: np.ndarray, categorical=CATEGORICAL, min_count: int = 5,
+            C: float = 10.0, seed: int = 0) -> "LinearStage":
+        from sklearn.linear_model import LogisticRegression
+        numeric = [f for f in TOP_FEATS if f not in categorical]
+        z = _signed_log1p(matrix[:, [TOP_FEATS.index(f) for f in numeric]])
+        mean, scale = z.mean(axis=0), z.std(axis=0)
+        scale[scale == 0.0] = 1.0
+        blocks, levels = [(z - mean) / scale], {}
+        for f in categorical:
+            col = matrix[:, TOP_FEATS.index(f)]
+            values, counts = np.unique(col, return_counts=True)
+            # Rare values get no weight of their own
+            levels[f] = values[counts >= min_count]
+            blocks.append((col[:, None] == levels[f][None, :]).astype(np.float64))
+        lr = LogisticRegression(C=C, max_iter=5000, random_state=seed)
+        lr.fit(np.hstack(blocks), target)
+        coef, at = lr.coef_[0], len(numeric)
+        tables = {}
+        for f in categorical:
+            n = len(levels[f])
+            tables[f] = {"values": levels[f].tolist(), "weights": coef[at:at + n].tolist()}
+            at += n
+        return cls({"features": numeric, "mean": mean.tolist(), "scale": scale.tolist(),
+                    "coef": coef[:len(numeric)].tolist()}, tables, lr.intercept_[0])
+
+    def probability(self, matrix: np.ndarray) -> np.ndarray:
+        logit = _signed_log1p(matrix[:, self.numeric_idx]) @ self.weights + self.bias
+        for col, values, weights in self.tables:
+            if not len(values):
+                continue
+            x = matrix[:, col]
+            at = np.minimum(np.searchsorted(values, x), len(values) - 1)
+            logit += np.where(values[at] == x, weights[at], 0.0)
+        return 1.0 / (1.0 + np.exp(-np.clip(logit, -500.0, 500.0)))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"numeric": self.numeric, "categorical": self.categorical, "intercept": self.intercept}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "LinearStage":
+        return cls(data["numeric"], data["categorical"], data["intercept"])
+
+
+class CascadeModel:
+    """
+    Wraps a LoadedModel: scores with the linear stage and sends only the
+    uncertain band to it. Duck-types LoadedModel (score, pipeline,
+    fast_status); the live stage-two share is reported in
+    fast_status["cascade"].
+    """
+
+    def __init__(self, inner, stage: LinearStage, low: float, high: float, threshold: float):
+        if not low < threshold <= high:
+            raise ValueError(f"cut-offs must satisfy low < threshold <= high, got {low}, {threshold}, {high}")
+        self.inner = inner
+        self.stage = stage
+        self.low = low
+        self.high = high
+        self.pipeline = inner.pipeline
+        self._lock = threading.Lock()
+        self.fast_status = dict(inner.fast_status)
+        self.fast_status["cascade"] = self._status = {"low": low, "high": high, "threshold": threshold,
+                                                      "rows": 0, "stage_two_rows": 0}
+
+    def score(self, matrix: np.ndarray) -> np.ndarray:
+        matrix = np.ascontiguousarray(matrix, dtype=np.float64)
+        probs = self.stage.probability(matrix)
+        uncertain = np.flatnonzero((probs > self.low) & (probs < self.high))
+        if len(uncertain):
+            probs[uncertain] = self.inner.score(matrix[uncertain])
+        with self._lock:
+            self._status["rows"] += len(matrix)
+            self._status["stage_two_rows"] += len(uncertain)
+        return probs
+
+
+def load_cascade(inner, pipeline_file: str, threshold: float):
+    """`inner` wrapped in the calibrated cascade, or `inner` (with the reason) if it cannot be used."""
+    path = cascade_path(pipeline_file)
+    reason = None
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("format") != CASCADE_FORMAT or data.get("features") != TOP_FEATS:
+            reason = f"{os.path.basename(path)} was written for a different feature set or format"
+        elif abs(data["threshold"] - threshold) > 1e-12:
+            reason = f"calibrated for threshold {data['threshold']}, live threshold is {threshold}"
+        else:
+            return CascadeModel(inner, LinearStage.from_json(data["stage"]),
+                                data["low"], data["high"], threshold)
+    except (OSError, ValueError, KeyError) as e:
+        reason = f"{type(e).__name__}: {e}"
+    print(f"⚠️ Cascade disabled: {reason}")
+    inner.fast_status["cascade"] = {"enabled": False, "reason": reason}
+    return inner
+
+
+# ---- offline calibration ----
+
+def choose_cutoffs(probs: np.ndarray, forest_positive: np.ndarray, threshold: float,
+                   max_recall_loss: float, max_fp_increase: float):
+    """Widest (low, high) whose short-circuited rows disagree with the forest within budget."""
+    n_pos = max(int(forest_positive.sum()), 1)
+    n_neg = max(int((~forest_positive).sum()), 1)
+    order = np.argsort(probs, kind="stable")
+    p_sorted, pos_sorted = probs[order], forest_positive[order]
+
+    # low: walk up from the bottom while the forest-flagged rows passed over stay within budget
+    missed = np.cumsum(pos_sorted)
+    ok = (missed <= max_recall_loss * n_pos) & (p_sorted < threshold)
+    # Rows tied with a cut-off are short-circuited too, so stop before a tie crosses the budget
+    low = 0.0
+    for i in np.flatnonzero(ok)[::-1]:
+        if i + 1 == len(p_sorted) or p_sorted[i + 1] > p_sorted[i]:
+            low = float(p_sorted[i])
+            break
+
+    # high: walk down from the top while the forest-cleared rows passed over stay within budget
+    false_alarms = np.cumsum((~pos_sorted)[::-1])
+    top = p_sorted[::-1]
+    ok = (false_alarms <= max_fp_increase * n_neg) & (top >= threshold)
+    high = 1.0 + 1e-9
+    for i in np.flatnonzero(ok)[::-1]:
+        if i + 1 == len(top) or top[i + 1] < top[i]:
+            high = float(top[i])
+            break
+    return low, high
+
+
+def _rates(pred: np.ndarray, labels: np.ndarray) -> Dict[str, float]:
+    tp = int(np.sum(pred & (labels == 1)))
+    fp = int(np.sum(pred & (labels == 0)))
+    fn = int(np.sum(~pred & (labels == 1)))
+    return {"recall": tp / max(tp + fn, 1), "precision": tp / max(tp + fp, 1), "false_positives": fp}
+
+
+def _throughput(score, matrix: np.ndarray, batch: int, repeat: int = 3) -> float:
+    """Rows/s scoring `matrix` in chunks of `batch` rows."""
+    chunks = [matrix[i:i + batch] for i in range(0, len(matrix), batch)]
+    score(chunks[0])
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for chunk in chunks:
+            score(chunk)
+    return repeat * len(matrix) / (time.perf_counter() - started)
+
+
+def calibrate(pipeline_file: str, csv_path: str, threshold: float, max_recall_loss: float = 0.01,
+              max_fp_increase: float = 0.01, fit_fraction: float = 0.5, model_options=None,
+              batches=(64, 1024), seed: int = 0) -> Dict[str, Any]:
+    import pandas as pd
+    from inference import load_model
+    frame = pd.read_csv(csv_path, usecols=TOP_FEATS + ["label"])
+    matrix = frame[TOP_FEATS].to_numpy(dtype=np.float64)
+    labels = frame["label"].to_numpy().astype(int)
+    _, forest = load_model(pipeline_file, **(model_options or {}))
+    forest_probs = forest.score(matrix)
+    forest_positive = forest_probs >= threshold
+
+    rng = np.random.default_rng(seed)
+    fit_rows = rng.random(len(matrix)) < fit_fraction
+    hold = ~fit_rows
+    stage = LinearStage.fit(matrix[fit_rows], forest_positive[fit_rows].astype(int), seed=seed)
+    probs = stage.probability(matrix[hold])
+    low, high = choose_cutoffs(probs, forest_positive[hold], threshold, max_recall_loss, max_fp_increase)
+
+    cascade = CascadeModel(forest, stage, low, high, threshold)
+    cascade_probs = cascade.score(matrix[hold])
+    normal = matrix[hold][labels[hold] == 0]
+    forest_only = _rates(forest_positive[hold], labels[hold])
+    with_cascade = _rates(cascade_probs >= threshold, labels[hold])
+    stage_two = (probs > low) & (probs < high)
+    normal_stage_two = stage_two[labels[hold] == 0]
+    report = {
+        "rows": int(hold.sum()),
+        "fit_rows": int(fit_rows.sum()),
+        "stage_two_fraction": float(stage_two.mean()),
+        "stage_two_fraction_normal": float(normal_stage_two.mean()) if len(normal_stage_two) else None,
+        "forest_only": forest_only,
+        "cascade": with_cascade,
+        "recall_cost": forest_only["recall"] - with_cascade["recall"],
+        "agreement_with_forest": float(np.mean((cascade_probs >= threshold) == forest_positive[hold])),
+        "rows_per_second": {str(batch): {
+            "forest_all": _throughput(forest.score, matrix[hold], batch),
+            "cascade_all": _throughput(cascade.score, matrix[hold], batch),
+            "forest_normal": _throughput(forest.score, normal, batch) if len(normal) else None,
+            "cascade_normal": _throughput(cascade.score, normal, batch) if len(normal) else None,
+        } for batch in batches},
+    }
+    return {
+        "format": CASCADE_FORMAT,
+        "features": TOP_FEATS,
+        "threshold": threshold,
+        "low": low,
+        "high": high,
+        "budgets": {"max_recall_loss": max_recall_loss, "max_fp_increase": max_fp_increase},
+        "stage": stage.to_json(),
+        "pipeline": os.path.basename(pipeline_file),
+        "calibration_csv": os.path.basename(csv_path),
+        "report": report,
+    }
+
+
+def main(argv: Optional[list] = None) -> int:
+    base = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser = argparse.ArgumentParser(description="Fit and calibrate the linear pre-filter")
+    parser.add_argument("--pipeline", default=os.path.join(base, "ids_pipeline.pkl"))
+    parser.add_argument("--csv", default=os.path.join(base, "UNSW_NB15_testing_cleaned.csv"))
+    parser.add_argument("--threshold-file", help="default: threshold.json next to the pipeline")
+    parser.add_argument("--max-recall-loss", type=float, default=0.01,
+                        help="share of forest-flagged rows stage one may answer as benign")
+    parser.add_argument("--max-fp-increase", type=float, default=0.01,
+                        help="share of forest-cleared rows stage one may answer as attacks")
+    parser.add_argument("--fit-fraction", type=float, default=0.5)
+    parser.add_argument("--engine", default="sklearn", help="forest engine used while calibrating")
+    parser.add_argument("--batch", type=int, nargs="+", default=[64, 1024],
+                        help="rows per call in the throughput report")
+    parser.add_argument("--out", help="default: cascade.json next to the pipeline")
+    args = parser.parse_args(argv)
+
+    threshold_file = args.threshold_file or os.path.join(os.path.dirname(os.path.abspath(args.pipeline)),
+                                                         "threshold.json")
+    with open(threshold_file) as f:
+        threshold = float(json.load(f)["threshold"])
+    result = calibrate(args.pipeline, args.csv, threshold, args.max_recall_loss, args.max_fp_increase,
+                       args.fit_fraction, {"engine": args.engine}, args.batch)
+    out = args.out or cascade_path(args.pipeline)
+    with open(out + ".tmp", "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(out + ".tmp", out)
+    report = result["report"]
+    print(json.dumps(report, indent=2))
+    speedups = ", ".join(f"{r['cascade_normal'] / r['forest_normal']:.1f}x at batch {b}"
+                         for b, r in report["rows_per_second"].items() if r["forest_normal"])
+    print(f"✔ low={result['low']:.4f} high={result['high']:.4f}: {report['stage_two_fraction']:.1%} of rows "
+          f"({report['stage_two_fraction_normal']:.1%} of normal) reach the forest, recall cost "
+          f"{report['recall_cost']:+.4f}; normal traffic {speedups} -> {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
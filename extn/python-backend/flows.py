@@ -0,0 +1,621 @@
+"""
+Flow feature extractor: pcap/pcapng files or streams -> scoring batches.
+
+This replaces `tshark -V` plus text parsing in backend/index.js. Packets
+are decoded straight from the capture with struct. Supported formats:
+- captures: libpcap (micro/nanosecond, either byte order) and pcapng
+- link layers: Ethernet with 802.1Q VLAN tags, raw IP, Linux cooked (SLL)
+- protocols: IPv4/IPv6 carrying TCP, UDP or ICMP
+
+Each packet updates a compact per-flow record (`Flow`, __slots__). The
+record holds the running values needed for the 10 TOP_FEATS:
+
+    proto, dur, state, smean, sttl, dpkts, ackdat, synack,
+    response_body_len, djit
+
+Definitions follow UNSW-NB15 (Argus/Bro). Direction is taken from the
+flow's first packet:
+- smean: mean IP packet size sent by the source
+- sttl: the source's first TTL
+- synack: time from SYN to SYN/ACK
+- ackdat: time from SYN/ACK to the first ACK
+- djit: standard deviation (ms) of destination inter-arrival times,
+  kept with Welford's method
+- response_body_len: bytes after the header block of an HTTP response
+  from the destination
+- proto, state: encoded as the deployed model expects (see ENCODINGS)
+
+Flows are kept in an OrderedDict in last-activity order, so expiry pops
+from the front. A flow completes when:
+- it has been idle for `idle_timeout`
+- it has been active for `active_timeout`
+- or `close_timeout` has passed after a TCP RST or FINs from both sides
+
+Time is capture time, so offline runs are deterministic. Each completed
+flow is enriched with the UNSW-NB15 connection-window counters (ct_*,
+see window_features.py), then goes to a BatchSubmitter, which POSTs them to /predict-batch in
+batches from a background thread. Parsing never waits on the network.
+With --binary, batches go to /predict-legacy as packed float32 rows
+instead of JSON (see wire_format.py).
+
+    python flows.py capture.pcap [more.pcapng | -] --url http://127.0.0.1:8000
+    python flows.py capture.pcap --url http://127.0.0.1:8000 --binary
+    tcpdump -i eth0 -w - | python flows.py - --url http://127.0.0.1:8000
+    python flows.py --synthesize sample.pcap --flows 20000      # benchmark input
+    python flows.py sample.pcap --out flows.csv                 # packets/s, flows/s only
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from collections import OrderedDict
+import argparse, json, math, os, queue, random, socket, struct, sys, threading, time
+import urllib.request
+
+from inference import TOP_FEATS
+from window_features import WINDOW, WINDOW_FEATURES, WindowFeatures
+import wire_format
+
+IDLE_TIMEOUT = float(os.environ.get("IDS_FLOW_IDLE_TIMEOUT", "60"))
+ACTIVE_TIMEOUT = float(os.environ.get("IDS_FLOW_ACTIVE_TIMEOUT", "300"))
+CLOSE_TIMEOUT = float(os.environ.get("IDS_FLOW_CLOSE_TIMEOUT", "2"))
+
+# Category codes must match how the deployed model's training data encoded
+# proto/state; override with --encodings '{"proto": {...}, "state": {...}}'.
+# Defaults: IANA protocol numbers (as in the /predict examples), and Argus
+# state names in LabelEncoder (sorted) order.
+STATES = ["ACC", "CLO", "CON", "ECO", "ECR", "FIN", "INT", "PAR", "REQ", "RST", "URN", "no"]
+ENCODINGS: Dict[str, Dict[str, float]] = {
+    "proto": {"icmp": 1, "tcp": 6, "udp": 17, "ipv6-icmp": 58},
+    "state": {name: i for i, name in enumerate(STATES)},
+}
+
+TCP, UDP, ICMP, ICMP6 = 6, 17, 1, 58
+PROTO_NAMES = {TCP: "tcp", UDP: "udp", ICMP: "icmp", ICMP6: "ipv6-icmp"}
+FIN, SYN, RST, ACK = 0x01, 0x02, 0x04, 0x10
+
+_U16 = struct.Struct("!H")
+_PORTS = struct.Struct("!HH")
+_IPV4 = struct.Struct("!BBHHHBBH4s4s")
+_IPV6 = struct.Struct("!IHBB16s16s")
+
+
+class Flow:
+    __slots__ = ("key", "proto", "first", "last", "sttl", "dttl", "spkts", "sbytes", "dpkts", "dbytes",
+                 "flags_src", "flags_dst", "syn_ts", "synack_ts", "ack_ts",
+                 "d_last", "d_n", "d_mean", "d_m2", "http", "body", "icmp_type", "closed_at")
+
+    def __init__(self, key: tuple, proto: int, ts: float, ttl: int):
+        self.key = key
+        self.proto = proto
+        self.first = self.last = ts
+        self.sttl = ttl
+        self.dttl = 0
+        self.spkts = self.sbytes = self.dpkts = self.dbytes = 0
+        self.flags_src = self.flags_dst = 0
+        self.syn_ts = self.synack_ts = self.ack_ts = None
+        self.d_last = None
+        self.d_n, self.d_mean, self.d_m2 = 0, 0.0, 0.0
+        # HTTP response parsing: 0 = not seen, 1 = in headers, 2 = in body
+        self.http = 0
+        self.body = 0
+        self.icmp_type = -1
+        self.closed_at = None
+
+    def state(self) -> str:
+        if self.proto == TCP:
+            flags = self.flags_src | self.flags_dst
+            if flags & RST:
+                return "RST"
+            if self.flags_src & FIN and self.flags_dst & FIN:
+                return "FIN"
+            if flags & FIN:
+                return "CLO"
+            if self.synack_ts is not None:
+                return "CON" if self.ack_ts is not None else "ACC"
+            if self.flags_src & SYN:
+                return "REQ"
+            return "CON" if self.dpkts else "INT"
+        if self.proto in (ICMP, ICMP6):
+            if self.icmp_type in (8, 128):
+                return "ECO"
+            if self.icmp_type in (0, 129):
+                return "ECR"
+        return "CON" if self.dpkts else "INT"
+
+    def features(self, encodings: Dict[str, Dict[str, float]] = ENCODINGS) -> List[float]:
+        """The flow's TOP_FEATS row."""
+        djit = math.sqrt(self.d_m2 / (self.d_n - 1)) if self.d_n > 1 else 0.0
+        values = {
+            "proto": encodings["proto"].get(PROTO_NAMES.get(self.proto, str(self.proto)), float(self.proto)),
+            "dur": self.last - self.first,
+            "state": encodings["state"].get(self.state(), encodings["state"].get("no", 0)),
+            "smean": round(self.sbytes / self.spkts) if self.spkts else 0,
+            "sttl": self.sttl,
+            "dpkts": self.dpkts,
+            "ackdat": self.ack_ts - self.synack_ts if self.ack_ts is not None else 0.0,
+            "synack": self.synack_ts - self.syn_ts if self.synack_ts is not None and self.syn_ts is not None else 0.0,
+            "response_body_len": self.body,
+            "djit": djit,
+        }
+        return [float(values[f]) for f in TOP_FEATS]
+
+    def describe(self) -> Dict[str, Any]:
+        proto, src, sport, dst, dport = self.key
+        return {"proto": PROTO_NAMES.get(proto, proto), "src": address(src), "sport": sport,
+                "dst": address(dst), "dport": dport,
+                "start": self.first, "spkts": self.spkts, "dpkts": self.dpkts, "state": self.state()}
+
+
+def address(packed: bytes) -> str:
+    return socket.inet_ntoa(packed) if len(packed) == 4 else socket.inet_ntop(socket.AF_INET6, packed)
+
+
+# ---- capture readers ----
+
+def _read_exact(f, n: int) -> bytes:
+    data = f.read(n)
+    while len(data) < n:
+        more = f.read(n - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def read_packets(f) -> Iterator[Tuple[float, int, bytes]]:
+    """(timestamp, linktype, frame) for every packet in a pcap or pcapng stream."""
+    magic = _read_exact(f, 4)
+    if len(magic) < 4:
+        return
+    if magic == b"\x0a\x0d\x0d\x0a":
+        yield from _read_pcapng(f, magic)
+        return
+    known = {b"\xd4\xc3\xb2\xa1": ("<", 1e-6), b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+             b"\x4d\x3c\xb2\xa1": ("<", 1e-9), b"\xa1\xb2\x3c\x4d": (">", 1e-9)}
+    if magic not in known:
+        raise ValueError(f"not a pcap/pcapng capture (magic {magic.hex()})")
+    endian, resolution = known[magic]
+    header = _read_exact(f, 20)
+    linktype = struct.unpack(endian + "HHiIII", header)[5] & 0xFFFF
+    record = struct.Struct(endian + "IIII")
+    while True:
+        head = _read_exact(f, 16)
+        if len(head) < 16:
+            return
+        sec, frac, caplen, _ = record.unpack(head)
+        yield sec + frac * resolution, linktype, _read_exact(f, caplen)
+
+
+def _read_pcapng(f, first: bytes) -> Iterator[Tuple[float, int, bytes]]:
+    endian = "<"
+    interfaces: List[Tuple[int, float]] = []
+    block_type = first
+    last_ts = 0.0
+    while True:
+        if block_type is None:
+            block_type = _read_exact(f, 4)
+            if len(block_type) < 4:
+                return
+        raw_len = _read_exact(f, 4)
+        if block_type == b"\x0a\x0d\x0d\x0a":
+            bom = _read_exact(f, 4)
+            endian = "<" if bom == b"\x4d\x3c\x2b\x1a" else ">"
+            length = struct.unpack(endian + "I", raw_len)[0]
+            _read_exact(f, length - 12)
+            interfaces = []
+            block_type = None
+            continue
+        length = struct.unpack(endian + "I", raw_len)[0]
+        body = _read_exact(f, length - 8)
+        if len(body) < length - 8:
+            return
+        kind = struct.unpack(endian + "I", block_type)[0]
+        block_type = None
+        if kind == 1:  # Interface Description
+            linktype = struct.unpack_from(endian + "H", body, 0)[0]
+            resolution = 1e-6
+            pos = 8
+            while pos + 4 <= len(body) - 4:
+                code, size = struct.unpack_from(endian + "HH", body, pos)
+                if code == 0:
+                    break
+                if code == 9 and size >= 1:  # if_tsresol
+                    value = body[pos + 4]
+                    resolution = 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+                pos += 4 + ((size + 3) & ~3)
+            interfaces.append((linktype, resolution))
+        elif kind == 6:  # Enhanced Packet
+            iface, high, low, caplen, _ = struct.unpack_from(endian + "IIIII", body, 0)
+            linktype, resolution = interfaces[iface] if iface < len(interfaces) else (1, 1e-6)
+            last_ts = ((high << 32) | low) * resolution
+            yield last_ts, linktype, body[20:20 + caplen]
+        elif kind == 3:  # Simple Packet: no timestamp, reuse the last one
+            linktype = interfaces[0][0] if interfaces else 1
+            yield last_ts, linktype, body[4:]
+
+
+# ---- decoding ----
+
+def decode(linktype: int, frame: bytes):
+    """
+    (proto, src, sport, dst, dport, ttl, ip_len, flags, payload, icmp_type)
+    or None. Addresses stay packed bytes; see address().
+    """
+    if linktype == 1:  # Ethernet
+        if len(frame) < 14:
+            return None
+        ethertype = _U16.unpack_from(frame, 12)[0]
+        off = 14
+        while ethertype in (0x8100, 0x88A8) and len(frame) >= off + 4:
+            ethertype = _U16.unpack_from(frame, off + 2)[0]
+            off += 4
+    elif linktype == 113:  # Linux cooked capture
+        if len(frame) < 16:
+            return None
+        ethertype, off = _U16.unpack_from(frame, 14)[0], 16
+    elif linktype in (101, 12, 14, 228, 229):  # raw IP
+        if not frame:
+            return None
+        ethertype, off = (0x0800 if frame[0] >> 4 == 4 else 0x86DD), 0
+    else:
+        return None
+
+    if ethertype == 0x0800:
+        if len(frame) < off + 20:
+            return None
+        vihl, _, total, _, frag, ttl, proto, _, src, dst = _IPV4.unpack_from(frame, off)
+        l4 = off + (vihl & 0x0F) * 4
+        end = min(len(frame), off + total)
+        if frag & 0x1FFF:  # non-first fragment: no L4 header
+            return proto, src, 0, dst, 0, ttl, total, 0, b"", -1
+    elif ethertype == 0x86DD:
+        if len(frame) < off + 40:
+            return None
+        _, plen, proto, ttl, src, dst = _IPV6.unpack_from(frame, off)
+        total = plen + 40
+        l4 = off + 40
+        end = min(len(frame), off + total)
+    else:
+        return None
+
+    if proto == TCP and end >= l4 + 14:
+        sport, dport = _PORTS.unpack_from(frame, l4)
+        data_off = (frame[l4 + 12] >> 4) * 4
+        return proto, src, sport, dst, dport, ttl, total, frame[l4 + 13], frame[l4 + data_off:end], -1
+    if proto == UDP and end >= l4 + 4:
+        sport, dport = _PORTS.unpack_from(frame, l4)
+        return proto, src, sport, dst, dport, ttl, total, 0, b"", -1
+    if proto in (ICMP, ICMP6) and end > l4:
+        return proto, src, 0, dst, 0, ttl, total, 0, b"", frame[l4]
+    return proto, src, 0, dst, 0, ttl, total, 0, b"", -1
+
+
+# ---- aggregation ----
+
+class FlowTable:
+    def __init__(self, on_complete: Callable[[Flow], None], idle_timeout: float = IDLE_TIMEOUT,
+                 active_timeout: float = ACTIVE_TIMEOUT, close_timeout: float = CLOSE_TIMEOUT):
+        self.on_complete = on_complete
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.close_timeout = close_timeout
+        self.flows: "OrderedDict[tuple, Flow]" = OrderedDict()
+        self.closing: "OrderedDict[tuple, float]" = OrderedDict()
+        self.packets = 0
+        self.skipped = 0
+        self.completed = 0
+        self.now = 0.0
+        self._next_sweep = 0.0
+
+    def add(self, ts: float, linktype: int, frame: bytes):
+        self.packets += 1
+        pkt = decode(linktype, frame)
+        if pkt is None:
+            self.skipped += 1
+            return
+        proto, src, sport, dst, dport, ttl, ip_len, flags, payload, icmp_type = pkt
+        key = (proto, src, sport, dst, dport)
+        flow = self.flows.get(key)
+        forward = True
+        if flow is None:
+            flow = self.flows.get((proto, dst, dport, src, sport))
+            if flow is None:
+                flow = Flow(key, proto, ts, ttl)
+                self.flows[key] = flow
+            else:
+                forward = False
+                key = flow.key
+        self.flows.move_to_end(key)
+        flow.last = ts
+
+        if forward:
+            flow.spkts += 1
+            flow.sbytes += ip_len
+            if proto == TCP:
+                flow.flags_src |= flags
+                if flags & SYN and not flags & ACK and flow.syn_ts is None:
+                    flow.syn_ts = ts
+                elif flags & ACK and flow.synack_ts is not None and flow.ack_ts is None:
+                    flow.ack_ts = ts
+            elif icmp_type >= 0 and flow.icmp_type < 0:
+                flow.icmp_type = icmp_type
+        else:
+            if not flow.dpkts:
+                flow.dttl = ttl
+            flow.dpkts += 1
+            flow.dbytes += ip_len
+            if flow.d_last is not None:
+                gap = (ts - flow.d_last) * 1000.0
+                flow.d_n += 1
+                delta = gap - flow.d_mean
+                flow.d_mean += delta / flow.d_n
+                flow.d_m2 += delta * (gap - flow.d_mean)
+            flow.d_last = ts
+            if proto == TCP:
+                flow.flags_dst |= flags
+                if flags & SYN and flags & ACK and flow.synack_ts is None:
+                    flow.synack_ts = ts
+                if payload:
+                    self._http(flow, payload)
+
+        if proto == TCP and flow.closed_at is None and (
+                flags & RST or (flow.flags_src & FIN and flow.flags_dst & FIN)):
+            flow.closed_at = ts
+            self.closing[key] = ts
+
+        self.now = ts
+        if ts >= self._next_sweep:
+            self.expire(ts)
+            self._next_sweep = ts + 1.0
+
+    @staticmethod
+    def _http(flow: Flow, payload: bytes):
+        if flow.http == 2:
+            flow.body += len(payload)
+        elif flow.http == 0 and payload.startswith(b"HTTP/"):
+            flow.http = 1
+        if flow.http == 1:
+            end = payload.find(b"\r\n\r\n")
+            if end >= 0:
+                flow.http = 2
+                flow.body += len(payload) - end - 4
+
+    def _complete(self, key: tuple):
+        flow = self.flows.pop(key, None)
+        self.closing.pop(key, None)
+        if flow is not None:
+            self.completed += 1
+            self.on_complete(flow)
+
+    def expire(self, now: float):
+        while self.closing:
+            key, closed = next(iter(self.closing.items()))
+            if now - closed < self.close_timeout:
+                break
+            self._complete(key)
+        while self.flows:
+            key, flow = next(iter(self.flows.items()))
+            if now - flow.last < self.idle_timeout:
+                break
+            self._complete(key)
+        if self.active_timeout and self.flows:
+            # Long-lived flows are rare; a linear pass every sweep is cheap enough
+            for key in [k for k, f in self.flows.items() if now - f.first >= self.active_timeout]:
+                self._complete(key)
+
+    def flush(self):
+        for key in list(self.flows):
+            self._complete(key)
+
+
+# ---- submission ----
+
+class BatchSubmitter:
+    """Collects completed flows and POSTs them for scoring from a background thread."""
+
+    def __init__(self, url: Optional[str], batch_size: int = 256, max_wait: float = 1.0,
+                 encodings: Dict[str, Dict[str, float]] = ENCODINGS,
+                 on_result: Optional[Callable[[Dict[str, Any], int, float], None]] = None,
+                 binary: bool = False):
+        self.binary = binary
+        path = "/predict-legacy" if binary else "/predict-batch"
+        self.url = url.rstrip("/") + path if url else None
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.encodings = encodings
+        self.on_result = on_result
+        self.rows: List[List[float]] = []
+        self.meta: List[Dict[str, Any]] = []
+        self.batches = self.scored = self.alerts = self.errors = 0
+        self._started = time.monotonic()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=64)
+        self._thread = threading.Thread(target=self._run, daemon=True) if self.url else None
+        if self._thread:
+            self._thread.start()
+
+    def __call__(self, flow: Flow, extra: Optional[Dict[str, Any]] = None):
+        self.rows.append(flow.features(self.encodings))
+        self.meta.append({**flow.describe(), **extra} if extra else flow.describe())
+        if len(self.rows) >= self.batch_size or time.monotonic() - self._started >= self.max_wait:
+            self.submit()
+
+    def submit(self):
+        if self.rows and self.url:
+            # Blocks only if the server falls 64 batches behind
+            self._queue.put((self.rows, self.meta))
+        self.rows, self.meta = [], []
+        self._started = time.monotonic()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            rows, meta = item
+            if self.binary:
+                body, content_type = wire_format.encode_rows(rows), wire_format.CONTENT_TYPE
+            else:
+                body, content_type = json.dumps({"features": rows}).encode(), "application/json"
+            request = urllib.request.Request(self.url, data=body, headers={"Content-Type": content_type})
+            try:
+                with urllib.request.urlopen(request, timeout=30) as resp:
+                    if self.binary:
+                        result = wire_format.decode_results(resp.read())
+                        preds, probs = result["prediction"].tolist(), result["probability"].tolist()
+                    else:
+                        result = json.load(resp)
+                        preds, probs = result["predictions"], result["probabilities"]
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Batch of {len(rows)} flows not scored: {e}")
+                continue
+            self.batches += 1
+            self.scored += len(rows)
+            for info, pred, prob in zip(meta, preds, probs):
+                if pred:
+                    self.alerts += 1
+                if self.on_result:
+                    self.on_result(info, pred, prob)
+
+    def close(self):
+        self.submit()
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+
+
+def print_alert(info: Dict[str, Any], prediction: int, probability: float):
+    if prediction:
+        print(json.dumps({**info, "probability": round(probability, 4)}))
+
+
+# ---- benchmark input ----
+
+def synthesize(path: str, flows: int = 20000, seed: int = 0):
+    """Write a libpcap file of synthetic TCP (with HTTP responses), UDP and ICMP flows."""
+    rng = random.Random(seed)
+    packets: List[Tuple[float, bytes]] = []
+
+    def ip(src: str, dst: str, proto: int, ttl: int, l4: bytes) -> bytes:
+        header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(l4), 0, 0, ttl, proto, 0,
+                             socket.inet_aton(src), socket.inet_aton(dst))
+        return b"\x00\x11\x22\x33\x44\x55\x66\x77\x88\x99\xaa\xbb\x08\x00" + header + l4
+
+    def tcp(sport: int, dport: int, flags: int, payload: bytes = b"") -> bytes:
+        return struct.pack("!HHIIBBHHH", sport, dport, 0, 0, 5 << 4, flags, 65535, 0, 0) + payload
+
+    t = 1_700_000_000.0
+    for i in range(flows):
+        t += rng.expovariate(2000.0)
+        src = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        dst = f"192.168.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        sport, kind = rng.randrange(1024, 65535), rng.random()
+        if kind < 0.7:
+            dport, rtt = rng.choice((80, 443, 22, 8080)), rng.uniform(0.0005, 0.05)
+            ts = t
+            packets.append((ts, ip(src, dst, TCP, 62, tcp(sport, dport, SYN))))
+            packets.append((ts + rtt, ip(dst, src, TCP, 252, tcp(dport, sport, SYN | ACK))))
+            packets.append((ts + 2 * rtt, ip(src, dst, TCP, 62, tcp(sport, dport, ACK))))
+            packets.append((ts + 2 * rtt, ip(src, dst, TCP, 62, tcp(sport, dport, ACK | 0x08, b"GET / HTTP/1.1\r\n\r\n"))))
+            ts += 3 * rtt
+            body = rng.randrange(0, 4000)
+            packets.append((ts, ip(dst, src, TCP, 252, tcp(dport, sport, ACK | 0x08,
+                                                           b"HTTP/1.1 200 OK\r\n\r\n" + b"x" * min(body, 1400)))))
+            for _ in range(rng.randrange(0, 6)):
+                ts += rng.uniform(0.0001, 0.01)
+                packets.append((ts, ip(dst, src, TCP, 252, tcp(dport, sport, ACK, b"x" * 1400))))
+            packets.append((ts + rtt, ip(src, dst, TCP, 62, tcp(sport, dport, FIN | ACK))))
+            packets.append((ts + 2 * rtt, ip(dst, src, TCP, 252, tcp(dport, sport, FIN | ACK))))
+        elif kind < 0.95:
+            query = struct.pack("!HHHH", sport, 53, 8 + 30, 0) + b"q" * 30
+            answer = struct.pack("!HHHH", 53, sport, 8 + 90, 0) + b"a" * 90
+            packets.append((t, ip(src, dst, UDP, 64, query)))
+            packets.append((t + rng.uniform(0.001, 0.03), ip(dst, src, UDP, 254, answer)))
+        else:
+            packets.append((t, ip(src, dst, ICMP, 64, b"\x08\x00" + b"\x00" * 30)))
+            packets.append((t + 0.001, ip(dst, src, ICMP, 254, b"\x00\x00" + b"\x00" * 30)))
+    packets.sort(key=lambda p: p[0])
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        for ts, frame in packets:
+            sec = int(ts)
+            f.write(struct.pack("<IIII", sec, int((ts - sec) * 1e6), len(frame), len(frame)))
+            f.write(frame)
+    return len(packets)
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="pcap -> per-flow TOP_FEATS -> /predict-batch")
+    parser.add_argument("captures", nargs="*", help="pcap/pcapng files, or - for stdin")
+    parser.add_argument("--url", help="scoring service base URL; omit to only extract")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--max-wait", type=float, default=1.0, help="seconds before a partial batch is sent")
+    parser.add_argument("--binary", action="store_true",
+                        help="send packed float32 rows to /predict-legacy instead of JSON")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT)
+    parser.add_argument("--active-timeout", type=float, default=ACTIVE_TIMEOUT)
+    parser.add_argument("--close-timeout", type=float, default=CLOSE_TIMEOUT)
+    parser.add_argument("--encodings", help="JSON file with proto/state code maps")
+    parser.add_argument("--window", type=int, default=WINDOW,
+                        help="connections in the ct_* counter window; 0 disables them")
+    parser.add_argument("--out", help="also write completed flows (meta + features) to this CSV")
+    parser.add_argument("--synthesize", metavar="PCAP", help="write a synthetic benchmark capture and exit")
+    parser.add_argument("--flows", type=int, default=20000, help="flows for --synthesize")
+    args = parser.parse_args(argv)
+
+    if args.synthesize:
+        n = synthesize(args.synthesize, args.flows)
+        print(f"✔ Wrote {n} packets ({args.flows} flows) to {args.synthesize}")
+        return 0
+    if not args.captures:
+        parser.error("no captures given")
+
+    encodings = ENCODINGS
+    if args.encodings:
+        with open(args.encodings) as f:
+            encodings = {**ENCODINGS, **json.load(f)}
+
+    submitter = BatchSubmitter(args.url, args.batch_size, args.max_wait, encodings, print_alert,
+                               binary=args.binary)
+    window = WindowFeatures(args.window) if args.window > 0 else None
+    counters = WINDOW_FEATURES + ["ct_state_ttl"] if window else []
+    out = open(args.out, "w") if args.out else None
+    if out:
+        out.write(",".join(["src", "sport", "dst", "dport", "start"] + TOP_FEATS + counters) + "\n")
+
+    def complete(flow: Flow):
+        extra = window.enrich_flow(flow) if window else None
+        if out:
+            info = flow.describe()
+            row = [info["src"], info["sport"], info["dst"], info["dport"], flow.first] + flow.features(encodings)
+            if extra:
+                row += [extra[c] for c in counters]
+            out.write(",".join(map(str, row)) + "\n")
+        submitter(flow, extra)
+
+    table = FlowTable(complete, args.idle_timeout, args.active_timeout, args.close_timeout)
+    started = time.perf_counter()
+    try:
+        for path in args.captures:
+            f = sys.stdin.buffer if path == "-" else open(path, "rb")
+            with f:
+                for ts, linktype, frame in read_packets(f):
+                    table.add(ts, linktype, frame)
+        table.flush()
+    except KeyboardInterrupt:
+        table.flush()
+    parsed = time.perf_counter() - started
+    submitter.close()
+    if out:
+        out.close()
+    elapsed = time.perf_counter() - started
+
+    print(f"✔ {table.packets} packets, {table.completed} flows in {parsed:.2f}s: "
+          f"{table.packets / max(parsed, 1e-9):,.0f} packets/s, {table.completed / max(parsed, 1e-9):,.0f} flows/s "
+          f"({table.skipped} undecodable)")
+    if args.url:
+        print(f"✔ Scored {submitter.scored} flows in {submitter.batches} batches, {submitter.alerts} alerts, "
+              f"{submitter.errors} failed batches ({elapsed:.2f}s total)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,439 @@
+"""
+Execution backends for model inference.
+
+sklearn's predict_proba is CPU-bound, so running it directly inside an
+`async def` endpoint stalls the event loop (and with it the health check
+and every other connection). `InferenceExecutor` runs scoring either
+inline, on a thread pool, or on a process pool whose workers each load
+the pipeline once at startup.
+
+Worker-side code lives in this module rather than in app.py so process
+pool workers never import the FastAPI app (or its startup side effects).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio, multiprocessing, os, threading
+import joblib
+import numpy as np
+import pandas as pd
+
+# PCA-selected features, in the column order the pipeline was fitted on
+TOP_FEATS = [
+    'proto','dur','state','smean','sttl',
+    'dpkts','ackdat','synack','response_body_len','djit'
+]
+
+INFERENCE_MODES = ("inline", "thread", "process")
+
+
+def score_with(pipeline, matrix: np.ndarray) -> np.ndarray:
+    """
+    Attack probabilities for an (N, 10) matrix in TOP_FEATS order,
+    scored with a single vectorized predict_proba call.
+    """
+    # Named columns are needed for the pipeline's ColumnTransformer
+    frame = pd.DataFrame(matrix, columns=TOP_FEATS)
+    return pipeline.predict_proba(frame)[:, 1]
+
+
+def request_row(req) -> np.ndarray:
+    """Map a PredictRequest straight into a contiguous (1, 10) float64 row."""
+    return np.fromiter((getattr(req, f) for f in TOP_FEATS),
+                       dtype=np.float64, count=len(TOP_FEATS)).reshape(1, -1)
+
+
+# ---- pandas-free fast path ----
+
+class UnsupportedStep(Exception):
+    pass
+
+
+def _column_indices(cols, feature_names) -> List[int]:
+    """Resolve a ColumnTransformer column spec to indices into TOP_FEATS."""
+    cols = np.atleast_1d(np.asarray(cols))
+    if cols.dtype == bool:
+        cols = np.flatnonzero(cols)
+    names = [feature_names[c] if isinstance(c, (int, np.integer)) else c for c in cols.tolist()]
+    missing = [n for n in names if n not in TOP_FEATS]
+    if missing:
+        raise UnsupportedStep(f"columns {missing} are not in TOP_FEATS")
+    return [TOP_FEATS.index(n) for n in names]
+
+
+def _scaler_ops(step, width: int) -> List[Tuple[str, np.ndarray]]:
+    """Elementwise ops equivalent to a fitted scaler's transform, in sklearn's order."""
+    from sklearn.preprocessing import MinMaxScaler, StandardScaler
+    if isinstance(step, StandardScaler):
+        ops = []
+        if step.with_mean:
+            ops.append(("subtract", np.asarray(step.mean_, dtype=np.float64)))
+        if step.with_std:
+            ops.append(("divide", np.asarray(step.scale_, dtype=np.float64)))
+        return ops
+    if isinstance(step, MinMaxScaler):
+        ops = [("multiply", np.asarray(step.scale_, dtype=np.float64)),
+               ("add", np.asarray(step.min_, dtype=np.float64))]
+        if step.clip:
+            lo, hi = step.feature_range
+            ops.append(("clip", np.array([[lo] * width, [hi] * width], dtype=np.float64)))
+        return ops
+    raise UnsupportedStep(f"unsupported preprocessing step {type(step).__name__}")
+
+
+def _is_passthrough(step) -> bool:
+    from sklearn.preprocessing import FunctionTransformer
+    if step is None or (isinstance(step, str) and step == "passthrough"):
+        return True
+    # Fitted ColumnTransformers store "passthrough" as an identity FunctionTransformer
+    return isinstance(step, FunctionTransformer) and step.func is None
+
+
+_IDENTITY = {"subtract": 0.0, "divide": 1.0, "multiply": 1.0, "add": 0.0}
+
+
+def _compile_column_transformer(ct) -> Tuple[np.ndarray, List[Tuple[str, np.ndarray]]]:
+    """
+    Flatten a fitted ColumnTransformer into a column gather plus
+    full-width elementwise ops. Columns of a block that does not use an
+    op get that op's identity value, which leaves them bit-for-bit unchanged.
+    """
+    feature_names = list(getattr(ct, "feature_names_in_", TOP_FEATS))
+    take: List[int] = []
+    blocks = []
+    for name, trans, cols in ct.transformers_:
+        if isinstance(trans, str) and trans == "drop":
+            continue
+        idx = _column_indices(cols, feature_names)
+        if not idx:
+            continue
+        if _is_passthrough(trans):
+            block_ops = []
+        else:
+            block_ops = _scaler_ops(trans, len(idx))
+        blocks.append((len(take), len(idx), block_ops))
+        take.extend(idx)
+
+    width = len(take)
+    merged: Dict[str, np.ndarray] = {}
+    for start, n, block_ops in blocks:
+        for op, vec in block_ops:
+            if op not in merged:
+                merged[op] = (np.array([[-np.inf] * width, [np.inf] * width]) if op == "clip"
+                              else np.full(width, _IDENTITY[op]))
+            if op == "clip":
+                merged[op][:, start:start + n] = vec
+            else:
+                merged[op][start:start + n] = vec
+    order = ["subtract", "divide", "multiply", "add", "clip"]
+    return np.asarray(take, dtype=np.intp), [(op, merged[op]) for op in order if op in merged]
+
+
+class FastPath:
+    """
+    The pipeline's fitted preprocessing applied as plain NumPy operations
+    on a TOP_FEATS-ordered float matrix, followed by the final estimator.
+    Skips building a DataFrame and the ColumnTransformer's per-call checks.
+    """
+
+    def __init__(self, take: np.ndarray, ops: List[Tuple[str, np.ndarray]], estimator,
+                 large_batch_estimator=None, large_batch_rows: int = 0):
+        self.take = take
+        self.ops = ops
+        self.estimator = estimator
+        # Optional estimator for batches above `large_batch_rows`
+        self.large_batch_estimator = large_batch_estimator
+        self.large_batch_rows = large_batch_rows
+        # Straight passthrough in the same order needs no gather at all
+        self._identity_take = np.array_equal(take, np.arange(len(TOP_FEATS)))
+        self._local = threading.local()
+
+    def _row_buffer(self) -> np.ndarray:
+        # One preallocated output row per thread (pool threads score concurrently)
+        buf = getattr(self._local, "row", None)
+        if buf is None:
+            buf = self._local.row = np.empty((1, len(self.take)), dtype=np.float64)
+        return buf
+
+    def transform(self, matrix: np.ndarray) -> np.ndarray:
+        matrix = np.ascontiguousarray(matrix, dtype=np.float64)
+        if matrix.shape[0] == 1:
+            out = self._row_buffer()
+            np.take(matrix, self.take, axis=1, out=out)
+        elif self._identity_take and not self.ops:
+            return matrix
+        else:
+            out = matrix.take(self.take, axis=1)
+        for op, vec in self.ops:
+            if op == "clip":
+                np.clip(out, vec[0], vec[1], out=out)
+            else:
+                getattr(np, op)(out, vec, out=out)
+        return out
+
+    def score(self, matrix: np.ndarray) -> np.ndarray:
+        estimator = self.estimator
+        if self.large_batch_estimator is not None and matrix.shape[0] > self.large_batch_rows:
+            estimator = self.large_batch_estimator
+        return estimator.predict_proba(self.transform(matrix))[:, 1]
+
+    def describe(self) -> Dict[str, Any]:
+        resp = {"columns": len(self.take), "ops": [op for op, _ in self.ops]}
+        if self.large_batch_estimator is not None:
+            resp["large_batch_rows"] = self.large_batch_rows
+        return resp
+
+
+def compile_fast_path(pipeline) -> FastPath:
+    """
+    Extract the fitted preprocessing from `pipeline` once, at load time.
+    Raises UnsupportedStep for anything that cannot be expressed as a
+    column gather plus elementwise scaling.
+    """
+    from sklearn.compose import ColumnTransformer
+    steps = list(getattr(pipeline, "steps", [("model", pipeline)]))
+    *pre, (_, estimator) = steps
+    if not hasattr(estimator, "predict_proba"):
+        raise UnsupportedStep(f"final step {type(estimator).__name__} has no predict_proba")
+
+    take = np.arange(len(TOP_FEATS), dtype=np.intp)
+    ops: List[Tuple[str, np.ndarray]] = []
+    for i, (name, step) in enumerate(pre):
+        if _is_passthrough(step):
+            continue
+        if isinstance(step, ColumnTransformer):
+            if i != 0:
+                raise UnsupportedStep("ColumnTransformer is only supported as the first step")
+            take, ops = _compile_column_transformer(step)
+        else:
+            ops.extend(_scaler_ops(step, len(take)))
+
+    if not pre and hasattr(estimator, "feature_names_in_"):
+        # Estimator fitted on a DataFrame: it would warn on every ndarray call
+        raise UnsupportedStep("estimator expects named columns")
+    return FastPath(take, ops, estimator)
+
+
+def probe_matrix(n: int = 256, seed: int = 0) -> np.ndarray:
+    """Deterministic rows spanning zeros, small integers and wide floats."""
+    rng = np.random.default_rng(seed)
+    probe = np.empty((n, len(TOP_FEATS)), dtype=np.float64)
+    probe[: n // 4] = rng.integers(0, 256, size=(n // 4, len(TOP_FEATS)))
+    probe[n // 4:] = rng.exponential(scale=rng.choice([1e-3, 1.0, 1e3], size=len(TOP_FEATS)),
+                                     size=(n - n // 4, len(TOP_FEATS)))
+    probe[0] = 0.0
+    return probe
+
+
+def self_check(fast: FastPath, pipeline, tolerance: float,
+               probe: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Compare fast-path output with pipeline.predict_proba, batched and row by row."""
+    probe = probe_matrix() if probe is None else probe
+    expected = score_with(pipeline, probe)
+    batched = fast.score(probe)
+    single = np.array([fast.score(probe[i:i + 1])[0] for i in range(min(len(probe), 32))])
+    diff = max(float(np.max(np.abs(batched - expected))),
+               float(np.max(np.abs(single - expected[:len(single)]))))
+    return {"rows": int(len(probe)), "max_abs_diff": diff,
+            "tolerance": tolerance, "passed": diff <= tolerance}
+
+
+ENGINES = ("sklearn", "compiled")
+
+
+class LoadedModel:
+    """
+    A loaded pipeline plus whichever scoring path was validated for it.
+
+    With engine="compiled" the forest is flattened into node tables
+    (see forest_engine.py) and used behind the extracted preprocessing.
+    Each candidate path is only used if its startup self-check passes;
+    otherwise the next one is tried, down to plain predict_proba.
+    """
+
+    def __init__(self, pipeline, fast_path: bool = True, tolerance: float = 0.0,
+                 engine: str = "sklearn", precision: str = "float64",
+                 engine_max_rows: int = 512):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+        self.pipeline = pipeline
+        self.fast: Optional[FastPath] = None
+        self.fast_status: Dict[str, Any] = {"enabled": False, "engine": "sklearn"}
+        if not fast_path:
+            self.fast_status["reason"] = "disabled by configuration"
+            return
+        try:
+            fast = compile_fast_path(pipeline)
+        except UnsupportedStep as e:
+            self.fast_status["reason"] = str(e)
+            return
+
+        candidates = []
+        if engine == "compiled":
+            from forest_engine import EXPECTED_ERROR, compile_pipeline_forest
+            try:
+                forest = compile_pipeline_forest(pipeline, precision)
+                # sklearn's Cython traversal wins again on large batches
+                compiled = FastPath(fast.take, fast.ops, forest,
+                                    fast.estimator if engine_max_rows > 0 else None, engine_max_rows)
+                candidates.append((compiled,
+                                   max(tolerance, EXPECTED_ERROR[precision]), forest.describe()))
+            except (TypeError, ValueError) as e:
+                self.fast_status["compiled_error"] = str(e)
+        candidates.append((fast, tolerance, {"engine": "sklearn"}))
+
+        for candidate, tol, info in candidates:
+            try:
+                check = self_check(candidate, pipeline, tol)
+            except Exception as e:
+                self.fast_status["reason"] = f"self-check error: {e}"
+                continue
+            self.fast_status.update(check=check)
+            if check["passed"]:
+                self.fast = candidate
+                self.fast_status.update(enabled=True, **info, **candidate.describe())
+                self.fast_status.pop("reason", None)
+                return
+            self.fast_status["reason"] = f"{info['engine']} self-check mismatch"
+
+    @classmethod
+    def from_fast_path(cls, fast: FastPath, status: Dict[str, Any]) -> "LoadedModel":
+        """A model served only by an already validated path, with no pipeline behind it."""
+        model = cls.__new__(cls)
+        model.pipeline = None
+        model.fast = fast
+        model.fast_status = status
+        return model
+
+    def score(self, matrix: np.ndarray) -> np.ndarray:
+        if self.fast is not None:
+            return self.fast.score(matrix)
+        return score_with(self.pipeline, matrix)
+
+
+def load_model(pipeline_file: str, shared: bool = False, cascade: bool = False,
+               threshold: float = 0.5, **options) -> Tuple[Any, LoadedModel]:
+    """
+    (pipeline, model) for a pipeline file. With shared=True the model is
+    served from the memory-mapped bundle (see shared_model.py). The
+    pipeline is then never unpickled and is returned as None. Batches of
+    every size use the compiled engine. Falls back to joblib.load if the
+    pipeline cannot be served that way.
+
+    With cascade=True the model sits behind the calibrated linear
+    pre-filter (see cascade.py), if one exists for `threshold`.
+    """
+    shared_error = None
+    model = None
+    if shared:
+        from shared_model import load_bundle
+        try:
+            fast, status = load_bundle(pipeline_file, options.get("precision", "float64"))
+            pipeline, model = None, LoadedModel.from_fast_path(fast, status)
+        except (UnsupportedStep, TypeError, ValueError) as e:
+            shared_error = str(e)
+            print(f"⚠️ Shared model unavailable, loading a private copy: {e}")
+    if model is None:
+        pipeline = joblib.load(pipeline_file)
+        model = LoadedModel(pipeline, **options)
+    if shared_error:
+        model.fast_status["shared_error"] = shared_error
+    if cascade:
+        from cascade import load_cascade
+        model = load_cascade(model, pipeline_file, threshold)
+    return pipeline, model
+
+
+# ---- process-pool worker side ----
+
+_worker_model: Optional[LoadedModel] = None
+
+
+def _init_worker(pipeline_file: str, model_options: Dict[str, Any]):
+    """Runs once in each worker process: load the model a single time."""
+    global _worker_model
+    _, _worker_model = load_model(pipeline_file, **model_options)
+
+
+def _worker_score(matrix: np.ndarray) -> np.ndarray:
+    return _worker_model.score(matrix)
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+# ---- event-loop side ----
+
+class InferenceExecutor:
+    """
+    Runs scoring according to `mode`:
+
+    - "inline":  on the calling thread (the event loop); lowest overhead,
+                 but blocks other requests while the model runs
+    - "thread":  on a thread pool; sklearn's tree traversal releases the
+                 GIL for much of the work, so this scales somewhat
+    - "process": on a process pool per model version; each worker loads
+                 the model once in the pool initializer (a private copy,
+                 or the shared memory-mapped bundle with shared=True)
+    """
+
+    def __init__(self, mode: str, workers: int, model_options: Optional[Dict[str, Any]] = None):
+        if mode not in INFERENCE_MODES:
+            raise ValueError(f"Unknown inference mode {mode!r}, expected one of {INFERENCE_MODES}")
+        self.mode = mode
+        self.workers = 0 if mode == "inline" else max(1, workers)
+        # LoadedModel keyword arguments, so workers build the same scoring path
+        self.model_options = dict(model_options or {})
+        self._pool: Optional[Executor] = None
+
+    def start(self):
+        if self.mode == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ids-infer")
+
+    def attach(self, version):
+        """
+        Give a model version its own worker processes (process mode only).
+        Blocking: every worker is started and has loaded the model on return.
+        """
+        if self.mode != "process" or version.pool is not None:
+            return
+        # spawn: forking a process that already runs an event loop and
+        # threads is unsafe; workers import only this module
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            # Workers need the threshold to validate the cascade's cut-offs
+            initargs=(version.pipeline_file, {**self.model_options, "threshold": version.threshold}),
+        )
+        for f in [pool.submit(_worker_ready) for _ in range(self.workers)]:
+            f.result()
+        version.pool = pool
+
+    def release(self, version):
+        """Stop a retired version's workers once their queued work is done."""
+        if version is not None and version.pool is not None:
+            version.pool.shutdown(wait=False)
+            version.pool = None
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, version, matrix: np.ndarray) -> np.ndarray:
+        """Score `matrix` with `version` without blocking the event loop (unless inline)."""
+        loop = asyncio.get_running_loop()
+        pool = version.pool
+        if pool is not None:
+            try:
+                return await loop.run_in_executor(pool, _worker_score, matrix)
+            except RuntimeError:
+                # Version was retired between capture and submit: score in-process
+                return await loop.run_in_executor(None, version.model.score, matrix)
+        if self._pool is None:
+            return version.model.score(matrix)
+        return await loop.run_in_executor(self._pool, version.model.score, matrix)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "workers": self.workers}
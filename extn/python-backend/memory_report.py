@@ -0,0 +1,232 @@
+"""
+Per-worker and total memory of the IDS API at several worker counts.
+
+For each worker count (default 1, 4, 16) and each variant (default: a
+private joblib-loaded model vs the shared memory-mapped bundle, see
+shared_model.py) this starts `uvicorn app:app --workers N`, waits until
+every worker is up, sends warm-up /predict-batch traffic, and then reads
+/proc/<pid>/smaps_rollup for the server and all its descendants:
+
+- RSS counts every resident page a process maps, shared or not, so
+  summing RSS over workers counts shared pages N times
+- PSS divides each shared page among the processes mapping it, so the
+  PSS total is the box's real footprint
+
+With --inference-process the workers are the app's own process pool
+(IDS_INFERENCE_MODE=process, IDS_INFERENCE_WORKERS=N) under a single
+uvicorn process.
+
+The checked-in pipeline is small. By default a stand-in forest large
+enough to dominate a worker's memory is fitted into a temporary
+directory (--trees, --rows); pass --model-dir to measure a real model.
+The shared bundle is built before the first shared run, as it would be
+at image build time. Linux only.
+
+    python memory_report.py --workers 1 4 16 --out memory.json
+    python memory_report.py --model-dir ../.. --variants shared
+"""
+from typing import Any, Dict, List, Optional
+import argparse, json, os, shutil, signal, subprocess, sys, tempfile, time
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from bench import build_stand_in, free_port  # noqa: E402
+
+VARIANTS = {
+    "private": {"IDS_SHARED_MODEL": "0"},
+    "shared": {"IDS_SHARED_MODEL": "1"},
+}
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def smaps(pid: int) -> Optional[Dict[str, int]]:
+    """Memory totals (KiB) of a live process from /proc/<pid>/smaps_rollup."""
+    totals = dict.fromkeys(SMAPS_FIELDS, 0)
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in totals:
+                    totals[key] += int(rest.split()[0])
+    except OSError:
+        return None
+    return totals
+
+
+def descendants(root: int) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; ppid follows the closing paren
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    found, stack = [], [root]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+    except OSError:
+        return ""
+
+
+def snapshot(root: int) -> List[Dict[str, Any]]:
+    procs = []
+    for pid in [root] + descendants(root):
+        mem = smaps(pid)
+        if mem is None:
+            continue
+        cmd = _cmdline(pid)
+        # multiprocessing's resource tracker is tiny and not a worker
+        if "resource_tracker" in cmd:
+            continue
+        procs.append({"pid": pid, "role": "server" if pid == root else "worker", **mem})
+    return procs
+
+
+def _wait_ready(proc, url: str, workers: int, timeout: float) -> List[Dict[str, Any]]:
+    """Wait for the health check, then for `workers` children whose PSS has settled."""
+    import httpx
+    deadline = time.monotonic() + timeout
+    previous = None
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            httpx.get(url + "/", timeout=2.0)
+        except httpx.HTTPError:
+            time.sleep(0.5)
+            continue
+        procs = snapshot(proc.pid)
+        total = sum(p["Pss"] for p in procs)
+        if len(procs) - 1 >= workers and previous and abs(total - previous) <= 0.01 * previous:
+            return procs
+        previous = total
+        time.sleep(1.0)
+    raise RuntimeError(f"{workers} workers did not settle within {timeout:.0f}s")
+
+
+def measure(env: Dict[str, str], workers: int, inference_process: bool, rows: np.ndarray,
+            requests: int, batch: int, timeout: float) -> Dict[str, Any]:
+    import httpx
+    port = free_port()
+    env = {**os.environ, **env, "IDS_AUTO_RELOAD": "0"}
+    cmd = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning"]
+    if inference_process:
+        env.update(IDS_INFERENCE_MODE="process", IDS_INFERENCE_WORKERS=str(workers))
+    elif workers > 1:
+        cmd += ["--workers", str(workers)]
+    url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL)
+    try:
+        # A single uvicorn process serves requests itself; it is its own worker
+        expected = workers if (inference_process or workers > 1) else 0
+        _wait_ready(proc, url, expected, timeout)
+        ready = time.monotonic() - started
+        rng = np.random.default_rng(0)
+        errors = 0
+        with httpx.Client(base_url=url, timeout=60.0) as client:
+            for _ in range(requests):
+                pick = rows[rng.integers(0, len(rows), size=batch)]
+                if client.post("/predict-batch", json={"features": pick.tolist()}).status_code != 200:
+                    errors += 1
+            health = client.get("/").json()
+        procs = snapshot(proc.pid)
+    finally:
+        children = descendants(proc.pid)
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        # Process-pool workers can outlive a server that was stopped mid-shutdown
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+    worker_procs = [p for p in procs if p["role"] == "worker"] or procs
+    mb = lambda kib: round(kib / 1024.0, 1)
+    return {
+        "workers": workers,
+        "ready_seconds": round(ready, 2),
+        "requests": requests,
+        "errors": errors,
+        "fast_path": {k: health.get("fast_path", {}).get(k) for k in ("engine", "shared", "table_bytes")},
+        "processes": [{**p, **{k: mb(p[k]) for k in SMAPS_FIELDS}} for p in procs],
+        "per_worker_rss_mb": mb(np.mean([p["Rss"] for p in worker_procs])),
+        "per_worker_pss_mb": mb(np.mean([p["Pss"] for p in worker_procs])),
+        "total_rss_mb": mb(sum(p["Rss"] for p in procs)),
+        "total_pss_mb": mb(sum(p["Pss"] for p in procs)),
+    }
+
+
+def main(argv: Optional[list] = None) -> int:
+    from inference import probe_matrix
+    parser = argparse.ArgumentParser(description="RSS/PSS of the IDS API per worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--inference-process", action="store_true",
+                        help="measure the app's process pool instead of uvicorn --workers")
+    parser.add_argument("--model-dir", help="directory with ids_pipeline.pkl (default: fit a stand-in)")
+    parser.add_argument("--trees", type=int, default=100, help="stand-in forest size")
+    parser.add_argument("--rows", type=int, default=50000, help="stand-in training rows")
+    parser.add_argument("--requests", type=int, default=50, help="warm-up /predict-batch calls")
+    parser.add_argument("--batch", type=int, default=1000, help="rows per warm-up call")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--out", default="memory.json")
+    args = parser.parse_args(argv)
+
+    model_dir, stand_in_dir = args.model_dir, None
+    if not model_dir:
+        stand_in_dir = model_dir = tempfile.mkdtemp(prefix="ids-memory-")
+        started = time.perf_counter()
+        # Unlimited depth on synthetic rows: deep trees, like the production forest
+        build_stand_in(model_dir, "", 0, rows=args.rows, n_estimators=args.trees, max_depth=None)
+        print(f"ℹ️ Stand-in model ({args.trees} trees on {args.rows} rows) in {model_dir}, "
+              f"{os.path.getsize(os.path.join(model_dir, 'ids_pipeline.pkl')) / 1e6:.1f} MB "
+              f"({time.perf_counter() - started:.1f}s)")
+    if "shared" in args.variants:
+        # As at image build time, so no worker pays for building the bundle
+        subprocess.run([sys.executable, os.path.join(HERE, "shared_model.py"),
+                        os.path.join(model_dir, "ids_pipeline.pkl")], check=True)
+    rows = probe_matrix(4096)
+
+    results = []
+    try:
+        for variant in args.variants:
+            env = {**VARIANTS[variant], "IDS_MODEL_DIR": os.path.abspath(model_dir), "IDS_ENGINE": "compiled"}
+            for workers in args.workers:
+                result = measure(env, workers, args.inference_process, rows, args.requests,
+                                 args.batch, args.timeout)
+                result["variant"] = variant
+                results.append(result)
+                print(f"{variant:8s} {workers:3d} workers: per worker RSS {result['per_worker_rss_mb']:7.1f} MB "
+                      f"PSS {result['per_worker_pss_mb']:7.1f} MB | total RSS {result['total_rss_mb']:8.1f} MB "
+                      f"PSS {result['total_pss_mb']:8.1f} MB ({result['errors']} errors)")
+    finally:
+        if stand_in_dir:
+            shutil.rmtree(stand_in_dir, ignore_errors=True)
+
+    with open(args.out, "w") as f:
+        json.dump({"inference_process": args.inference_process, "results": results}, f, indent=2)
+    print(f"✔ -> {args.out}")
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
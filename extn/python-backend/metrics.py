@@ -0,0 +1,236 @@
+"""
+Low-overhead in-process metrics in Prometheus text format.
+
+- `Counter` / `Histogram`: labelled, lock-protected, fixed buckets
+- `MetricsRegistry.render()`: text exposition format 0.0.4 for /metrics
+- `MetricsMiddleware`: pure ASGI; counts requests, times them end to end
+  and gives each request a `StageTimer` (request.state.stage_timer)
+- `StageTimer.mark(stage)`: time since the previous mark goes into
+  ids_stage_seconds{route, stage}; whatever is left when the response
+  has been sent is recorded as the "serialize" stage
+- `DebugLog`: opt-in, rate-limited replacement for per-request prints
+
+No dependency on prometheus_client; one perf_counter() call per mark.
+"""
+from typing import Callable, Dict, Iterable, List, Tuple
+from bisect import bisect_left
+import math, threading, time
+
+# Seconds; spans sub-100µs fast-path stages up to multi-second stalls
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    v = float(v)
+    return str(int(v)) if v.is_integer() and abs(v) < 1e15 else repr(v)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_fmt(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series[:-1]):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{_fmt(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            base = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{base} {repr(float(series[-1]))}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List = []
+        # name -> (help, type, callback returning {labels tuple: value})
+        self._callbacks: List[Tuple[str, str, str, Tuple[str, ...], Callable]] = []
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def callback(self, name: str, help_text: str, kind: str, fn: Callable,
+                 labelnames: Iterable[str] = ()):
+        """Expose a value owned elsewhere (cache, batcher...), read at scrape time."""
+        self._callbacks.append((name, help_text, kind, tuple(labelnames), fn))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_text, kind, labelnames, fn in self._callbacks:
+            try:
+                values = fn()
+            except Exception:
+                continue
+            if values is None:
+                continue
+            if not isinstance(values, dict):
+                values = {(): values}
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{_labels(labelnames, labels)} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    __slots__ = ("route", "_hist", "_last")
+
+    def __init__(self, hist: Histogram, started: float):
+        self.route = "other"
+        self._hist = hist
+        self._last = started
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self._hist.observe(now - self._last, self.route, stage)
+        self._last = now
+
+    def finish(self, stage: str = "serialize"):
+        self.mark(stage)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware task/stream overhead).
+    Only routes in `timed_routes` get per-stage timing; all requests are
+    counted under their route template so label cardinality stays bounded.
+    """
+
+    def __init__(self, app, requests: Counter, duration: Histogram, stages: Histogram,
+                 timed_routes: Iterable[str] = ()):
+        self.app = app
+        self.requests = requests
+        self.duration = duration
+        self.stages = stages
+        self.timed_routes = set(timed_routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        timer = StageTimer(self.stages, started)
+        if scope["path"] in self.timed_routes:
+            timer.route = scope["path"]
+            scope.setdefault("state", {})["stage_timer"] = timer
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "other"
+            if timer.route != "other":
+                timer.finish()
+            self.duration.observe(time.perf_counter() - started, route)
+            self.requests.inc(route, str(status["code"]))
+
+
+class DebugLog:
+    """Prints at most `per_second` messages per second when enabled; counts the rest."""
+
+    def __init__(self, enabled: bool, per_second: float = 5.0):
+        self.enabled = enabled
+        self.rate = per_second
+        self._tokens = per_second
+        self._last = time.monotonic()
+        self.suppressed = 0
+
+    def __call__(self, *args):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens < 1.0:
+            self.suppressed += 1
+            return
+        self._tokens -= 1.0
+        print(*args)
+
+
+class _NullTimer:
+    def mark(self, stage: str):
+        pass
+
+    def finish(self, stage: str = "serialize"):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def stage_timer(request):
+    """The request's StageTimer, or a no-op one if the route is not timed."""
+    return getattr(request.state, "stage_timer", _NULL_TIMER)
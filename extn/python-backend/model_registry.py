@@ -0,0 +1,228 @@
+"""
+Versioned model registry with atomic swap and shadow scoring.
+
+A `ModelVersion` bundles everything one prediction needs (pipeline,
+validated scoring path, threshold) so a request that captured it keeps a
+consistent view even if a new version goes live mid-request. Loading and
+warming a candidate happens off the event loop; going live is a single
+reference assignment.
+
+An optional shadow version scores a configurable fraction of live
+traffic on its own thread, after the live response has been computed,
+so its latency and prediction disagreements can be compared with the
+live model before promoting it.
+"""
+from typing import Any, Dict, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio, hashlib, json, os, random, threading, time
+import numpy as np
+from cascade import cascade_path
+from inference import LoadedModel, load_model, probe_matrix
+
+
+def file_fingerprint(path: str) -> Dict[str, Any]:
+    try:
+        st = os.stat(path)
+        return {"file": os.path.basename(path), "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+    except OSError:
+        return {"file": os.path.basename(path), "mtime_ns": None, "size": None}
+
+
+class ModelVersion:
+    def __init__(self, version: str, pipeline, model: LoadedModel, threshold: float,
+                 pipeline_file: str, threshold_file: str, fingerprint: tuple, load_seconds: float):
+        self.version = version
+        self.pipeline = pipeline
+        self.model = model
+        self.threshold = threshold
+        self.pipeline_file = pipeline_file
+        self.threshold_file = threshold_file
+        self.fingerprint = fingerprint
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        # Process pool bound to this version (process inference mode only)
+        self.pool = None
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "threshold": self.threshold,
+            "pipeline_file": self.pipeline_file,
+            "threshold_file": self.threshold_file,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "fast_path": self.model.fast_status,
+        }
+
+
+class LatencyWindow:
+    """Recent call latencies (seconds) and row counts for percentile reporting."""
+
+    def __init__(self, size: int = 2048):
+        self._calls = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.rows = 0
+
+    def record(self, seconds: float, rows: int):
+        with self._lock:
+            self._calls.append((seconds, rows))
+            self.calls += 1
+            self.rows += rows
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            window = list(self._calls)
+        resp = {"calls": self.calls, "rows": self.rows}
+        if window:
+            secs = np.array([s for s, _ in window]) * 1000.0
+            rows = sum(r for _, r in window)
+            p50, p95, p99 = np.percentile(secs, [50, 95, 99])
+            resp.update({
+                "latency_ms": {"p50": float(p50), "p95": float(p95), "p99": float(p99),
+                               "mean": float(secs.mean())},
+                "us_per_row": float(secs.sum() * 1000.0 / max(rows, 1)),
+            })
+        return resp
+
+
+class ModelRegistry:
+    def __init__(self, model_options: Dict[str, Any], shadow_fraction: float = 0.0,
+                 shadow_max_pending: int = 32, warmup_rows: int = 64,
+                 default_threshold: float = 0.5):
+        self.model_options = dict(model_options)
+        # Used when a version is loaded without a threshold file
+        self.default_threshold = default_threshold
+        self.shadow_fraction = shadow_fraction
+        self.shadow_max_pending = shadow_max_pending
+        self.warmup_rows = warmup_rows
+        # Swapped by plain assignment; readers take one reference per request
+        self.live: Optional[ModelVersion] = None
+        self.shadow: Optional[ModelVersion] = None
+        self.last_error: Optional[str] = None
+        self.swaps = 0
+        self._counter = 0
+        self._live_latency = LatencyWindow()
+        self._shadow_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ids-shadow")
+        self._shadow_pending = 0
+        self._reset_shadow_stats()
+
+    def _reset_shadow_stats(self):
+        self._shadow_latency = LatencyWindow()
+        self.shadow_dropped = 0
+        self.shadow_errors = 0
+        self.shadow_rows = 0
+        self.shadow_disagreements = 0
+        self.shadow_abs_diff_sum = 0.0
+
+    # ---- loading and swapping ----
+
+    def fingerprint(self, pipeline_file: str, threshold_file: str) -> tuple:
+        """Files a version is loaded from; a change to any of them means a reload."""
+        files = [pipeline_file, threshold_file]
+        if self.model_options.get("cascade"):
+            files.append(cascade_path(pipeline_file))
+        return tuple(file_fingerprint(path) for path in files)
+
+    def load(self, pipeline_file: str, threshold_file: str) -> ModelVersion:
+        """Load, validate and warm a new version. Blocking: run off the event loop."""
+        started = time.perf_counter()
+        fingerprint = self.fingerprint(pipeline_file, threshold_file)
+        threshold = self.default_threshold
+        if os.path.exists(threshold_file):
+            with open(threshold_file) as f:
+                threshold = float(json.load(f)["threshold"])
+        # pipeline is None when the model is served from the shared bundle
+        pipeline, model = load_model(pipeline_file, threshold=threshold, **self.model_options)
+        # Warm-up: first calls pay for lazy allocations and imports
+        probe = probe_matrix(max(self.warmup_rows, 1))
+        model.score(probe[:1])
+        model.score(probe)
+
+        self._counter += 1
+        digest = hashlib.sha1(repr(fingerprint).encode()).hexdigest()[:8]
+        return ModelVersion(f"v{self._counter}-{digest}", pipeline, model, threshold,
+                            pipeline_file, threshold_file, fingerprint,
+                            time.perf_counter() - started)
+
+    def set_live(self, version: ModelVersion) -> Optional[ModelVersion]:
+        """Atomically make `version` live; returns the version it replaced."""
+        previous, self.live = self.live, version
+        if previous is not None:
+            self.swaps += 1
+        self._live_latency = LatencyWindow()
+        if self.shadow is version:
+            self.shadow = None
+            self._reset_shadow_stats()
+        return previous
+
+    def set_shadow(self, version: Optional[ModelVersion]):
+        self.shadow = version
+        self._reset_shadow_stats()
+
+    # ---- scoring bookkeeping ----
+
+    def record_live(self, seconds: float, rows: int):
+        self._live_latency.record(seconds, rows)
+
+    def maybe_shadow(self, matrix: np.ndarray, live_probs: np.ndarray, live: ModelVersion):
+        """
+        Schedule shadow scoring for a sampled fraction of traffic. Never
+        waits: if the shadow thread is backed up the sample is dropped.
+        """
+        shadow = self.shadow
+        if shadow is None or self.shadow_fraction <= 0 or random.random() >= self.shadow_fraction:
+            return
+        if self._shadow_pending >= self.shadow_max_pending:
+            self.shadow_dropped += 1
+            return
+        self._shadow_pending += 1
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(self._shadow_pool, self._shadow_score, shadow, live,
+                                   np.array(matrix, copy=True), np.array(live_probs, copy=True))
+        fut.add_done_callback(self._shadow_done)
+
+    def _shadow_done(self, fut):
+        self._shadow_pending -= 1
+        if not fut.cancelled() and fut.exception() is not None:
+            self.shadow_errors += 1
+
+    def _shadow_score(self, shadow: ModelVersion, live: ModelVersion,
+                      matrix: np.ndarray, live_probs: np.ndarray):
+        started = time.perf_counter()
+        probs = shadow.model.score(matrix)
+        elapsed = time.perf_counter() - started
+        if shadow is not self.shadow:
+            # Shadow was replaced while this sample was queued
+            return
+        self._shadow_latency.record(elapsed, len(matrix))
+        flips = (probs >= shadow.threshold) != (live_probs >= live.threshold)
+        self.shadow_rows += len(matrix)
+        self.shadow_disagreements += int(flips.sum())
+        self.shadow_abs_diff_sum += float(np.abs(probs - live_probs).sum())
+
+    def shutdown(self):
+        self._shadow_pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        resp: Dict[str, Any] = {
+            "live": self.live.describe() if self.live else None,
+            "swaps": self.swaps,
+            "last_error": self.last_error,
+            "live_scoring": self._live_latency.summary(),
+        }
+        if self.shadow is not None:
+            resp["shadow"] = self.shadow.describe()
+            resp["shadow_scoring"] = {
+                "fraction": self.shadow_fraction,
+                **self._shadow_latency.summary(),
+                "rows_compared": self.shadow_rows,
+                "disagreements": self.shadow_disagreements,
+                "disagreement_rate": self.shadow_disagreements / self.shadow_rows if self.shadow_rows else 0.0,
+                "mean_abs_prob_diff": self.shadow_abs_diff_sum / self.shadow_rows if self.shadow_rows else 0.0,
+                "pending": self._shadow_pending,
+                "dropped": self.shadow_dropped,
+                "errors": self.shadow_errors,
+            }
+        return resp
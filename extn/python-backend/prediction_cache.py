@@ -0,0 +1,111 @@
+"""
+Bounded LRU/TTL cache of attack probabilities keyed on flow features.
+
+Much of the traffic is repeated identical short flows (DNS lookups,
+health probes, scanner bursts), which would otherwise be re-scored from
+scratch. Keys are the 10 TOP_FEATS values, canonicalised (and optionally
+rounded) into a tuple. Only the probability is cached; the prediction is
+still derived from the current threshold by the caller.
+
+Every entry belongs to a model version. Setting a new version (new
+pipeline or threshold) drops all entries at once.
+"""
+from typing import Any, Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+import math, sys, threading, time
+import numpy as np
+
+
+class PredictionCache:
+    def __init__(self, max_entries: int = 100_000, ttl_seconds: float = 300.0,
+                 quantize_decimals: Optional[int] = None, version: Hashable = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+        self.quantize_decimals = quantize_decimals
+        self.version = version
+        self._entries: "OrderedDict[Tuple, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def key(self, row: np.ndarray) -> Tuple:
+        """Canonical hashable key for one TOP_FEATS row."""
+        if self.quantize_decimals is not None:
+            row = np.round(row, self.quantize_decimals)
+        # NaN never compares equal, -0.0 and 0.0 should share an entry
+        return tuple(None if math.isnan(v) else v + 0.0 for v in row.tolist())
+
+    def get(self, key: Tuple, version: Hashable = None) -> Optional[float]:
+        with self._lock:
+            if version is not None and version != self.version:
+                # Caller scored against another model version
+                self.misses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            prob, stored_at = entry
+            if self.ttl > 0 and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return prob
+
+    def put(self, key: Tuple, prob: float, version: Hashable = None):
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = (prob, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_version(self, version: Hashable) -> bool:
+        """Switch to a new model version, dropping every entry if it changed."""
+        with self._lock:
+            if version == self.version:
+                return False
+            self.version = version
+            self._entries.clear()
+            self.invalidations += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def _approx_bytes(self) -> int:
+        if not self._entries:
+            return 0
+        key, value = next(iter(self._entries.items()))
+        per_entry = (sys.getsizeof(key) + sum(sys.getsizeof(v) for v in key)
+                     + sys.getsizeof(value) + 2 * sys.getsizeof(0.0) + 100)  # + dict/link overhead
+        return per_entry * len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "approx_bytes": self._approx_bytes(),
+                "ttl_seconds": self.ttl,
+                "quantize_decimals": self.quantize_decimals,
+                "version": str(self.version),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,314 @@
+"""
+Write-behind store of scored predictions, with rollups for the dashboard.
+
+The scoring routes call `record()` with the matrix, probabilities and
+predictions they just returned. That is an append to an in-memory list
+under a lock, so requests never touch the disk. A background thread
+drains the buffer every `flush_interval` seconds, or sooner once
+`flush_rows` rows are waiting. It writes each batch in one transaction
+to SQLite (WAL mode, so dashboard reads never block it):
+
+- `predictions`: append-only raw rows (time, route, model version,
+  prediction, probability and the 10 TOP_FEATS), indexed on time, for
+  the recent-traffic log; rows older than `retention_days` are pruned
+- `rollup_minute` / `rollup_hour`: row counts and probability sums per
+  (bucket, route, prediction, proto, state), upserted in the same
+  transaction. The primary key starts with the bucket, so a time-range
+  query is a range scan of the pre-aggregated rows and never touches
+  the raw table
+
+If the writer falls `max_pending` rows behind, new records are dropped
+and counted rather than blocking requests. Queries only see flushed
+rows, so they lag the live traffic by at most `flush_interval`.
+
+    store = PredictionStore("predictions.db"); store.start()
+    store.record(matrix, probs, preds, "/predict-batch", "v1")
+    store.rollup(start, end, step=3600, by="proto")
+"""
+from typing import Any, Dict, List, Optional
+import math, os, sqlite3, threading, time
+import numpy as np
+from inference import TOP_FEATS
+
+# Dimensions kept in the rollups, besides the bucket and the prediction
+ROLLUP_DIMS = ("route", "proto", "state")
+ROLLUP_LEVELS = {60: "rollup_minute", 3600: "rollup_hour"}
+MAX_BUCKETS = 10000
+PRUNE_EVERY = 3600.0
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS predictions (ts REAL NOT NULL, route TEXT, version TEXT, "
+    "prediction INTEGER NOT NULL, probability REAL NOT NULL, "
+    + ", ".join(f"{f} REAL" for f in TOP_FEATS) + ")",
+    "CREATE INDEX IF NOT EXISTS predictions_ts ON predictions (ts)",
+] + [
+    f"CREATE TABLE IF NOT EXISTS {table} (bucket INTEGER NOT NULL, route TEXT NOT NULL, "
+    "prediction INTEGER NOT NULL, proto INTEGER NOT NULL, state INTEGER NOT NULL, "
+    "n INTEGER NOT NULL, prob_sum REAL NOT NULL, "
+    "PRIMARY KEY (bucket, route, prediction, proto, state)) WITHOUT ROWID"
+    for table in ROLLUP_LEVELS.values()
+]
+INSERT_ROW = (f"INSERT INTO predictions (ts, route, version, prediction, probability, {', '.join(TOP_FEATS)}) "
+              f"VALUES ({', '.join('?' * (5 + len(TOP_FEATS)))})")
+UPSERT_ROLLUP = ("INSERT INTO {table} (bucket, route, prediction, proto, state, n, prob_sum) "
+                 "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (bucket, route, prediction, proto, state) "
+                 "DO UPDATE SET n = n + excluded.n, prob_sum = prob_sum + excluded.prob_sum")
+
+_PROTO = TOP_FEATS.index("proto")
+_STATE = TOP_FEATS.index("state")
+
+
+def _codes(column: np.ndarray) -> List[int]:
+    """Integer rollup keys; NaN/inf/out-of-range values (the binary ingest accepts them) become -1."""
+    valid = np.isfinite(column) & (np.abs(column) < 2 ** 31)
+    return np.where(valid, column, -1).astype(np.int64).tolist()
+
+
+class PredictionStore:
+    def __init__(self, path: str, flush_rows: int = 2048, flush_interval: float = 1.0,
+                 max_pending: int = 100000, retention_days: float = 7.0):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retention = retention_days * 86400.0
+        self._chunks: List[tuple] = []
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+        # Counters
+        self.rows_recorded = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.flush_seconds_total = 0.0
+        self.last_flush: Optional[float] = None
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        if readonly:
+            return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30.0)
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL is still durable across crashes with NORMAL, minus the last commits on power loss
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start(self):
+        """Create the schema and start the writer thread."""
+        if self._thread is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._connect()
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        conn.close()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="ids-store", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Flush what is buffered and stop the writer."""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    def record(self, matrix: np.ndarray, probs: np.ndarray, preds: np.ndarray,
+               route: str, version: Optional[str] = None):
+        """Buffer one request's results; never blocks on the disk."""
+        n = len(probs)
+        with self._lock:
+            if self._pending + n > self.max_pending:
+                self.rows_dropped += n
+                return
+            self._chunks.append((time.time(), route, version, matrix, probs, preds))
+            self._pending += n
+            self.rows_recorded += n
+            full = self._pending >= self.flush_rows
+        if full:
+            self._wake.set()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                stopping = self._stopping
+                self.flush(conn)
+                if self.retention and time.time() - self._last_prune >= PRUNE_EVERY:
+                    self.prune(conn)
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    def flush(self, conn: sqlite3.Connection):
+        with self._lock:
+            chunks, self._chunks = self._chunks, []
+            n, self._pending = self._pending, 0
+        if not chunks:
+            return
+        started = time.perf_counter()
+        try:
+            rows, rollups = self._rows(chunks)
+            with conn:
+                conn.executemany(INSERT_ROW, rows)
+                for step, table in ROLLUP_LEVELS.items():
+                    conn.executemany(UPSERT_ROLLUP.format(table=table),
+                                     [key + tuple(agg) for key, agg in rollups[step].items()])
+        except Exception as e:
+            self.flush_errors += 1
+            self.rows_dropped += n
+            print(f"⚠️ Prediction store: {n} rows not written: {e}")
+            return
+        self.flushes += 1
+        self.rows_written += n
+        self.flush_seconds_total += time.perf_counter() - started
+        self.last_flush = time.time()
+
+    @staticmethod
+    def _rows(chunks: List[tuple]):
+        rows: List[tuple] = []
+        rollups: Dict[int, Dict[tuple, list]] = {step: {} for step in ROLLUP_LEVELS}
+        for ts, route, version, matrix, probs, preds in chunks:
+            matrix = np.asarray(matrix, dtype=np.float64)
+            preds = np.asarray(preds).astype(int).tolist()
+            probs = np.asarray(probs, dtype=np.float64).tolist()
+            features = matrix.tolist()
+            protos = _codes(matrix[:, _PROTO])
+            states = _codes(matrix[:, _STATE])
+            for pred, prob, feats in zip(preds, probs, features):
+                rows.append((ts, route, version, pred, prob, *feats))
+            # Every row of a request shares its timestamp, so one bucket per level
+            buckets = {step: int(ts) // step * step for step in ROLLUP_LEVELS}
+            for pred, prob, proto, state in zip(preds, probs, protos, states):
+                for step, bucket in buckets.items():
+                    agg = rollups[step].setdefault((bucket, route, pred, proto, state), [0, 0.0])
+                    agg[0] += 1
+                    agg[1] += prob
+        return rows, rollups
+
+    def prune(self, conn: sqlite3.Connection):
+        """Drop raw rows past the retention window; rollups are kept."""
+        self._last_prune = time.time()
+        try:
+            with conn:
+                conn.execute("DELETE FROM predictions WHERE ts < ?", (self._last_prune - self.retention,))
+        except sqlite3.Error as e:
+            print(f"⚠️ Prediction store: prune failed: {e}")
+
+    # ---- queries (any thread; each opens its own read-only connection) ----
+
+    def rollup(self, start: float, end: float, step: int = 3600, by: Optional[str] = None,
+               route: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Normal/attack counts per `step`-second bucket in [start, end), from
+        the hourly rollups when `step` is a whole number of hours and the
+        minute rollups otherwise. With `by`, also totals per value of that
+        dimension over the whole range. Raises ValueError on bad arguments.
+        """
+        if step <= 0 or step % 60:
+            raise ValueError("step must be a positive multiple of 60 seconds")
+        if by is not None and by not in ROLLUP_DIMS:
+            raise ValueError(f"by must be one of {ROLLUP_DIMS}")
+        first = int(start) // step * step
+        n_buckets = -(-(int(end) - first) // step)
+        if n_buckets <= 0:
+            raise ValueError("end must be after start")
+        if n_buckets > MAX_BUCKETS:
+            raise ValueError(f"{n_buckets} buckets requested; at most {MAX_BUCKETS}, use a larger step")
+        table = ROLLUP_LEVELS[3600] if step % 3600 == 0 else ROLLUP_LEVELS[60]
+        where = "bucket >= ? AND bucket < ?"
+        params: list = [first, first + n_buckets * step]
+        if route:
+            where += " AND route = ?"
+            params.append(route)
+
+        series = [{"t": first + i * step, "total": 0, "normal": 0, "attacks": 0, "mean_probability": None}
+                  for i in range(n_buckets)]
+        prob_sums = [0.0] * n_buckets
+        conn = self._connect(readonly=True)
+        try:
+            for t, pred, n, prob_sum in conn.execute(
+                    f"SELECT (bucket - ?) / ? AS i, prediction, SUM(n), SUM(prob_sum) FROM {table} "
+                    f"WHERE {where} GROUP BY i, prediction", [first, step] + params):
+                entry = series[t]
+                entry["total"] += n
+                entry["attacks" if pred else "normal"] += n
+                prob_sums[t] += prob_sum
+            groups = []
+            if by:
+                grouped: Dict[Any, Dict[str, Any]] = {}
+                for value, pred, n in conn.execute(
+                        f"SELECT {by}, prediction, SUM(n) FROM {table} WHERE {where} GROUP BY {by}, prediction",
+                        params):
+                    entry = grouped.setdefault(value, {"value": value, "total": 0, "normal": 0, "attacks": 0})
+                    entry["total"] += n
+                    entry["attacks" if pred else "normal"] += n
+                groups = sorted(grouped.values(), key=lambda g: -g["total"])
+        finally:
+            conn.close()
+
+        for entry, prob_sum in zip(series, prob_sums):
+            if entry["total"]:
+                entry["mean_probability"] = prob_sum / entry["total"]
+        resp: Dict[str, Any] = {
+            "start": first,
+            "end": first + n_buckets * step,
+            "step": step,
+            "source": table,
+            "totals": {k: sum(e[k] for e in series) for k in ("total", "normal", "attacks")},
+            "series": series,
+        }
+        if by:
+            resp["by"] = {"field": by, "groups": groups}
+        return resp
+
+    def recent(self, limit: int = 100, attacks_only: bool = False,
+               since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Newest raw rows first, for the traffic log."""
+        where, params = [], []
+        if attacks_only:
+            where.append("prediction = 1")
+        if since is not None:
+            where.append("ts >= ?")
+            params.append(since)
+        sql = "SELECT * FROM predictions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        conn = self._connect(readonly=True)
+        try:
+            cursor = conn.execute(sql, params + [max(0, limit)])
+            names = [d[0] for d in cursor.description]
+            # Stored inf (and NaN, if any) would make the response unencodable as JSON
+            return [{k: None if isinstance(v, float) and not math.isfinite(v) else v
+                     for k, v in zip(names, row)} for row in cursor]
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "path": self.path,
+            "pending_rows": self._pending,
+            "rows_recorded": self.rows_recorded,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "mean_flush_ms": self.flush_seconds_total / self.flushes * 1000.0 if self.flushes else None,
+            "last_flush": self.last_flush,
+        }
@@ -0,0 +1,141 @@
+"""
+Compact, memory-mapped pool of labelled sample rows for /sample-attack.
+
+Instead of parsing the whole test CSV at import time, the 10 TOP_FEATS
+columns plus `label` are written once to a binary sidecar (.npy) next to
+the CSV, with rows ordered normal-first / attack-last. A small JSON meta
+file records where the attack rows start and which CSV the sidecar was
+built from, so a changed CSV triggers a rebuild.
+
+On first use the sidecar is memory-mapped read-only; drawing a random
+attack sample is then a single random index. The meta file only decides
+whether the sidecar is fresh; the attack offset is found in the array.
+
+Precompute the sidecar (e.g. at image build time) with:
+
+    python sample_store.py [path/to/UNSW_NB15_testing_cleaned.csv]
+"""
+from typing import Any, Dict, List, Optional
+import json, os, random, sys, threading, time
+import numpy as np
+from inference import TOP_FEATS
+
+SIDECAR_COLUMNS = TOP_FEATS + ['label']
+
+
+def sidecar_paths(csv_path: str):
+    stem, _ = os.path.splitext(csv_path)
+    return stem + ".samples.npy", stem + ".samples.json"
+
+
+def _source_fingerprint(csv_path: str) -> Dict[str, Any]:
+    st = os.stat(csv_path)
+    return {"source": os.path.basename(csv_path), "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def build_sidecar(csv_path: str) -> Dict[str, Any]:
+    """Read only the needed CSV columns and write the sorted sidecar + meta."""
+    import pandas as pd
+    npy_path, meta_path = sidecar_paths(csv_path)
+    frame = pd.read_csv(csv_path, usecols=SIDECAR_COLUMNS, dtype=np.float64)
+    rows = frame[SIDECAR_COLUMNS].to_numpy(dtype=np.float64)
+    # Stable sort keeps CSV order within each class
+    rows = rows[np.argsort(rows[:, -1] == 1, kind="stable")]
+    attack_start = int(np.searchsorted(rows[:, -1] == 1, True))
+
+    meta = {
+        "columns": SIDECAR_COLUMNS,
+        "rows": int(len(rows)),
+        "attack_start": attack_start,
+        **_source_fingerprint(csv_path),
+    }
+    # Write to temp names then rename, so readers never see a partial file.
+    # The meta goes last; readers take attack_start from the array itself
+    tmp_npy = npy_path + ".tmp.npy"
+    np.save(tmp_npy, np.ascontiguousarray(rows))
+    os.replace(tmp_npy, npy_path)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    return meta
+
+
+class SampleStore:
+    """Lazily opened, memory-mapped sample pool. Thread-safe to open."""
+
+    def __init__(self, csv_path: str):
+        self.csv_path = csv_path
+        self.npy_path, self.meta_path = sidecar_paths(csv_path)
+        self._rows: Optional[np.ndarray] = None
+        self._attack_start = 0
+        self._lock = threading.Lock()
+        self.open_seconds: Optional[float] = None
+        self.built = False
+
+    def _is_fresh(self) -> bool:
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not os.path.exists(self.npy_path) or meta.get("columns") != SIDECAR_COLUMNS:
+            return False
+        if not os.path.exists(self.csv_path):
+            # Shipped sidecar without its CSV: use it as-is
+            return True
+        fp = _source_fingerprint(self.csv_path)
+        return all(meta.get(k) == v for k, v in fp.items())
+
+    def _open(self):
+        started = time.perf_counter()
+        if not self._is_fresh():
+            if not os.path.exists(self.csv_path):
+                raise FileNotFoundError(f"Test CSV not found at {self.csv_path}")
+            build_sidecar(self.csv_path)
+            self.built = True
+        rows = np.load(self.npy_path, mmap_mode="r")
+        # Rows are sorted by label, so the attack offset is a binary search of
+        # the array itself. Reading it from the meta file could pair a freshly
+        # replaced array with a stale offset while another process rebuilds
+        self._attack_start = int(np.searchsorted(rows[:, -1], 1.0))
+        self._rows = rows
+        self.open_seconds = time.perf_counter() - started
+
+    def rows(self) -> np.ndarray:
+        if self._rows is None:
+            with self._lock:
+                if self._rows is None:
+                    self._open()
+        return self._rows
+
+    def attack_count(self) -> int:
+        return len(self.rows()) - self._attack_start
+
+    def sample_attack(self) -> List[float]:
+        """TOP_FEATS values of one uniformly random attack row."""
+        rows = self.rows()
+        if self._attack_start >= len(rows):
+            raise LookupError("No attack rows found in test CSV")
+        row = rows[random.randrange(self._attack_start, len(rows))]
+        return [float(v) for v in row[:len(TOP_FEATS)]]
+
+    def describe(self) -> Dict[str, Any]:
+        if self._rows is None:
+            return {"opened": False, "sidecar": os.path.basename(self.npy_path)}
+        return {
+            "opened": True,
+            "sidecar": os.path.basename(self.npy_path),
+            "rows": int(len(self._rows)),
+            "attack_rows": self.attack_count(),
+            "built_on_open": self.built,
+            "open_seconds": self.open_seconds,
+        }
+
+
+if __name__ == "__main__":
+    base = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    csv = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base, "UNSW_NB15_testing_cleaned.csv")
+    t0 = time.perf_counter()
+    meta = build_sidecar(csv)
+    print(f"✔ Wrote {sidecar_paths(csv)[0]} ({meta['rows']} rows, "
+          f"{meta['rows'] - meta['attack_start']} attacks) in {time.perf_counter() - t0:.2f}s")
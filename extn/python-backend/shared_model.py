@@ -0,0 +1,194 @@
+"""
+Memory-mapped model bundles shared between worker processes.
+
+With joblib.load, every uvicorn worker (and every process-mode inference
+worker) gets a private copy of the forest. sklearn copies each tree's
+node array into its own buffer when unpickling, so those pages can never
+be shared, and RSS grows linearly with the number of workers.
+
+A bundle stores only what the compiled scoring path needs:
+- the flattened node tables (forest_engine.CompiledForest), one .npy
+  per array
+- the extracted preprocessing (column gather + elementwise ops)
+- the build-time scores of a fixed probe
+
+Workers np.load the tables with mmap_mode="r". Pages are read in lazily
+from the OS page cache and shared by every process that maps the same
+files, so N workers pay for the tables once. Loading a bundle never
+unpickles the pipeline or imports sklearn.
+
+Layout, next to the pipeline file:
+
+    ids_pipeline.shared/current.json     build id, source fingerprint, preprocessing
+    ids_pipeline.shared/<build>/*.npy    node tables
+
+A build writes a new <build>/ directory, then swaps current.json with an
+atomic rename, so a worker never maps a half-written bundle. A stale or
+missing bundle is rebuilt on load under a file lock: when N workers
+start together, one builds and the rest wait and map its result.
+Prebuild at image build time with:
+
+    python shared_model.py [path/to/ids_pipeline.pkl] [--precision float64]
+"""
+from typing import Any, Dict, Optional, Tuple
+import argparse, fcntl, json, os, shutil, sys, time, uuid
+from contextlib import contextmanager
+import numpy as np
+from forest_engine import EXPECTED_ERROR, PRECISIONS, CompiledForest
+from inference import FastPath, probe_matrix
+
+# 2: float32 thresholds rounded down (forest_engine.float32_floor), not to nearest
+BUNDLE_FORMAT = 2
+TABLES = ("feature", "threshold", "left", "right", "is_leaf", "value", "roots")
+PROBE_ROWS = 64
+
+
+def bundle_dir(pipeline_file: str) -> str:
+    stem, _ = os.path.splitext(pipeline_file)
+    return stem + ".shared"
+
+
+def _source_fingerprint(path: str) -> Dict[str, Any]:
+    st = os.stat(path)
+    return {"source": os.path.basename(path), "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def _read_meta(directory: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(directory, "current.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(pipeline_file: str, precision: str = "float64") -> bool:
+    directory = bundle_dir(pipeline_file)
+    meta = _read_meta(directory)
+    if meta is None or meta.get("format") != BUNDLE_FORMAT or meta.get("precision") != precision:
+        return False
+    if not os.path.isdir(os.path.join(directory, meta["build"])):
+        return False
+    if not os.path.exists(pipeline_file):
+        # Shipped bundle without its pipeline: use it as-is
+        return True
+    fp = _source_fingerprint(pipeline_file)
+    return all(meta.get(k) == v for k, v in fp.items())
+
+
+@contextmanager
+def _build_lock(directory: str):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def build_bundle(pipeline_file: str, precision: str = "float64") -> Dict[str, Any]:
+    """
+    Compile the pipeline, check it against predict_proba and write a new
+    bundle. Raises inference.UnsupportedStep or ValueError if the
+    pipeline cannot be served from node tables.
+    """
+    import joblib
+    from inference import compile_fast_path, self_check
+    from forest_engine import compile_pipeline_forest
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+    fingerprint = _source_fingerprint(pipeline_file)
+    pipeline = joblib.load(pipeline_file)
+    fast = compile_fast_path(pipeline)
+    forest = compile_pipeline_forest(pipeline, precision)
+    candidate = FastPath(fast.take, fast.ops, forest)
+    check = self_check(candidate, pipeline, EXPECTED_ERROR[precision])
+    if not check["passed"]:
+        raise ValueError(f"compiled {precision} forest does not match predict_proba "
+                         f"(max abs diff {check['max_abs_diff']})")
+
+    directory = bundle_dir(pipeline_file)
+    build = uuid.uuid4().hex[:12]
+    target = os.path.join(directory, build)
+    os.makedirs(target)
+    for name in TABLES:
+        np.save(os.path.join(target, name + ".npy"), np.ascontiguousarray(getattr(forest, name)))
+    meta = {
+        "format": BUNDLE_FORMAT,
+        "build": build,
+        "precision": precision,
+        "max_depth": forest.max_depth,
+        "n_features": forest.n_features,
+        "take": fast.take.tolist(),
+        "ops": [[op, vec.tolist()] for op, vec in fast.ops],
+        "probe": candidate.score(probe_matrix(PROBE_ROWS)).tolist(),
+        "check": check,
+        "table_bytes": forest.nbytes,
+        **fingerprint,
+    }
+    tmp = os.path.join(directory, "current.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, "current.json"))
+    # Workers still mapping an older build keep their pages until they exit
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if entry != build and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return meta
+
+
+def load_bundle(pipeline_file: str, precision: str = "float64") -> Tuple[FastPath, Dict[str, Any]]:
+    """(memory-mapped scoring path, status), building the bundle first if it is stale."""
+    started = time.perf_counter()
+    built = False
+    if not is_fresh(pipeline_file, precision):
+        directory = bundle_dir(pipeline_file)
+        with _build_lock(directory):
+            # Another worker may have built it while this one waited
+            if not is_fresh(pipeline_file, precision):
+                if not os.path.exists(pipeline_file):
+                    raise FileNotFoundError(f"Pipeline file not found: {pipeline_file}")
+                build_bundle(pipeline_file, precision)
+                built = True
+    directory = bundle_dir(pipeline_file)
+    meta = _read_meta(directory)
+    target = os.path.join(directory, meta["build"])
+    # Plain ndarray views over the read-only maps, without np.memmap's per-operation overhead
+    tables = {name: np.load(os.path.join(target, name + ".npy"), mmap_mode="r").view(np.ndarray)
+              for name in TABLES}
+    forest = CompiledForest(**tables, max_depth=meta["max_depth"], n_features=meta["n_features"],
+                            precision=meta["precision"])
+    fast = FastPath(np.asarray(meta["take"], dtype=np.intp),
+                    [(op, np.asarray(vec, dtype=np.float64)) for op, vec in meta["ops"]], forest)
+    if not np.array_equal(fast.score(probe_matrix(PROBE_ROWS)), np.asarray(meta["probe"])):
+        raise ValueError(f"shared bundle {meta['build']} does not reproduce its build-time scores")
+    status = {
+        "enabled": True,
+        **forest.describe(),
+        **fast.describe(),
+        "shared": True,
+        "bundle": meta["build"],
+        "built_on_load": built,
+        "load_seconds": time.perf_counter() - started,
+        "check": meta["check"],
+    }
+    return fast, status
+
+
+def main(argv: Optional[list] = None) -> int:
+    base = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser = argparse.ArgumentParser(description="Build the memory-mapped model bundle")
+    parser.add_argument("pipeline", nargs="?", default=os.path.join(base, "ids_pipeline.pkl"))
+    parser.add_argument("--precision", choices=PRECISIONS, default="float64")
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    with _build_lock(bundle_dir(args.pipeline)):
+        meta = build_bundle(args.pipeline, args.precision)
+    print(f"✔ Wrote {bundle_dir(args.pipeline)}/{meta['build']} ({meta['table_bytes'] / 1e6:.1f} MB of "
+          f"{meta['precision']} tables) in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
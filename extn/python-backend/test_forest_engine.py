@@ -0,0 +1,64 @@
+"""
+CompiledForest against sklearn on a small synthetic forest, so the
+equivalence check runs without the deployed pickle and CSV.
+
+    python -m pytest test_forest_engine.py
+"""
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from forest_engine import EXPECTED_ERROR, PRECISIONS, CompiledForest, float32_floor
+
+
+@pytest.fixture(scope="module")
+def forest_and_rows():
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.integers(0, 5, 3000), rng.exponential(1e-3, 3000),
+                         rng.normal(0, 1, (3000, 8))])
+    y = (X[:, 0] * 0.3 + X[:, 2] - X[:, 3] + rng.normal(0, 0.5, 3000) > 1).astype(int)
+    forest = RandomForestClassifier(n_estimators=15, max_depth=10, random_state=0).fit(X, y)
+    # Rows sitting on either side of every split threshold, as float32 inputs
+    # see them, plus ordinary rows
+    rows = [X[:500]]
+    for est in forest.estimators_:
+        tree = est.tree_
+        internal = tree.children_left != -1
+        for feat, thr in zip(tree.feature[internal], tree.threshold[internal]):
+            below = float32_floor(np.array([thr]))[0]
+            for value in (below, np.nextafter(below, np.float32(np.inf))):
+                row = X[rng.integers(0, len(X))].copy()
+                row[feat] = value
+                rows.append(row[None, :])
+    return forest, np.vstack(rows)
+
+
+def test_float32_floor():
+    values = np.array([0.1, 1.0, 2.5e-3, -0.7, 1e30, np.inf])
+    floored = float32_floor(values)
+    assert floored.dtype == np.float32
+    assert np.all(floored.astype(np.float64) <= values)
+    above = np.nextafter(floored, np.float32(np.inf)).astype(np.float64)
+    assert np.all((above > values) | np.isinf(values))
+
+
+@pytest.mark.parametrize("precision", PRECISIONS)
+def test_same_leaves_as_sklearn(forest_and_rows, precision):
+    forest, rows = forest_and_rows
+    compiled = CompiledForest.from_estimator(forest, precision)
+    leaves = compiled.leaf_indices(rows) - compiled.roots
+    np.testing.assert_array_equal(leaves, forest.apply(rows.astype(np.float32)))
+
+
+@pytest.mark.parametrize("precision", PRECISIONS)
+def test_probabilities_within_bound(forest_and_rows, precision):
+    forest, rows = forest_and_rows
+    compiled = CompiledForest.from_estimator(forest, precision)
+    diff = np.abs(compiled.predict_proba1(rows) - forest.predict_proba(rows)[:, 1])
+    assert diff.max() <= EXPECTED_ERROR[precision]
+
+
+def test_float64_exact(forest_and_rows):
+    forest, rows = forest_and_rows
+    compiled = CompiledForest.from_estimator(forest, "float64")
+    assert np.array_equal(compiled.predict_proba1(rows), forest.predict_proba(rows)[:, 1])
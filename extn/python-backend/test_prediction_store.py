@@ -0,0 +1,71 @@
+"""
+PredictionStore round trips, and /predictions/recent over stored rows.
+
+    python -m pytest test_prediction_store.py
+"""
+import importlib, json, sys
+import numpy as np
+import pytest
+
+from inference import TOP_FEATS
+from prediction_store import PredictionStore
+
+
+def _rows(n=3):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 10, (n, len(TOP_FEATS))).astype(np.float64)
+
+
+def _store(path) -> PredictionStore:
+    store = PredictionStore(str(path), flush_interval=60.0)
+    store.start()
+    return store
+
+
+def test_rollup_matches_recorded_rows(tmp_path):
+    store = _store(tmp_path / "p.db")
+    store.record(_rows(4), np.array([0.1, 0.9, 0.2, 0.95]), np.array([0, 1, 0, 1]), "/predict-batch", "v1")
+    store.close()
+    result = store.rollup(0, 2 ** 31, step=3600 * 24 * 365, by="route")
+    assert result["totals"] == {"total": 4, "normal": 2, "attacks": 2}
+    assert result["by"]["groups"] == [{"value": "/predict-batch", "total": 4, "normal": 2, "attacks": 2}]
+
+
+def test_recent_maps_non_finite_features_to_none(tmp_path):
+    store = _store(tmp_path / "p.db")
+    matrix = _rows(2)
+    matrix[0, 0] = np.nan
+    matrix[1, 1] = np.inf
+    store.record(matrix, np.array([0.5, 0.5]), np.array([0, 0]), "/predict-legacy", "v1")
+    store.close()
+    rows = store.recent(10)
+    assert len(rows) == 2
+    json.dumps(rows, allow_nan=False)
+    values = [v for row in rows for v in (row[TOP_FEATS[0]], row[TOP_FEATS[1]])]
+    assert values.count(None) == 2
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    # No model in tmp_path: scoring routes answer 503, the dashboard routes still work
+    monkeypatch.setenv("IDS_MODEL_DIR", str(tmp_path))
+    monkeypatch.setenv("IDS_STORE_PATH", str(tmp_path / "p.db"))
+    monkeypatch.setenv("IDS_AUTO_RELOAD", "0")
+    sys.modules.pop("app", None)
+    app = importlib.import_module("app")
+    yield app
+    sys.modules.pop("app", None)
+
+
+def test_recent_endpoint_with_nan_row(api):
+    from fastapi.testclient import TestClient
+    with TestClient(api.app) as client:
+        matrix = _rows(1)
+        matrix[0, 3] = np.nan
+        matrix[0, 5] = -np.inf
+        api.store.record(matrix, np.array([0.7]), np.array([0]), "/predict-legacy", "v1")
+        api.store.flush(api.store._connect())
+        resp = client.get("/predictions/recent")
+    assert resp.status_code == 200
+    row = resp.json()["rows"][0]
+    assert row[TOP_FEATS[3]] is None and row[TOP_FEATS[5]] is None
@@ -0,0 +1,224 @@
+"""
+Incremental UNSW-NB15 connection-window features for online scoring.
+
+The `ct_*_ltm` / `ct_srv_*` features count, among the last N (100)
+connections, those that share a key with the current one:
+
+    ct_srv_src        service + source address
+    ct_srv_dst        service + destination address
+    ct_dst_ltm        destination address
+    ct_src_ltm        source address
+    ct_src_dport_ltm  source address + destination port
+    ct_dst_sport_ltm  destination address + source port
+    ct_dst_src_ltm    source + destination address
+
+ConnectionWindow keeps a ring buffer with each recent connection's keys
+and one count dict per feature. Each update is O(1):
+- the connection leaving the window decrements its seven counts, and
+  entries that reach zero are deleted
+- the new connection increments its seven counts
+So memory is bounded by N keys per feature, whatever the traffic
+volume. Counts include the current connection, so they start at 1, as
+in the dataset.
+
+ct_state_ttl is not a window count. In UNSW-NB15 it is a category
+derived from (state, sttl, dttl). StateTTL looks it up in a table fitted
+from labelled training data (--fit-state-ttl). It falls back to the
+most common value for the state, then 0.
+
+Connections are counted in the order they are enriched. For flows.py
+that is completion order. Not thread-safe: use one writer.
+
+    python window_features.py --bench 2000000 [--check]
+    python window_features.py --fit-state-ttl UNSW_NB15_training-set.csv
+"""
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from collections import Counter, defaultdict
+import argparse, json, os, random, resource, sys, time
+
+WINDOW = int(os.environ.get("IDS_WINDOW_CONNECTIONS", "100"))
+HERE = os.path.dirname(os.path.abspath(__file__))
+STATE_TTL_FILE = os.environ.get("IDS_STATE_TTL_TABLE", os.path.join(HERE, "state_ttl.json"))
+
+WINDOW_FEATURES = ["ct_srv_src", "ct_srv_dst", "ct_dst_ltm", "ct_src_ltm",
+                   "ct_src_dport_ltm", "ct_dst_sport_ltm", "ct_dst_src_ltm"]
+
+# UNSW-NB15 `service` values by well-known port; anything else is "-"
+SERVICE_PORTS = {20: "ftp-data", 21: "ftp", 22: "ssh", 25: "smtp", 53: "dns", 67: "dhcp", 68: "dhcp",
+                 80: "http", 110: "pop3", 161: "snmp", 443: "ssl", 1812: "radius", 6667: "irc"}
+
+
+def service_for(sport: int, dport: int) -> str:
+    return SERVICE_PORTS.get(dport) or SERVICE_PORTS.get(sport) or "-"
+
+
+class ConnectionWindow:
+    def __init__(self, size: int = WINDOW):
+        if size < 1:
+            raise ValueError("window size must be >= 1")
+        self.size = size
+        self._ring: List[Optional[tuple]] = [None] * size
+        self._pos = 0
+        self._counts: List[Dict[Hashable, int]] = [{} for _ in WINDOW_FEATURES]
+        self.connections = 0
+
+    def update(self, src: Hashable, sport: int, dst: Hashable, dport: int, service: str) -> Tuple[int, ...]:
+        """Add one connection; returns its counts in WINDOW_FEATURES order."""
+        keys = ((service, src), (service, dst), dst, src, (src, dport), (dst, sport), (src, dst))
+        counts = self._counts
+        old = self._ring[self._pos]
+        if old is not None:
+            for c, k in zip(counts, old):
+                n = c[k] - 1
+                if n:
+                    c[k] = n
+                else:
+                    del c[k]
+        self._ring[self._pos] = keys
+        self._pos = (self._pos + 1) % self.size
+        self.connections += 1
+        out = []
+        for c, k in zip(counts, keys):
+            n = c.get(k, 0) + 1
+            c[k] = n
+            out.append(n)
+        return tuple(out)
+
+    def tracked_keys(self) -> int:
+        return sum(len(c) for c in self._counts)
+
+
+class StateTTL:
+    def __init__(self, table: Optional[Dict[str, int]] = None):
+        self.table: Dict[Tuple[str, int, int], int] = {}
+        by_state: Dict[str, Counter] = defaultdict(Counter)
+        for key, value in (table or {}).items():
+            state, sttl, dttl = key.rsplit("|", 2)
+            self.table[(state, int(sttl), int(dttl))] = int(value)
+            by_state[state][int(value)] += 1
+        self.by_state = {s: c.most_common(1)[0][0] for s, c in by_state.items()}
+
+    @classmethod
+    def load(cls, path: str = STATE_TTL_FILE) -> "StateTTL":
+        if not os.path.exists(path):
+            print(f"⚠️ {path} not found; ct_state_ttl will be 0 (fit one with --fit-state-ttl)")
+            return cls()
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def __call__(self, state: str, sttl: int, dttl: int) -> int:
+        value = self.table.get((state, sttl, dttl))
+        if value is None:
+            value = self.by_state.get(state, 0)
+        return value
+
+
+def fit_state_ttl(csv_path: str, out_path: str = STATE_TTL_FILE) -> Dict[str, int]:
+    """Most common ct_state_ttl for each (state, sttl, dttl) in a labelled CSV with headers."""
+    import pandas as pd
+    frame = pd.read_csv(csv_path, usecols=["state", "sttl", "dttl", "ct_state_ttl"])
+    frame["state"] = frame["state"].astype(str)
+    modes = (frame.groupby(["state", "sttl", "dttl"])["ct_state_ttl"]
+             .agg(lambda s: s.value_counts().index[0]))
+    table = {f"{state}|{int(sttl)}|{int(dttl)}": int(v) for (state, sttl, dttl), v in modes.items()}
+    tmp = out_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(table, f)
+    os.replace(tmp, out_path)
+    return table
+
+
+class WindowFeatures:
+    """Enriches connection records with the window counters and ct_state_ttl."""
+
+    def __init__(self, size: int = WINDOW, state_ttl: Optional[StateTTL] = None):
+        self.window = ConnectionWindow(size)
+        self.state_ttl = state_ttl if state_ttl is not None else StateTTL.load()
+
+    def update(self, src: Hashable, sport: int, dst: Hashable, dport: int, service: str,
+               state: str, sttl: int, dttl: int) -> Dict[str, int]:
+        counts = dict(zip(WINDOW_FEATURES, self.window.update(src, sport, dst, dport, service)))
+        counts["ct_state_ttl"] = self.state_ttl(state, sttl, dttl)
+        return counts
+
+    def enrich(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Record with UNSW-NB15 field names (srcip, sport, dstip, dsport, ...) -> record + counters."""
+        sport, dport = int(record.get("sport", 0)), int(record.get("dsport", 0))
+        service = record.get("service") or service_for(sport, dport)
+        record.update(self.update(record["srcip"], sport, record["dstip"], dport, service,
+                                  str(record.get("state", "-")), int(record.get("sttl", 0)),
+                                  int(record.get("dttl", 0))))
+        return record
+
+    def enrich_flow(self, flow) -> Dict[str, int]:
+        """Counters for a completed flows.Flow (packed addresses are fine as keys)."""
+        _, src, sport, dst, dport = flow.key
+        return self.update(src, sport, dst, dport, service_for(sport, dport),
+                           flow.state(), flow.sttl, flow.dttl)
+
+
+# ---- benchmark ----
+
+def _synthetic(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    hosts = [f"10.0.{i // 256}.{i % 256}" for i in range(2000)]
+    servers = [f"192.168.1.{i}" for i in range(1, 200)]
+    ports = list(SERVICE_PORTS) + [8080, 3306, 5432]
+    for _ in range(n):
+        # Skewed: a few hosts and servers account for most connections
+        src = hosts[min(int(rng.paretovariate(1.2)) - 1, len(hosts) - 1)]
+        dst = servers[min(int(rng.paretovariate(1.5)) - 1, len(servers) - 1)]
+        yield src, rng.randrange(1024, 65535), dst, rng.choice(ports)
+
+
+def _naive(history: List[tuple], size: int) -> Tuple[int, ...]:
+    recent = history[-size:]
+    (service, src, sport, dst, dport) = recent[-1]
+    return (sum(r[0] == service and r[1] == src for r in recent),
+            sum(r[0] == service and r[3] == dst for r in recent),
+            sum(r[3] == dst for r in recent),
+            sum(r[1] == src for r in recent),
+            sum(r[1] == src and r[4] == dport for r in recent),
+            sum(r[3] == dst and r[2] == sport for r in recent),
+            sum(r[1] == src and r[3] == dst for r in recent))
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Connection-window counters for online scoring")
+    parser.add_argument("--bench", type=int, metavar="FLOWS", help="benchmark throughput on synthetic flows")
+    parser.add_argument("--window", type=int, default=WINDOW)
+    parser.add_argument("--check", action="store_true", help="compare the first 20k updates with a recount")
+    parser.add_argument("--fit-state-ttl", metavar="CSV", help="fit the ct_state_ttl lookup table")
+    parser.add_argument("--out", default=STATE_TTL_FILE)
+    args = parser.parse_args(argv)
+
+    if args.fit_state_ttl:
+        table = fit_state_ttl(args.fit_state_ttl, args.out)
+        print(f"✔ {len(table)} (state, sttl, dttl) entries -> {args.out}")
+    if args.bench:
+        flows = list(_synthetic(args.bench))
+        window = ConnectionWindow(args.window)
+        if args.check:
+            history: List[tuple] = []
+            for src, sport, dst, dport in flows[:20000]:
+                service = service_for(sport, dport)
+                history.append((service, src, sport, dst, dport))
+                if window.update(src, sport, dst, dport, service) != _naive(history, args.window):
+                    print(f"❌ Mismatch at connection {len(history)}")
+                    return 1
+            print(f"✔ First {len(history)} updates match a full recount")
+            window = ConnectionWindow(args.window)
+        update, started = window.update, time.perf_counter()
+        for src, sport, dst, dport in flows:
+            update(src, sport, dst, dport, SERVICE_PORTS.get(dport, "-"))
+        elapsed = time.perf_counter() - started
+        print(f"✔ {len(flows)} flows in {elapsed:.2f}s: {len(flows) / elapsed:,.0f} flows/s, "
+              f"{window.tracked_keys()} tracked keys (window {args.window}), "
+              f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    if not (args.fit_state_ttl or args.bench):
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Packed binary records for /predict-legacy.
+
+For a high-rate sensor, a JSON body costs more than scoring it. The
+server parses the text, builds a PredictRequest with int()/float() for
+each value, and then rebuilds a row. This format skips all of that.
+
+- Request (Content-Type: application/x-ids-records): one or more rows
+  of 10 little-endian float32 values in TOP_FEATS order, with no header
+  or padding (40 bytes per row). The body is viewed as an (N, 10)
+  float32 matrix without copying, which is also the precision the
+  forest compares at. Bodies containing NaN or inf are rejected (422).
+- Response: one packed record per row, a float32 probability followed
+  by a uint8 prediction (5 bytes per row). It is sent when the request
+  was binary, unless Accept asks for application/json, or whenever
+  Accept names the binary type.
+
+JSON stays the default; nothing changes for clients that don't opt in.
+
+    body = encode_rows(matrix)
+    resp = requests.post(url + "/predict-legacy", data=body,
+                         headers={"Content-Type": CONTENT_TYPE})
+    results = decode_results(resp.content)   # ["probability"], ["prediction"]
+"""
+from typing import Optional
+import numpy as np
+from inference import TOP_FEATS
+
+CONTENT_TYPE = "application/x-ids-records"
+ROW_DTYPE = np.dtype("<f4")
+ROW_BYTES = ROW_DTYPE.itemsize * len(TOP_FEATS)
+RESULT_DTYPE = np.dtype([("probability", "<f4"), ("prediction", "u1")])
+
+
+def _media_type(header: Optional[str]) -> str:
+    return (header or "").split(";", 1)[0].strip().lower()
+
+
+def is_binary(content_type: Optional[str]) -> bool:
+    return _media_type(content_type) == CONTENT_TYPE
+
+
+def reply_binary(content_type: Optional[str], accept: Optional[str]) -> bool:
+    """Whether the response should be packed records rather than JSON."""
+    accepted = {_media_type(part) for part in (accept or "").split(",")}
+    if CONTENT_TYPE in accepted:
+        return True
+    return is_binary(content_type) and "application/json" not in accepted
+
+
+def decode_rows(body: bytes) -> np.ndarray:
+    """Zero-copy (N, 10) float32 view of a request body. Raises ValueError."""
+    if not body or len(body) % ROW_BYTES:
+        raise ValueError(f"Expected a non-empty multiple of {ROW_BYTES} bytes "
+                         f"({len(TOP_FEATS)} float32 per row), got {len(body)}")
+    return np.frombuffer(body, dtype=ROW_DTYPE).reshape(-1, len(TOP_FEATS))
+
+
+def encode_rows(matrix) -> bytes:
+    matrix = np.asarray(matrix)
+    if matrix.ndim != 2 or matrix.shape[1] != len(TOP_FEATS):
+        raise ValueError(f"Expected an (N, {len(TOP_FEATS)}) matrix, got shape {matrix.shape}")
+    return np.ascontiguousarray(matrix, dtype=ROW_DTYPE).tobytes()
+
+
+def encode_results(probs: np.ndarray, preds: np.ndarray) -> bytes:
+    out = np.empty(len(probs), dtype=RESULT_DTYPE)
+    out["probability"] = probs
+    out["prediction"] = preds
+    return out.tobytes()
+
+
+def decode_results(body: bytes) -> np.ndarray:
+    return np.frombuffer(body, dtype=RESULT_DTYPE)
@@ -0,0 +1,150 @@
+"""
+Parallel, sampled RandomForest feature importance.
+
+Feature importance here is only used to rank features and drop those
+below a cutoff (0.001 in withoutComments.py). That does not need a
+100-tree forest fitted single-threaded on every resampled row.
+
+- Trees are fitted on a stratified subsample (`sample`: a fraction or a
+  row count). Class proportions are kept, so the impurity importances
+  stay comparable.
+- Trees are fitted on all cores (n_jobs=-1).
+- With early_stop=True the forest grows in steps of `step` trees
+  (warm_start) until the top-k feature set and the set of features above
+  the cutoff have not changed for `patience` steps, or `n_estimators`
+  trees are reached.
+
+agreement() compares a ranking with a reference ranking:
+- top-k overlap
+- Spearman rank correlation
+- whether the same features fall below the cutoff
+
+`python importance.py --validate` fits the full-data, 100-tree
+reference as well and prints that comparison.
+
+    python importance.py --csv resampled.csv [--sample 0.25] [--no-early-stop] [--validate]
+"""
+from typing import Any, Dict, Optional, Tuple, Union
+import argparse, json, os, sys, time
+import numpy as np
+import pandas as pd
+
+DEFAULT_CUTOFF = 0.001
+
+
+def stratified_sample(X: pd.DataFrame, y: pd.Series, sample: Union[float, int, None],
+                      seed: Optional[int] = 42) -> Tuple[pd.DataFrame, pd.Series]:
+    """`sample` rows (or fraction of rows) with the class proportions of y."""
+    n = len(y)
+    if sample is None or (isinstance(sample, float) and sample >= 1.0) or sample >= n:
+        return X, y
+    fraction = sample if isinstance(sample, float) else sample / n
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(y)
+    picks = []
+    for label in np.unique(labels):
+        idx = np.flatnonzero(labels == label)
+        take = max(1, int(round(fraction * len(idx))))
+        picks.append(rng.choice(idx, size=take, replace=False))
+    rows = np.sort(np.concatenate(picks))
+    return X.iloc[rows], y.iloc[rows]
+
+
+def _selection(importances: pd.Series, k: int, cutoff: float):
+    return frozenset(importances.index[:k]), frozenset(importances.index[importances >= cutoff])
+
+
+def feature_importance(X: pd.DataFrame, y: pd.Series, sample: Union[float, int, None] = 0.25,
+                       n_estimators: int = 100, early_stop: bool = True, step: Optional[int] = None,
+                       min_trees: int = 20, patience: int = 2, top_k: int = 20,
+                       cutoff: float = DEFAULT_CUTOFF, n_jobs: int = -1,
+                       seed: Optional[int] = 42) -> Tuple[pd.Series, Dict[str, Any]]:
+    """
+    (importances sorted descending, report). Without early stopping this is
+    RandomForestClassifier(n_estimators) on the subsample, on all cores.
+    With it, `n_estimators` is the cap on the number of trees.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    started = time.perf_counter()
+    Xs, ys = stratified_sample(X, y, sample, seed)
+    report: Dict[str, Any] = {"rows": len(ys), "of_rows": len(y), "early_stop": early_stop, "steps": []}
+
+    if not early_stop:
+        rf = RandomForestClassifier(n_estimators=n_estimators, n_jobs=n_jobs, random_state=seed)
+        rf.fit(Xs, ys)
+    else:
+        # At least one tree per core per step, so each step keeps every core busy
+        step = step or max(10, os.cpu_count() or 1)
+        rf = RandomForestClassifier(n_estimators=0, n_jobs=n_jobs, random_state=seed, warm_start=True)
+        previous, stable = None, 0
+        while rf.n_estimators < n_estimators:
+            rf.n_estimators = min(n_estimators, rf.n_estimators + step)
+            rf.fit(Xs, ys)
+            current = _selection(pd.Series(rf.feature_importances_, index=X.columns)
+                                 .sort_values(ascending=False), top_k, cutoff)
+            stable = stable + 1 if current == previous else 0
+            previous = current
+            report["steps"].append({"trees": rf.n_estimators, "stable": stable})
+            if stable >= patience and rf.n_estimators >= min_trees:
+                break
+
+    importances = pd.Series(rf.feature_importances_, index=X.columns).sort_values(ascending=False)
+    report["trees"] = len(rf.estimators_)
+    report["seconds"] = time.perf_counter() - started
+    return importances, report
+
+
+def agreement(importances: pd.Series, reference: pd.Series, k: int = 20,
+              cutoff: float = DEFAULT_CUTOFF) -> Dict[str, Any]:
+    """How closely `importances` reproduces the ranking and selection of `reference`."""
+    top, ref_top = set(importances.index[:k]), set(reference.index[:k])
+    ranks = importances.rank(ascending=False)
+    ref_ranks = reference.rank(ascending=False).reindex(ranks.index)
+    dropped = set(importances.index[importances < cutoff])
+    ref_dropped = set(reference.index[reference < cutoff])
+    return {
+        "top_k": k,
+        "top_k_overlap": len(top & ref_top) / max(1, min(k, len(ref_top))),
+        "spearman": float(ranks.corr(ref_ranks, method="pearson")),
+        "same_selection": dropped == ref_dropped,
+        "only_dropped_here": sorted(dropped - ref_dropped),
+        "only_dropped_in_reference": sorted(ref_dropped - dropped),
+    }
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sampled, parallel RandomForest feature importance")
+    parser.add_argument("--csv", required=True, help="resampled training data")
+    parser.add_argument("--label", default="label")
+    parser.add_argument("--sample", type=float, default=0.25, help="fraction (<= 1) or row count (> 1)")
+    parser.add_argument("--trees", type=int, default=100, help="forest size, or the cap with early stopping")
+    parser.add_argument("--no-early-stop", action="store_true")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--cutoff", type=float, default=DEFAULT_CUTOFF)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--validate", action="store_true",
+                        help="also fit the full-data reference forest and compare rankings")
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(args.csv)
+    X, y = df.drop(columns=[args.label]), df[args.label]
+    sample = args.sample if args.sample <= 1 else int(args.sample)
+    importances, report = feature_importance(X, y, sample, args.trees, not args.no_early_stop,
+                                             top_k=args.top_k, cutoff=args.cutoff,
+                                             n_jobs=args.n_jobs, seed=args.seed)
+    print(importances.head(args.top_k))
+    print(f"✔ {report['trees']} trees on {report['rows']} of {report['of_rows']} rows "
+          f"in {report['seconds']:.2f}s")
+    if args.validate:
+        reference, ref_report = feature_importance(X, y, None, args.trees, early_stop=False,
+                                                   n_jobs=args.n_jobs, seed=args.seed)
+        result = agreement(importances, reference, args.top_k, args.cutoff)
+        result["reference_seconds"] = ref_report["seconds"]
+        result["seconds"] = report["seconds"]
+        print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
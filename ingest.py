@@ -0,0 +1,304 @@
+"""
+Single-pass, parallel ingest of the UNSW-NB15 shard CSVs with a
+columnar on-disk cache.
+
+- Column names and dtypes come from NUSW-NB15_features.csv: nominal
+  columns (proto, state, service, srcip, dstip, attack_cat) stay strings
+  and become categoricals, everything else is parsed straight to float64.
+  Integer columns with no missing values are narrowed to int64 afterwards,
+  which is what pandas' own inference gave before.
+- Shards are parsed in parallel worker processes, and attack_cat is kept
+  in the same pass, so nothing is read twice.
+- The combined frame is written as one .npy file per column
+  (categoricals as integer codes, with their dictionaries in
+  manifest.json). Later runs memory-map those files and skip CSV
+  parsing entirely. The cache is rebuilt when any source file changes.
+
+    python ingest.py [--data-dir DIR] [--refresh]
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse, glob, json, os, shutil, sys, time
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.environ.get("UNSW_DATA_DIR", r"D:\PBL\TON_IoT Dataset\CSV Files")
+CACHE_DIR = os.environ.get("UNSW_CACHE_DIR",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "ingest"))
+SHARD_PATTERN = "UNSW-NB15_*.csv"
+FEATURES_FILE = "NUSW-NB15_features.csv"
+
+# Bump when the cache layout or parsing rules change
+CACHE_FORMAT = 2
+
+# Ports are sometimes hex ("0x000b") or "-" in the raw shards: parsed as
+# text, then coerced to numbers (NaN when invalid)
+COERCE_COLUMNS = ("sport", "dsport")
+# Extra missing-value markers for numeric columns ("-" is a real service value)
+NA_VALUES = ["", " ", "-"]
+
+NUMERIC_TYPES = {"integer", "float", "binary", "timestamp"}
+INTEGER_TYPES = {"integer", "binary", "timestamp"}
+
+
+def read_features(path: str) -> pd.DataFrame:
+    try:
+        features_df = pd.read_csv(path, encoding="utf-8")
+    except UnicodeDecodeError:
+        print("UTF-8 failed, trying alternative encodings...")
+        try:
+            features_df = pd.read_csv(path, encoding="latin1")
+        except UnicodeDecodeError:
+            features_df = pd.read_csv(path, encoding="cp1252")
+    features_df.columns = [c.strip() for c in features_df.columns]
+    return features_df
+
+
+def column_schema(features_df: pd.DataFrame) -> Tuple[List[str], Dict[str, str], List[str]]:
+    """
+    Column names (plus the trailing `label` the shards are read with),
+    read_csv dtypes, and the columns declared integer-valued.
+    """
+    names = features_df["Name"].tolist()
+    kinds = features_df["Type"].astype(str).str.strip().str.lower().tolist()
+    dtypes: Dict[str, str] = {}
+    integer_cols: List[str] = []
+    for name, kind in zip(names, kinds):
+        if kind in NUMERIC_TYPES and name not in COERCE_COLUMNS:
+            dtypes[name] = "float64"
+        else:
+            dtypes[name] = "object"
+        if kind in INTEGER_TYPES:
+            integer_cols.append(name)
+    names.append("label")
+    dtypes["label"] = "float64"
+    return names, dtypes, integer_cols
+
+
+def _na_values(dtypes: Dict[str, str]) -> Dict[str, List[str]]:
+    return {c: NA_VALUES for c, d in dtypes.items() if d == "float64" or c in COERCE_COLUMNS}
+
+
+def _coerce(frame: pd.DataFrame, dtypes: Dict[str, str], all_numeric: bool) -> pd.DataFrame:
+    for col, dtype in dtypes.items():
+        if col in COERCE_COLUMNS or (all_numeric and dtype == "float64"):
+            frame[col] = pd.to_numeric(frame[col], errors="coerce")
+    return frame
+
+
+def _read_shard(path: str, names: List[str], dtypes: Dict[str, str]) -> pd.DataFrame:
+    # skiprows=1 as the original loader did
+    read = dict(names=names, skiprows=1, na_values=_na_values(dtypes), low_memory=False)
+    try:
+        return _coerce(pd.read_csv(path, dtype=dtypes, **read), dtypes, False)
+    except ValueError as e:
+        # Malformed numbers somewhere: parse as text and coerce, like before
+        print(f"⚠️ {os.path.basename(path)}: typed parse failed ({e}); coercing column by column")
+        return _coerce(pd.read_csv(path, dtype=str, **read), dtypes, True)
+
+
+def _iter_shard(path: str, names: List[str], dtypes: Dict[str, str], chunksize: int):
+    read = dict(names=names, skiprows=1, na_values=_na_values(dtypes), chunksize=chunksize)
+    done = 0
+    try:
+        with pd.read_csv(path, dtype=dtypes, **read) as reader:
+            for chunk in reader:
+                chunk = _coerce(chunk, dtypes, False)
+                done += len(chunk)
+                yield chunk
+        return
+    except ValueError as e:
+        print(f"⚠️ {os.path.basename(path)}: typed parse failed ({e}); coercing column by column")
+    # Resume as text from the first chunk that failed
+    read["skiprows"] = 1 + done
+    with pd.read_csv(path, dtype=str, **read) as reader:
+        for chunk in reader:
+            yield _coerce(chunk, dtypes, True)
+
+
+def read_shards(paths: Sequence[str], names: List[str], dtypes: Dict[str, str],
+                integer_cols: List[str], workers: Optional[int] = None) -> pd.DataFrame:
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    if workers == 1:
+        frames = [_read_shard(p, names, dtypes) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(_read_shard, paths, [names] * len(paths), [dtypes] * len(paths)))
+    df = pd.concat(frames, ignore_index=True)
+    # Row count per shard, so cached chunks can still be attributed to their file
+    df.attrs["shard_rows"] = [len(f) for f in frames]
+    del frames
+    for col, dtype in dtypes.items():
+        if dtype == "object" and col not in COERCE_COLUMNS:
+            df[col] = df[col].astype("category")
+    for col in integer_cols:
+        if col in df and df[col].dtype == np.float64 and not df[col].isna().any():
+            df[col] = df[col].astype(np.int64)
+    return df
+
+
+def _fingerprint(paths: Sequence[str]) -> List[Dict[str, Any]]:
+    out = []
+    for p in paths:
+        st = os.stat(p)
+        out.append({"file": os.path.basename(p), "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    return out
+
+
+def write_cache(df: pd.DataFrame, cache_dir: str, sources: List[Dict[str, Any]],
+                shards: Optional[List[Dict[str, Any]]] = None):
+    """One .npy per column plus manifest.json, swapped into place when complete."""
+    tmp_dir = cache_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    columns = []
+    for i, col in enumerate(df.columns):
+        fname = f"c{i:03d}.npy"
+        entry: Dict[str, Any] = {"name": col, "file": fname}
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            entry["kind"] = "category"
+            entry["categories"] = series.cat.categories.tolist()
+            np.save(os.path.join(tmp_dir, fname), series.cat.codes.to_numpy())
+        else:
+            entry["kind"] = "numeric"
+            np.save(os.path.join(tmp_dir, fname), series.to_numpy())
+        columns.append(entry)
+    manifest = {"format": CACHE_FORMAT, "rows": int(len(df)), "sources": sources,
+                "shards": shards or [{"file": None, "rows": int(len(df))}], "columns": columns}
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(cache_dir) or ".", exist_ok=True)
+    os.replace(tmp_dir, cache_dir)
+
+
+def read_manifest(cache_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(cache_dir, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_cache(cache_dir: str, columns: Optional[Sequence[str]] = None,
+               sources: Optional[List[Dict[str, Any]]] = None) -> Optional[pd.DataFrame]:
+    """
+    Frame from the column cache, or None if it is missing, stale (its
+    sources differ from `sources`) or from another format version.
+    Column files are memory-mapped, so only the requested columns are read.
+    """
+    manifest = read_manifest(cache_dir)
+    if manifest is None or manifest.get("format") != CACHE_FORMAT:
+        return None
+    if sources is not None and manifest.get("sources") != sources:
+        return None
+    wanted = set(columns) if columns is not None else None
+    data = {}
+    for entry in manifest["columns"]:
+        if wanted is not None and entry["name"] not in wanted:
+            continue
+        values = np.load(os.path.join(cache_dir, entry["file"]), mmap_mode="r")
+        if entry["kind"] == "category":
+            data[entry["name"]] = pd.Categorical.from_codes(values, categories=entry["categories"])
+        else:
+            data[entry["name"]] = values
+    return pd.DataFrame(data)
+
+
+def _iter_cache(cache_dir: str, manifest: Dict[str, Any], chunksize: int,
+                columns: Optional[Sequence[str]]):
+    entries = [e for e in manifest["columns"] if columns is None or e["name"] in columns]
+    arrays = [np.load(os.path.join(cache_dir, e["file"]), mmap_mode="r") for e in entries]
+    offset = 0
+    for shard in manifest["shards"]:
+        end = offset + shard["rows"]
+        for start in range(offset, end, chunksize):
+            stop = min(start + chunksize, end)
+            data = {}
+            for entry, values in zip(entries, arrays):
+                part = np.array(values[start:stop])
+                if entry["kind"] == "category":
+                    data[entry["name"]] = pd.Categorical.from_codes(part, categories=entry["categories"])
+                else:
+                    data[entry["name"]] = part
+            chunk = pd.DataFrame(data)
+            chunk.attrs["source"] = shard["file"]
+            yield chunk
+        offset = end
+
+
+def iter_chunks(data_dir: str = DATA_DIR, cache_dir: str = CACHE_DIR, chunksize: int = 200_000,
+                columns: Optional[Sequence[str]] = None):
+    """
+    Yield the raw dataset as frames of at most `chunksize` rows, with
+    memory bounded by the chunk size. Slices the column cache when it is
+    fresh, otherwise streams the shard CSVs (without building the cache).
+    Chunks never span shards; chunk.attrs["source"] names the shard file.
+    """
+    features_path = os.path.join(data_dir, FEATURES_FILE)
+    shard_paths = sorted(glob.glob(os.path.join(data_dir, SHARD_PATTERN)))
+    if not shard_paths:
+        raise FileNotFoundError(f"No {SHARD_PATTERN} files in {data_dir}")
+    manifest = read_manifest(cache_dir)
+    if manifest is not None and manifest.get("format") == CACHE_FORMAT \
+            and manifest.get("sources") == _fingerprint([features_path] + shard_paths):
+        yield from _iter_cache(cache_dir, manifest, chunksize, columns)
+        return
+    names, dtypes, _ = column_schema(read_features(features_path))
+    for path in shard_paths:
+        for chunk in _iter_shard(path, names, dtypes, chunksize):
+            if columns is not None:
+                chunk = chunk[list(columns)]
+            chunk.attrs["source"] = os.path.basename(path)
+            yield chunk
+
+
+def load_dataset(data_dir: str = DATA_DIR, cache_dir: str = CACHE_DIR,
+                 workers: Optional[int] = None, refresh: bool = False,
+                 columns: Optional[Sequence[str]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    The raw UNSW-NB15 frame (all shards, attack_cat included) and the
+    feature description table. Served from the column cache when it is
+    up to date, otherwise parsed from the CSVs and cached.
+    """
+    features_path = os.path.join(data_dir, FEATURES_FILE)
+    shard_paths = sorted(glob.glob(os.path.join(data_dir, SHARD_PATTERN)))
+    if not shard_paths:
+        raise FileNotFoundError(f"No {SHARD_PATTERN} files in {data_dir}")
+    features_df = read_features(features_path)
+    sources = _fingerprint([features_path] + shard_paths)
+
+    if not refresh:
+        started = time.perf_counter()
+        df = load_cache(cache_dir, columns, sources)
+        if df is not None:
+            print(f"✔ Loaded {len(df)} rows from column cache in {time.perf_counter() - started:.2f}s")
+            return df, features_df
+
+    started = time.perf_counter()
+    names, dtypes, integer_cols = column_schema(features_df)
+    df = read_shards(shard_paths, names, dtypes, integer_cols, workers)
+    print(f"✔ Parsed {len(shard_paths)} shards ({len(df)} rows) in {time.perf_counter() - started:.2f}s")
+    shards = [{"file": os.path.basename(p), "rows": n}
+              for p, n in zip(shard_paths, df.attrs["shard_rows"])]
+    write_cache(df, cache_dir, sources, shards)
+    if columns is not None:
+        df = df[list(columns)]
+    return df, features_df
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build the UNSW-NB15 column cache")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--refresh", action="store_true", help="re-parse the CSVs even if the cache is fresh")
+    args = parser.parse_args(argv)
+    df, _ = load_dataset(args.data_dir, args.cache_dir, args.workers, args.refresh)
+    print(df.dtypes.value_counts())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
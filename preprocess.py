@@ -0,0 +1,353 @@
+"""
+Out-of-core version of the withoutComments.py preprocessing.
+
+The in-memory script fills gaps with medians taken over every row and
+only then drops duplicates, so rows that differ only by NaN vs the
+median count as duplicates. The streaming version keeps that order:
+
+- Pass 1a streams the raw dataset in chunks and sketches each numeric
+  column's median and missing count over all rows (fit_fill).
+- Pass 1b streams it again, fills gaps with those medians, drops rows
+  already seen in an earlier chunk or shard (dedup.StreamingDeduper,
+  as drop_duplicates() did in memory), and collects per-column
+  statistics of what remains: min/max, and a mergeable quantile sketch
+  for Q1/Q3 and the 1%/99% clip bounds. It also collects the category
+  dictionaries used for label encoding.
+
+The fitted statistics are saved to JSON and can be reused with
+--reuse-stats.
+
+Pass 2 streams the data again, fills and drops duplicates as pass 1b
+did, and, chunk by chunk:
+- min-max scales (as MinMaxScaler)
+- clips `OUTLIER_COLS` to their scaled 1%/99% quantiles
+- label-encodes proto/state/service and attack_cat
+- adds the attack_* dummy columns
+- counts IQR outliers
+- appends the result to the output CSV
+
+Peak memory is one chunk plus the sketches (O(k log n) values per
+column) and the deduper's 8 bytes per distinct row. Without dedup, the filled-value distribution is obtained by
+adding the missing count as weight at the median, so pass 1a is skipped.
+
+    python preprocess.py --out UNSW_NB15_preprocessed.csv [--chunksize 200000]
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+import argparse, json, os, sys, time
+import numpy as np
+import pandas as pd
+
+from ingest import CACHE_DIR, DATA_DIR, iter_chunks
+from dedup import StreamingDeduper, dedup_chunks
+
+DROP_COLUMNS = ['srcip', 'dstip', 'ct_ftp_cmd', 'is_ftp_login', 'ct_flw_http_mthd', 'Label']
+RENAME_COLUMNS = {'ct_src_ ltm': 'ct_src_ltm'}
+CATEGORICAL_COLUMNS = ['proto', 'state', 'service']
+TARGET_COLUMNS = ['label', 'attack_cat']
+
+OUTLIER_COLS = ['dsport', 'dur', 'sbytes', 'dbytes', 'sttl', 'dttl', 'sloss', 'dloss',
+                'Sload', 'Dload', 'Spkts', 'Dpkts', 'smeansz', 'dmeansz', 'trans_depth',
+                'res_bdy_len', 'Sjit', 'Djit', 'Sintpkt', 'Dintpkt', 'tcprtt', 'synack',
+                'ackdat', 'is_sm_ips_ports', 'ct_state_ttl', 'ct_srv_src', 'ct_srv_dst',
+                'ct_dst_ltm', 'ct_src_ltm', 'ct_src_dport_ltm', 'ct_dst_sport_ltm',
+                'ct_dst_src_ltm']
+
+STATS_FORMAT = 2
+QUANTILES = {"q01": 0.01, "q25": 0.25, "median": 0.5, "q75": 0.75, "q99": 0.99}
+
+
+class QuantileSketch:
+    """
+    Mergeable KLL-style quantile sketch.
+
+    Level h holds sorted-then-halved items that each stand for 2**h input
+    values. A level that grows past `k` items is sorted and every other
+    item (random offset) moves up one level. Rank error is roughly
+    log2(n / k) / k of n. Two sketches merge by concatenating levels and
+    compacting, so per-chunk or per-worker sketches can be combined.
+    """
+
+    def __init__(self, k: int = 4096, seed: int = 0):
+        self.k = k
+        self.count = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compact()
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        for h, items in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate((self.levels[h], items))
+        self.count += other.count
+        self._compact()
+        return self
+
+    def _compact(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # An odd item out stays behind so total weight is preserved
+                rest, items = (items[-1:], items[:-1]) if len(items) % 2 else (items[:0], items)
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[h] = rest
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+            h += 1
+
+    def quantiles(self, qs: Sequence[float], extra_value: Optional[float] = None,
+                  extra_weight: int = 0) -> List[float]:
+        """
+        Approximate quantiles (lower interpolation). `extra_value` is
+        counted `extra_weight` times, e.g. the fill value for missing rows.
+        """
+        values = [lvl for lvl in self.levels if len(lvl)]
+        weights = [np.full(len(lvl), 2.0 ** h) for h, lvl in enumerate(self.levels) if len(lvl)]
+        if extra_weight and extra_value is not None and not np.isnan(extra_value):
+            values.append(np.array([extra_value]))
+            weights.append(np.array([float(extra_weight)]))
+        if not values:
+            return [float("nan")] * len(qs)
+        values = np.concatenate(values)
+        weights = np.concatenate(weights)
+        order = np.argsort(values, kind="stable")
+        values, cum = values[order], np.cumsum(weights[order])
+        ranks = np.asarray(qs) * (cum[-1] - 1)
+        return values[np.minimum(np.searchsorted(cum, ranks, side="right"), len(values) - 1)].tolist()
+
+
+def _as_text(series: pd.Series) -> pd.Series:
+    # Missing values become "nan", as astype(str) gave in the in-memory script
+    return series.astype(object).where(series.notna(), "nan").astype(str)
+
+
+def prepare_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Row-local cleanup done before any statistics (drops, renames, attack_cat, label)."""
+    chunk = chunk.drop(columns=[c for c in DROP_COLUMNS if c in chunk.columns])
+    chunk = chunk.rename(columns=RENAME_COLUMNS)
+    for col in CATEGORICAL_COLUMNS:
+        chunk[col] = _as_text(chunk[col])
+    cat = _as_text(chunk['attack_cat']).str.strip()
+    cat = cat.replace({"nan": "Normal", "None": "Normal", "Backdoor": "Backdoors"})
+    chunk['attack_cat'] = cat
+    chunk['label'] = (cat != "Normal").astype(np.int64)
+    return chunk
+
+
+def numeric_columns(chunk: pd.DataFrame) -> List[str]:
+    return [c for c in chunk.columns
+            if c not in CATEGORICAL_COLUMNS and c not in TARGET_COLUMNS]
+
+
+def fit_fill(chunks: Iterable[pd.DataFrame], sketch_k: int = 4096) -> Dict[str, Dict[str, Any]]:
+    """Pass 1a: median and missing count of every numeric column, over all rows."""
+    sketches: Dict[str, QuantileSketch] = {}
+    missing: Dict[str, int] = {}
+    for chunk in chunks:
+        if not sketches:
+            for col in numeric_columns(chunk):
+                sketches[col] = QuantileSketch(sketch_k, seed=len(sketches))
+                missing[col] = 0
+        for col, sketch in sketches.items():
+            values = chunk[col].to_numpy(dtype=np.float64)
+            missing[col] += int(np.isnan(values).sum())
+            sketch.update(values)
+    return {col: {"fill": sketch.quantiles([0.5])[0], "missing": missing[col]}
+            for col, sketch in sketches.items()}
+
+
+def fill_chunk(chunk: pd.DataFrame, fill: Dict[str, Dict[str, Any]]) -> pd.DataFrame:
+    """Fill gaps in a prepared chunk with the fitted medians (fit_fill() or stats["numeric"])."""
+    for col, s in fill.items():
+        if chunk[col].isna().any():
+            chunk[col] = chunk[col].fillna(s["fill"])
+    return chunk
+
+
+def fit_stats(chunks: Iterable[pd.DataFrame], sketch_k: int = 4096,
+              fill: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Pass 1b: streaming statistics over prepared chunks. With `fill` (from
+    fit_fill()) the chunks are expected to be filled already; without it
+    the fill value is the median of these same chunks.
+    """
+    sketches: Dict[str, QuantileSketch] = {}
+    missing: Dict[str, int] = {}
+    lo: Dict[str, float] = {}
+    hi: Dict[str, float] = {}
+    categories: Dict[str, set] = {c: set() for c in CATEGORICAL_COLUMNS + ['attack_cat']}
+    labels = np.zeros(2, dtype=np.int64)
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        if not sketches:
+            for col in numeric_columns(chunk):
+                sketches[col] = QuantileSketch(sketch_k, seed=len(sketches))
+                missing[col], lo[col], hi[col] = 0, np.inf, -np.inf
+        for col, sketch in sketches.items():
+            values = chunk[col].to_numpy(dtype=np.float64)
+            nan = np.isnan(values)
+            missing[col] += int(nan.sum())
+            if not nan.all():
+                lo[col] = min(lo[col], float(np.nanmin(values)))
+                hi[col] = max(hi[col], float(np.nanmax(values)))
+            sketch.update(values)
+        for col, seen in categories.items():
+            seen.update(chunk[col].unique().tolist())
+        labels += np.bincount(chunk['label'].to_numpy(), minlength=2)[:2]
+
+    numeric: Dict[str, Dict[str, Any]] = {}
+    for col, sketch in sketches.items():
+        col_fill = fill[col] if fill is not None else \
+            {"fill": sketch.quantiles([0.5])[0], "missing": missing[col]}
+        # Quantiles of the filled column: rows still missing count as the fill value
+        qs = sketch.quantiles(list(QUANTILES.values()), col_fill["fill"], missing[col])
+        numeric[col] = {
+            **col_fill,
+            "min": lo[col] if sketch.count else float("nan"),
+            "max": hi[col] if sketch.count else float("nan"),
+            **dict(zip(QUANTILES, qs)),
+        }
+    return {
+        "format": STATS_FORMAT,
+        "rows": rows,
+        "sketch_k": sketch_k,
+        "label_counts": labels.tolist(),
+        "numeric": numeric,
+        # sorted(), as LabelEncoder orders its classes
+        "categories": {col: sorted(seen) for col, seen in categories.items()},
+        "clip_columns": [c for c in OUTLIER_COLS if c in numeric],
+    }
+
+
+def transform_chunk(chunk: pd.DataFrame, stats: Dict[str, Any],
+                    outliers: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+    """Pass 2 for one prepared chunk: fill, count IQR outliers, scale, clip, encode."""
+    numeric = stats["numeric"]
+    clip_cols = set(stats["clip_columns"])
+    out: Dict[str, Any] = {}
+    for col in chunk.columns:
+        if col in numeric:
+            s = numeric[col]
+            values = chunk[col].to_numpy(dtype=np.float64)
+            values = np.where(np.isnan(values), s["fill"], values)
+            if outliers is not None:
+                iqr = s["q75"] - s["q25"]
+                outliers[col] = outliers.get(col, 0) + int(np.count_nonzero(
+                    (values < s["q25"] - 1.5 * iqr) | (values > s["q75"] + 1.5 * iqr)))
+            # MinMaxScaler: constant columns are shifted but not scaled
+            span = s["max"] - s["min"]
+            span = span if span > 0 else 1.0
+            values = (values - s["min"]) / span
+            if col in clip_cols:
+                values = np.clip(values, (s["q01"] - s["min"]) / span, (s["q99"] - s["min"]) / span)
+            out[col] = values
+        elif col in CATEGORICAL_COLUMNS:
+            out[col] = pd.Categorical(chunk[col], categories=stats["categories"][col]).codes
+        elif col != 'attack_cat':
+            out[col] = chunk[col].to_numpy()
+    attack_classes = stats["categories"]['attack_cat']
+    codes = pd.Categorical(chunk['attack_cat'], categories=attack_classes).codes
+    out['attack_cat_label'] = codes
+    for i, name in enumerate(attack_classes):
+        out[f'attack_{name}'] = codes == i
+    return pd.DataFrame(out, index=chunk.index)
+
+
+def save_stats(stats: Dict[str, Any], path: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(stats, f, indent=1)
+    os.replace(tmp, path)
+
+
+def load_stats(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        stats = json.load(f)
+    if stats.get("format") != STATS_FORMAT:
+        raise ValueError(f"{path}: unsupported stats format {stats.get('format')}")
+    return stats
+
+
+def prepared_chunks(data_dir: str, cache_dir: str, chunksize: int,
+                    deduper: Optional[StreamingDeduper] = None,
+                    fill: Optional[Dict[str, Dict[str, Any]]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Raw chunks after prepare_chunk(), then gaps filled if `fill` is given,
+    then duplicates across all shards removed if `deduper` is given.
+    """
+    chunks = (prepare_chunk(c) for c in iter_chunks(data_dir, cache_dir, chunksize))
+    if fill is not None:
+        chunks = (fill_chunk(c, fill) for c in chunks)
+    return dedup_chunks(chunks, deduper) if deduper is not None else chunks
+
+
+def run(out_csv: str, stats_path: str, data_dir: str = DATA_DIR, cache_dir: str = CACHE_DIR,
+        chunksize: int = 200_000, reuse_stats: bool = False, sketch_k: int = 4096,
+        dedup: bool = True) -> Dict[str, Any]:
+    started = time.perf_counter()
+    if reuse_stats and os.path.exists(stats_path):
+        stats = load_stats(stats_path)
+        print(f"✔ Reusing fitted statistics from {stats_path}")
+    else:
+        fill, deduper = None, None
+        if dedup:
+            # Medians over every row, before dedup, as fillna(median()) did in memory
+            fill = fit_fill(prepared_chunks(data_dir, cache_dir, chunksize), sketch_k)
+            deduper = StreamingDeduper()
+        stats = fit_stats(prepared_chunks(data_dir, cache_dir, chunksize, deduper, fill), sketch_k, fill)
+        if deduper is not None:
+            stats["duplicates"] = deduper.report()
+        save_stats(stats, stats_path)
+        print(f"✔ Fitted statistics over {stats['rows']} rows in {time.perf_counter() - started:.2f}s -> {stats_path}")
+
+    started = time.perf_counter()
+    outliers: Dict[str, int] = {}
+    rows = 0
+    deduper = StreamingDeduper() if dedup else None
+    tmp = out_csv + ".tmp"
+    with open(tmp, "w", newline="") as f:
+        for i, chunk in enumerate(prepared_chunks(data_dir, cache_dir, chunksize, deduper,
+                                                  stats["numeric"])):
+            part = transform_chunk(chunk, stats, outliers)
+            part.to_csv(f, header=(i == 0), index=False)
+            rows += len(part)
+    os.replace(tmp, out_csv)
+    print(f"✔ Wrote {rows} rows to {out_csv} in {time.perf_counter() - started:.2f}s")
+    if deduper is not None:
+        print("Duplicate rows dropped per shard:",
+              {name: s["duplicates"] for name, s in deduper.report()["shards"].items()})
+    flagged = {k: v for k, v in outliers.items() if v > 0}
+    print("IQR outliers per column (before clipping):", flagged)
+    return {"rows": rows, "outliers": flagged, "stats": stats}
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chunked, bounded-memory preprocessing")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--out", default="UNSW_NB15_preprocessed.csv")
+    parser.add_argument("--stats", default="preprocess_stats.json", help="fitted statistics file")
+    parser.add_argument("--reuse-stats", action="store_true", help="skip pass 1 if --stats exists")
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--sketch-k", type=int, default=4096)
+    parser.add_argument("--keep-duplicates", action="store_true", help="skip streaming deduplication")
+    args = parser.parse_args(argv)
+    run(args.out, args.stats, args.data_dir, args.cache_dir, args.chunksize,
+        args.reuse_stats, args.sketch_k, not args.keep_duplicates)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
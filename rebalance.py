@@ -0,0 +1,318 @@
+"""
+Fast class rebalancing: SMOTE oversampling plus random undersampling.
+
+Produces the same class counts as the imblearn pipeline in
+withoutComments.py:
+
+    Pipeline([('smote', SMOTE(sampling_strategy=0.5)),
+              ('undersample', RandomUnderSampler(sampling_strategy=0.8))])
+
+It is faster at scale because:
+- Undersampling comes first. SMOTE never touches majority rows, so the
+  majority can be cut to its final size up front. Its rows are never
+  copied into an intermediate 2M+ row frame.
+- Neighbours are searched among minority rows only, with one of:
+  - "exact":       sklearn NearestNeighbors on all cores (n_jobs)
+  - "partitioned": exact search within each group (e.g. attack_cat_label),
+                   groups in parallel; synthetic rows stay inside their group
+  - "approximate": rows sorted along their first principal component and
+                   cut into buckets, exact search within each bucket in parallel
+- Synthetic rows are generated and yielded in batches (iter_resample), so
+  they can be streamed to disk without materialising the whole output.
+
+Wall-clock time of each phase and peak RSS are kept in `report`. RSS is
+sampled from a background thread rather than traced with tracemalloc,
+which slows the threaded neighbour search several times over.
+`validate()` compares class counts and downstream RandomForest metrics
+with the imblearn output on a held-out split.
+
+    python rebalance.py --csv UNSW_NB15_Cleaned.csv --out resampled.csv [--neighbors partitioned] [--validate]
+"""
+from typing import Any, Dict, Iterator, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import argparse, os, resource, sys, threading, time
+import numpy as np
+import pandas as pd
+
+NEIGHBOR_MODES = ("exact", "partitioned", "approximate")
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No procfs: fall back to the process-lifetime peak (KB on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryWatch:
+    """Peak resident set while the block runs, sampled every `interval` seconds."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.start_mb = self.peak_mb = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, _rss_bytes() / 1e6)
+
+    def __enter__(self) -> "MemoryWatch":
+        self.start_mb = self.peak_mb = _rss_bytes() / 1e6
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, _rss_bytes() / 1e6)
+
+    @property
+    def growth_mb(self) -> float:
+        return self.peak_mb - self.start_mb
+
+
+def _knn(X: np.ndarray, k: int, n_jobs: int) -> np.ndarray:
+    """Indices of the k nearest other rows of X (self excluded, as imblearn does)."""
+    from sklearn.neighbors import NearestNeighbors
+    if len(X) <= 1:
+        return np.zeros((len(X), k), dtype=np.intp)
+    k_eff = min(k, len(X) - 1)
+    nn = NearestNeighbors(n_neighbors=k_eff + 1, n_jobs=n_jobs).fit(X)
+    idx = nn.kneighbors(X, return_distance=False)[:, 1:]
+    if k_eff < k:
+        # Small partition: repeat neighbours so every row has k of them
+        idx = idx[:, np.arange(k) % k_eff]
+    return idx
+
+
+class Rebalancer:
+    def __init__(self, oversample_ratio: float = 0.5, undersample_ratio: float = 0.8,
+                 k_neighbors: int = 5, neighbors: str = "exact", bucket_size: int = 20_000,
+                 n_jobs: int = -1, batch_size: int = 100_000, random_state: Optional[int] = 42):
+        if neighbors not in NEIGHBOR_MODES:
+            raise ValueError(f"neighbors must be one of {NEIGHBOR_MODES}, got {neighbors!r}")
+        self.oversample_ratio = oversample_ratio
+        self.undersample_ratio = undersample_ratio
+        self.k_neighbors = k_neighbors
+        self.neighbors = neighbors
+        self.bucket_size = bucket_size
+        self.n_jobs = n_jobs
+        self.batch_size = batch_size
+        self.random_state = random_state
+        self.report: Dict[str, Any] = {}
+
+    @property
+    def _workers(self) -> int:
+        if self.n_jobs in (None, -1):
+            return os.cpu_count() or 1
+        return max(1, self.n_jobs)
+
+    def target_counts(self, n_minority: int, n_majority: int) -> Tuple[int, int]:
+        """(minority, majority) counts after SMOTE then undersampling, as imblearn computes them."""
+        minority = max(n_minority, int(self.oversample_ratio * n_majority))
+        majority = min(n_majority, int(minority / self.undersample_ratio))
+        return minority, majority
+
+    # ---- neighbour search ----
+
+    def _neighbors(self, X: np.ndarray, groups: Optional[np.ndarray]) -> np.ndarray:
+        k = self.k_neighbors
+        if self.neighbors == "exact":
+            return _knn(X, k, self.n_jobs)
+        if self.neighbors == "partitioned":
+            if groups is None:
+                raise ValueError("neighbors='partitioned' needs groups")
+            parts = [np.flatnonzero(groups == g) for g in np.unique(groups)]
+        else:
+            # Order rows along the direction of largest variance, then bucket
+            centered = X - X.mean(axis=0)
+            _, _, vt = np.linalg.svd(centered[:: max(1, len(X) // 50_000)], full_matrices=False)
+            order = np.argsort(centered @ vt[0], kind="stable")
+            n_buckets = max(1, int(np.ceil(len(X) / self.bucket_size)))
+            parts = np.array_split(order, n_buckets)
+
+        out = np.empty((len(X), k), dtype=np.intp)
+
+        def search(rows: np.ndarray):
+            out[rows] = rows[_knn(X[rows], k, 1)]
+
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            list(pool.map(search, parts))
+        return out
+
+    # ---- resampling ----
+
+    def iter_resample(self, X, y, groups=None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Yield (X_block, y_block): kept majority rows, all minority rows, then
+        synthetic minority rows in blocks of `batch_size`.
+        """
+        rng = np.random.default_rng(self.random_state)
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        classes, counts = np.unique(y, return_counts=True)
+        if len(classes) != 2:
+            raise ValueError(f"float sampling ratios need exactly 2 classes, got {len(classes)}")
+        minority_label, majority_label = classes[np.argsort(counts, kind="stable")]
+        min_idx = np.flatnonzero(y == minority_label)
+        maj_idx = np.flatnonzero(y == majority_label)
+        n_min_target, n_maj_target = self.target_counts(len(min_idx), len(maj_idx))
+        self.report = {"input": {str(minority_label): len(min_idx), str(majority_label): len(maj_idx)},
+                       "neighbors": self.neighbors, "phases": {}}
+
+        # Phase clocks stop while a block is with the consumer
+        phases = self.report["phases"]
+        clock = time.perf_counter()
+
+        def lap(name: str):
+            nonlocal clock
+            now = time.perf_counter()
+            phases[name] = phases.get(name, 0.0) + now - clock
+            clock = now
+
+        keep = np.sort(rng.choice(maj_idx, size=n_maj_target, replace=False))
+        block = X[keep], y[keep]
+        lap("undersample")
+        yield block
+        clock = time.perf_counter()
+        yield X[min_idx], y[min_idx]
+        clock = time.perf_counter()
+
+        n_synthetic = n_min_target - len(min_idx)
+        if n_synthetic > 0 and len(min_idx):
+            X_min = X[min_idx]
+            nn = self._neighbors(X_min, None if groups is None else np.asarray(groups)[min_idx])
+            lap("neighbors")
+
+            # Same sampling scheme as imblearn's SMOTE: random (row, neighbour) pairs
+            picks = rng.integers(0, len(X_min) * self.k_neighbors, size=n_synthetic)
+            for start in range(0, n_synthetic, self.batch_size):
+                part = picks[start:start + self.batch_size]
+                rows, cols = np.divmod(part, self.k_neighbors)
+                base = X_min[rows]
+                steps = rng.uniform(size=(len(part), 1))
+                block = base + steps * (X_min[nn[rows, cols]] - base), np.full(len(part), minority_label)
+                lap("generate")
+                yield block
+                clock = time.perf_counter()
+
+        self.report["output"] = {str(minority_label): n_min_target, str(majority_label): n_maj_target}
+
+    def fit_resample(self, X, y, groups=None):
+        """imblearn-style API: returns (X_resampled, y_resampled), DataFrame/Series in, out."""
+        started = time.perf_counter()
+        with MemoryWatch() as memory:
+            blocks = list(self.iter_resample(X, y, groups))
+            X_res = np.concatenate([b[0] for b in blocks])
+            y_res = np.concatenate([b[1] for b in blocks])
+            del blocks
+        self.report["seconds"] = time.perf_counter() - started
+        self.report["peak_rss_mb"] = memory.peak_mb
+        self.report["rss_growth_mb"] = memory.growth_mb
+        if isinstance(X, pd.DataFrame):
+            X_res = pd.DataFrame(X_res, columns=X.columns)
+        if isinstance(y, pd.Series):
+            y_res = pd.Series(y_res, name=y.name)
+        return X_res, y_res
+
+
+def imblearn_resample(X, y, oversample_ratio: float = 0.5, undersample_ratio: float = 0.8,
+                      random_state: Optional[int] = 42):
+    """The original imblearn pipeline, for validation."""
+    from imblearn.over_sampling import SMOTE
+    from imblearn.under_sampling import RandomUnderSampler
+    from imblearn.pipeline import Pipeline
+    pipeline = Pipeline([('smote', SMOTE(sampling_strategy=oversample_ratio, random_state=random_state)),
+                         ('undersample', RandomUnderSampler(sampling_strategy=undersample_ratio,
+                                                            random_state=random_state))])
+    return pipeline.fit_resample(X, y)
+
+
+def validate(X: pd.DataFrame, y: pd.Series, rebalancer: Rebalancer, groups=None,
+             test_size: float = 0.2, n_estimators: int = 50, random_state: int = 42) -> Dict[str, Any]:
+    """
+    Resample a training split with imblearn and with `rebalancer`, fit the
+    same RandomForest on each, and score both on the untouched test split.
+    """
+    from collections import Counter
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score, f1_score, recall_score, roc_auc_score
+    from sklearn.model_selection import train_test_split
+
+    X_tr, X_te, y_tr, y_te, g_tr, _ = train_test_split(
+        X, y, groups if groups is not None else np.zeros(len(y)),
+        test_size=test_size, stratify=y, random_state=random_state)
+    results: Dict[str, Any] = {}
+    runs = {
+        "imblearn": lambda: imblearn_resample(X_tr, y_tr, rebalancer.oversample_ratio,
+                                              rebalancer.undersample_ratio, random_state),
+        "rebalance": lambda: rebalancer.fit_resample(X_tr, y_tr, g_tr if groups is not None else None),
+    }
+    for name, run in runs.items():
+        started = time.perf_counter()
+        with MemoryWatch() as memory:
+            X_res, y_res = run()
+        seconds = time.perf_counter() - started
+        rf = RandomForestClassifier(n_estimators=n_estimators, n_jobs=-1, random_state=random_state)
+        rf.fit(X_res, y_res)
+        prob = rf.predict_proba(X_te)[:, 1]
+        pred = (prob >= 0.5).astype(int)
+        results[name] = {
+            "seconds": seconds,
+            "rss_growth_mb": memory.growth_mb,
+            "class_counts": {str(k): int(v) for k, v in Counter(np.asarray(y_res)).items()},
+            "accuracy": float(accuracy_score(y_te, pred)),
+            "f1": float(f1_score(y_te, pred)),
+            "recall": float(recall_score(y_te, pred)),
+            "roc_auc": float(roc_auc_score(y_te, prob)),
+        }
+    results["class_counts_match"] = results["imblearn"]["class_counts"] == results["rebalance"]["class_counts"]
+    return results
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="SMOTE + undersampling, fast")
+    parser.add_argument("--csv", required=True, help="cleaned, numeric training data")
+    parser.add_argument("--label", default="label")
+    parser.add_argument("--out", help="stream resampled rows to this CSV")
+    parser.add_argument("--neighbors", choices=NEIGHBOR_MODES, default="exact")
+    parser.add_argument("--group-column", default="attack_cat_label", help="partitions for --neighbors partitioned")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--bucket-size", type=int, default=20_000)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--validate", action="store_true", help="compare with imblearn on a held-out split")
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(args.csv)
+    X, y = df.drop(columns=[args.label]), df[args.label]
+    groups = df[args.group_column].to_numpy() if args.neighbors == "partitioned" else None
+    rebalancer = Rebalancer(k_neighbors=args.k, neighbors=args.neighbors, bucket_size=args.bucket_size,
+                            n_jobs=args.n_jobs, random_state=args.seed)
+
+    if args.validate:
+        import json
+        print(json.dumps(validate(X, y, rebalancer, groups, random_state=args.seed), indent=2))
+        return 0
+
+    started = time.perf_counter()
+    rows = 0
+    if args.out:
+        with open(args.out, "w", newline="") as f:
+            for i, (xb, yb) in enumerate(rebalancer.iter_resample(X, y, groups)):
+                block = pd.DataFrame(xb, columns=X.columns)
+                block[args.label] = yb
+                block.to_csv(f, header=(i == 0), index=False)
+                rows += len(block)
+    else:
+        _, y_res = rebalancer.fit_resample(X, y, groups)
+        rows = len(y_res)
+    print(f"✔ {rows} rows in {time.perf_counter() - started:.2f}s", rebalancer.report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
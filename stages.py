@@ -0,0 +1,169 @@
+"""
+Minimal stage runner with content-hash memoization.
+
+A pipeline is a list of named Stage objects. A stage's function receives
+the outputs of its `inputs` (by position) and its `params` (by keyword).
+Its cache key is a SHA-256 over:
+- the stage function's source
+- the source of any extra modules it lists in `modules`
+- its params
+- an optional `fingerprint()` of external inputs (e.g. source CSV sizes/mtimes)
+- the keys of its input stages
+
+An input stage's key already covers everything that produced its output,
+so a stage is invalidated exactly when something upstream of it changed.
+Keys are computed without running anything. Outputs are pickled under
+`cache_dir` and only loaded when a stage that has to run, or the
+requested target, needs them.
+
+    runner = PipelineRunner(stages, cache_dir)
+    outputs = runner.run()          # every leaf stage; or run(until="correlation")
+    print(runner.summary())
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+import hashlib, inspect, json, os, pickle, sys, time
+
+
+class Stage:
+    def __init__(self, name: str, fn: Callable, inputs: Sequence[str] = (),
+                 params: Optional[Dict[str, Any]] = None, modules: Sequence[str] = (),
+                 fingerprint: Optional[Callable[[], Any]] = None, cache: bool = True):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.params = dict(params or {})
+        self.modules = list(modules)
+        self.fingerprint = fingerprint
+        # Stages that are cheap, or only write artifacts, can opt out of the cache
+        self.cache = cache
+
+
+def _source_hash(obj) -> str:
+    try:
+        source = inspect.getsource(obj)
+    except (OSError, TypeError):
+        source = repr(obj)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class PipelineRunner:
+    def __init__(self, stages: Iterable[Stage], cache_dir: str, force: Iterable[str] = ()):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            missing = [i for i in stage.inputs if i not in self.stages]
+            if missing:
+                raise ValueError(f"stage {stage.name!r} needs {missing}, which must come before it")
+            self.stages[stage.name] = stage
+        self.cache_dir = cache_dir
+        self.force = set(self.stages) if "all" in set(force) else set(force)
+        unknown = self.force - set(self.stages)
+        if unknown:
+            raise ValueError(f"unknown stages: {sorted(unknown)}")
+        # A forced stage's dependents must re-run too, or its new output would go unused
+        for stage in self.stages.values():
+            if any(i in self.force for i in stage.inputs):
+                self.force.add(stage.name)
+        self.keys: Dict[str, str] = {}
+        self.report: List[Dict[str, Any]] = []
+        self._outputs: Dict[str, Any] = {}
+
+    # ---- keys and storage ----
+
+    def key(self, name: str) -> str:
+        if name not in self.keys:
+            stage = self.stages[name]
+            payload = {
+                "stage": name,
+                "code": _source_hash(stage.fn),
+                "modules": {m: _source_hash(sys.modules.get(m) or __import__(m)) for m in stage.modules},
+                "params": stage.params,
+                "fingerprint": stage.fingerprint() if stage.fingerprint else None,
+                "inputs": [self.key(i) for i in stage.inputs],
+            }
+            blob = json.dumps(payload, sort_keys=True, default=str).encode()
+            self.keys[name] = hashlib.sha256(blob).hexdigest()
+        return self.keys[name]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}-{self.key(name)[:16]}.pkl")
+
+    def cached(self, name: str) -> bool:
+        stage = self.stages[name]
+        return stage.cache and name not in self.force and os.path.exists(self._path(name))
+
+    def _store(self, name: str, value: Any):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(name)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def prune(self) -> List[str]:
+        """Delete cache entries that no current stage key refers to."""
+        live = {os.path.basename(self._path(n)) for n in self.stages}
+        removed = []
+        if os.path.isdir(self.cache_dir):
+            for entry in os.listdir(self.cache_dir):
+                if entry.endswith(".pkl") and entry not in live:
+                    os.remove(os.path.join(self.cache_dir, entry))
+                    removed.append(entry)
+        return removed
+
+    # ---- execution ----
+
+    def _get(self, name: str) -> Any:
+        if name in self._outputs:
+            return self._outputs[name]
+        stage = self.stages[name]
+        started = time.perf_counter()
+        if self.cached(name):
+            with open(self._path(name), "rb") as f:
+                value = pickle.load(f)
+            status = "hit"
+            seconds = time.perf_counter() - started
+        else:
+            args = [self._get(i) for i in stage.inputs]
+            # Time the stage itself, not the upstream work done for its inputs
+            started = time.perf_counter()
+            print(f"▶ {name}")
+            value = stage.fn(*args, **stage.params)
+            seconds = time.perf_counter() - started
+            status = "forced" if name in self.force else ("run" if stage.cache else "uncached")
+            if stage.cache:
+                self._store(name, value)
+        self.report.append({"stage": name, "status": status, "seconds": seconds,
+                            "key": self.key(name)[:12]})
+        self._outputs[name] = value
+        return value
+
+    def run(self, until: Optional[str] = None, targets: Sequence[str] = ()) -> Dict[str, Any]:
+        """
+        Produce `targets` (default: `until`, or every stage nothing else
+        depends on). Stages are run only when their key has no cache
+        entry; upstream outputs are loaded only if something downstream
+        needs them.
+        """
+        if until is not None and until not in self.stages:
+            raise ValueError(f"unknown stage {until!r}")
+        if targets:
+            names = list(targets)
+        elif until:
+            names = [until]
+        else:
+            used = {i for stage in self.stages.values() for i in stage.inputs}
+            names = [n for n in self.stages if n not in used]
+        for name in names:
+            self._get(name)
+        return dict(self._outputs)
+
+    def summary(self) -> str:
+        lines = [f"{'stage':<14} {'status':<9} {'seconds':>9}  key"]
+        for r in self.report:
+            lines.append(f"{r['stage']:<14} {r['status']:<9} {r['seconds']:>9.2f}  {r['key']}")
+        hits = sum(r["status"] == "hit" for r in self.report)
+        ran = sum(r["status"] != "hit" for r in self.report)
+        skipped = len(self.stages) - len(self.report)
+        total = sum(r["seconds"] for r in self.report)
+        lines.append(f"{hits} cache hits, {ran} run, {skipped} not needed; {total:.2f}s in stages")
+        return "\n".join(lines)
@@ -0,0 +1,242 @@
+"""
+withoutComments.py as a pipeline of named, memoized stages (see stages.py).
+
+    ingest -> clean -> encode -> scale -> clip -> codes -+-> resample -> importance -+-> select -> export
+                                                         +-> correlation ------------+      +-> summary -> report
+
+Each stage caches its output under `.cache/pipeline`, keyed by its code,
+its parameters and everything upstream of it. So changing a late step
+only re-runs that step and what depends on it. For example, changing the
+importance cutoff re-runs only select and export. Ingest keys on
+ingest.py's source and the source CSVs' sizes and mtimes. It is not pickled itself, since
+ingest.load_dataset keeps its own column cache.
+
+    python train_pipeline.py [--until STAGE] [--force STAGE[,STAGE]|all]
+                             [--importance-cutoff 0.001] [--corr-threshold 0.9]
+                             [--importance-sample 0.25] [--early-stop]
+                             [--out UNSW_NB15_Cleaned.csv] [--report-dir eda_report] [--prune]
+"""
+from typing import Any, Dict, List, Optional
+import argparse, glob, os, sys, time
+import numpy as np
+import pandas as pd
+
+from eda_report import REPORT_DIR
+from ingest import DATA_DIR, FEATURES_FILE, SHARD_PATTERN, _fingerprint
+from preprocess import CATEGORICAL_COLUMNS, OUTLIER_COLS
+from stages import PipelineRunner, Stage
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PIPELINE_CACHE = os.environ.get("UNSW_PIPELINE_CACHE", os.path.join(ROOT, ".cache", "pipeline"))
+
+
+def source_fingerprint(data_dir: str):
+    paths = [os.path.join(data_dir, FEATURES_FILE)] + sorted(glob.glob(os.path.join(data_dir, SHARD_PATTERN)))
+    return _fingerprint([p for p in paths if os.path.exists(p)])
+
+
+# ---- stages ----
+
+def ingest_stage(data_dir: str) -> pd.DataFrame:
+    from ingest import load_dataset
+    df, _ = load_dataset(data_dir)
+    return df
+
+
+def clean_stage(df: pd.DataFrame) -> pd.DataFrame:
+    """Drops, attack_cat/label, median fill, duplicate removal, integer ports."""
+    from preprocess import prepare_chunk
+    from dedup import duplicate_mask
+    df = prepare_chunk(df)
+    num_cols = df.select_dtypes(include=[np.number]).columns.drop('label')
+    df[num_cols] = df[num_cols].fillna(df[num_cols].median())
+    is_duplicate = duplicate_mask(df)
+    print("Total Duplicate Rows:", int(is_duplicate.sum()))
+    df = df[~is_duplicate].reset_index(drop=True)
+    df['sport'] = df['sport'].astype('int64')
+    df['dsport'] = df['dsport'].astype('int64')
+    print("Label Distribution:", df['label'].value_counts(normalize=True).mul(100).round(2).to_dict())
+    return df
+
+
+def encode_stage(df: pd.DataFrame) -> Dict[str, Any]:
+    from sklearn.preprocessing import LabelEncoder
+    label_encoder = LabelEncoder()
+    df = df.copy()
+    df['attack_cat_label'] = label_encoder.fit_transform(df['attack_cat'])
+    label_mapping = dict(zip(label_encoder.classes_, label_encoder.transform(label_encoder.classes_).tolist()))
+    print(label_mapping)
+    df = pd.get_dummies(df, columns=['attack_cat'], prefix='attack')
+    return {"df": df, "label_mapping": label_mapping}
+
+
+def scale_stage(encoded: Dict[str, Any]) -> pd.DataFrame:
+    from sklearn.preprocessing import MinMaxScaler
+    df = encoded["df"].copy()
+    num_cols = df.select_dtypes(include=[np.number]).columns.drop(['label', 'attack_cat_label'])
+    df[num_cols] = MinMaxScaler().fit_transform(df[num_cols])
+    return df
+
+
+def clip_stage(df: pd.DataFrame, columns: List[str], lower: float, upper: float) -> pd.DataFrame:
+    df = df.copy()
+    cols = [c for c in columns if c in df.columns]
+    q_lo = df[cols].quantile(lower)
+    q_hi = df[cols].quantile(upper)
+    df[cols] = df[cols].clip(lower=q_lo, upper=q_hi, axis=1)
+    return df
+
+
+def codes_stage(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    from sklearn.preprocessing import LabelEncoder
+    df = df.copy()
+    for col in columns:
+        df[col] = LabelEncoder().fit_transform(df[col])
+    return df
+
+
+def resample_stage(df: pd.DataFrame, oversample_ratio: float, undersample_ratio: float,
+                   neighbors: str, seed: int) -> Dict[str, Any]:
+    from collections import Counter
+    from rebalance import Rebalancer
+    X = df.drop(columns=['label'])
+    y = df['label']
+    rebalancer = Rebalancer(oversample_ratio=oversample_ratio, undersample_ratio=undersample_ratio,
+                            neighbors=neighbors, random_state=seed)
+    groups = df['attack_cat_label'].to_numpy() if neighbors == "partitioned" else None
+    X_resampled, y_resampled = rebalancer.fit_resample(X, y, groups)
+    print("Original Class Distribution:", Counter(y))
+    print("New Class Distribution:", Counter(y_resampled))
+    return {"X": X_resampled, "y": y_resampled, "report": rebalancer.report}
+
+
+def correlation_stage(df: pd.DataFrame, threshold: float) -> Dict[str, Any]:
+    from correlation import correlated_features, correlation_matrix
+    corr = correlation_matrix(df)
+    to_drop = correlated_features(corr, threshold)
+    print("Highly Correlated Features to Drop:", to_drop)
+    return {"corr": corr, "drop": to_drop, "threshold": threshold, "df": df.drop(columns=to_drop)}
+
+
+def importance_stage(resampled: Dict[str, Any], n_estimators: int, sample: float,
+                     early_stop: bool, seed: int) -> pd.Series:
+    from importance import feature_importance
+    importances, report = feature_importance(resampled["X"], resampled["y"], sample, n_estimators,
+                                             early_stop, seed=seed)
+    print(importances.head(20))
+    print(f"Importance: {report['trees']} trees on {report['rows']} of {report['of_rows']} rows "
+          f"in {report['seconds']:.2f}s")
+    return importances
+
+
+def select_stage(correlated: Dict[str, Any], importances: pd.Series, cutoff: float) -> pd.DataFrame:
+    df = correlated["df"]
+    low = [f for f in importances[importances < cutoff].index if f in df.columns]
+    print(f"Successfully dropped features: {low}")
+    return df.drop(columns=low)
+
+
+def export_stage(df: pd.DataFrame, correlated: Dict[str, Any], out_csv: str) -> str:
+    from correlation import save_drop_list
+    save_drop_list(correlated["corr"], correlated["drop"], correlated["threshold"])
+    df.to_csv(out_csv, index=False)
+    print(f"Dataset saved as {out_csv} ({df.shape[0]} rows, {df.shape[1]} columns)")
+    return out_csv
+
+
+def summary_stage(df: pd.DataFrame, resampled: Dict[str, Any]) -> Dict[str, Any]:
+    from eda_report import summarize
+    names = {"0": "Normal", "1": "Attack"}
+    report = resampled["report"]
+    classes = {"Original Class Distribution": {names.get(k, k): v for k, v in report["input"].items()},
+               "Resampled Class Distribution (SMOTE & Undersampling)":
+                   {names.get(k, k): v for k, v in report["output"].items()}}
+    return summarize(df, classes=classes)
+
+
+def report_stage(summary: Dict[str, Any], out_dir: str) -> Dict[str, str]:
+    from eda_report import render, save_summary
+    save_summary(summary, out_dir)
+    paths = render(summary, out_dir)
+    print(f"EDA report: {paths['html']}")
+    return paths
+
+
+def build_stages(data_dir: str = DATA_DIR, out_csv: str = "UNSW_NB15_Cleaned.csv",
+                 corr_threshold: float = 0.9, importance_cutoff: float = 0.001,
+                 oversample_ratio: float = 0.5, undersample_ratio: float = 0.8,
+                 neighbors: str = "exact", n_estimators: int = 100, importance_sample: float = 1.0,
+                 early_stop: bool = False, report_dir: str = REPORT_DIR, seed: int = 42) -> List[Stage]:
+    # Column lists are params, not module globals, so editing them re-keys the stage
+    return [
+        Stage("ingest", ingest_stage, params={"data_dir": data_dir}, modules=["ingest"],
+              fingerprint=lambda: source_fingerprint(data_dir), cache=False),
+        Stage("clean", clean_stage, ["ingest"], modules=["preprocess", "dedup"]),
+        Stage("encode", encode_stage, ["clean"]),
+        Stage("scale", scale_stage, ["encode"]),
+        Stage("clip", clip_stage, ["scale"], {"columns": OUTLIER_COLS, "lower": 0.01, "upper": 0.99}),
+        Stage("codes", codes_stage, ["clip"], {"columns": CATEGORICAL_COLUMNS}),
+        Stage("resample", resample_stage, ["codes"],
+              {"oversample_ratio": oversample_ratio, "undersample_ratio": undersample_ratio,
+               "neighbors": neighbors, "seed": seed}, modules=["rebalance"]),
+        Stage("correlation", correlation_stage, ["codes"], {"threshold": corr_threshold},
+              modules=["correlation"]),
+        Stage("importance", importance_stage, ["resample"],
+              {"n_estimators": n_estimators, "sample": importance_sample, "early_stop": early_stop,
+               "seed": seed}, modules=["importance"]),
+        Stage("select", select_stage, ["correlation", "importance"], {"cutoff": importance_cutoff}),
+        Stage("export", export_stage, ["select", "correlation"], {"out_csv": out_csv}, cache=False),
+        Stage("summary", summary_stage, ["select", "resample"], modules=["eda_report"]),
+        Stage("report", report_stage, ["summary"], {"out_dir": report_dir}, modules=["eda_report"],
+              cache=False),
+    ]
+
+
+def run_pipeline(until: Optional[str] = None, force=(), cache_dir: str = PIPELINE_CACHE,
+                 targets=(), **options) -> Dict[str, Any]:
+    runner = PipelineRunner(build_stages(**options), cache_dir, force)
+    outputs = runner.run(until, targets)
+    print(runner.summary())
+    return outputs
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Memoized UNSW-NB15 training-data pipeline")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=PIPELINE_CACHE)
+    parser.add_argument("--until", help="stop after this stage")
+    parser.add_argument("--force", default="", help="comma-separated stages to re-run, or 'all'")
+    parser.add_argument("--out", default="UNSW_NB15_Cleaned.csv")
+    parser.add_argument("--corr-threshold", type=float, default=0.9)
+    parser.add_argument("--importance-cutoff", type=float, default=0.001)
+    parser.add_argument("--neighbors", default="exact", help="rebalance neighbour search mode")
+    parser.add_argument("--n-estimators", type=int, default=100, help="importance forest size (cap with early stop)")
+    # Full data and the full forest by default, so the selected features match
+    # withoutComments.py; sampling and early stopping are opt-in speedups whose
+    # selection should be checked with `importance.py --validate` first
+    parser.add_argument("--importance-sample", type=float, default=1.0,
+                        help="stratified fraction of resampled rows for importance (1 = all)")
+    parser.add_argument("--early-stop", action="store_true",
+                        help="stop growing the importance forest once the ranking settles")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--report-dir", default=REPORT_DIR, help="EDA summary and report output")
+    parser.add_argument("--prune", action="store_true", help="delete cache entries for stale keys")
+    args = parser.parse_args(argv)
+
+    stages = build_stages(args.data_dir, args.out, args.corr_threshold, args.importance_cutoff,
+                          neighbors=args.neighbors, n_estimators=args.n_estimators,
+                          importance_sample=args.importance_sample, early_stop=args.early_stop,
+                          report_dir=args.report_dir, seed=args.seed)
+    runner = PipelineRunner(stages, args.cache_dir, [s for s in args.force.split(",") if s])
+    started = time.perf_counter()
+    runner.run(args.until)
+    print(runner.summary())
+    print(f"✔ Pipeline finished in {time.perf_counter() - started:.2f}s")
+    if args.prune:
+        removed = runner.prune()
+        print(f"✔ Pruned {len(removed)} stale cache entries")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())